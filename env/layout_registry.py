@@ -0,0 +1,48 @@
+from typing import Dict, Tuple
+
+from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
+from overcooked_ai_py.planning.planners import (
+    NO_COUNTERS_PARAMS,
+    MediumLevelActionManager,
+)
+
+# (layout_name, old_dynamics, mlam_params) -> (mdp, mlam), one per process
+_LAYOUT_REGISTRY: Dict[tuple, Tuple[OvercookedGridworld, MediumLevelActionManager]] = {}
+
+
+def get_layout_artifacts(
+    layout_name: str,
+    old_dynamics: bool = True,
+    mlam_params: dict = NO_COUNTERS_PARAMS,
+):
+    """
+    Return the MDP and medium-level action manager of a layout.
+
+    Both are built once per process and per (layout, dynamics, params), and
+    the same objects are then handed to every caller: the student env uses
+    the mlam for featurization and the teachers use it for planning. They
+    must therefore be treated as read-only.
+
+    Returns
+    -------
+    mdp : OvercookedGridworld
+    mlam : MediumLevelActionManager
+        Action manager bound to `mdp`, loaded from the on-disk planner
+        cache when possible.
+    """
+    key = (layout_name, old_dynamics, repr(sorted(mlam_params.items())))
+    if key not in _LAYOUT_REGISTRY:
+        mdp = OvercookedGridworld.from_layout_name(
+            layout_name,
+            old_dynamics=old_dynamics,
+        )
+        mlam = MediumLevelActionManager.from_pickle_or_compute(
+            mdp, mlam_params, force_compute=False
+        )
+        _LAYOUT_REGISTRY[key] = (mdp, mlam)
+    return _LAYOUT_REGISTRY[key]
+
+
+def clear_layout_registry():
+    """Drop all registered layouts (e.g. after layout files were rewritten)."""
+    _LAYOUT_REGISTRY.clear()
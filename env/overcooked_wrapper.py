@@ -1,10 +1,10 @@
 import gymnasium as gym
 import numpy as np
 
-from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
 from overcooked_ai_py.mdp.overcooked_env import OvercookedEnv
 from overcooked_ai_py.mdp.actions import Action
 
+from env.layout_registry import get_layout_artifacts
 from teacher.teacher_pair import make_teacher_env_and_pair
 
 
@@ -22,29 +22,14 @@ class OvercookedGym(gym.Env):
         super().__init__()
         assert agent_index in [0, 1], "agent_index must be 0 or 1"
         self.agent_index = agent_index
+        self.horizon = horizon
 
-        # ========================
-        # Base Overcooked Env
-        # ========================
-        self.mdp = OvercookedGridworld.from_layout_name(
-            layout_name,
-            old_dynamics=True,
-        )
-        self.env = OvercookedEnv.from_mdp(self.mdp, horizon=horizon)
-        self.env.reset()
-
-        # ========================
-        # Teacher partner (GreedyHumanModel)
-        # ========================
-        _, teacher_pair = make_teacher_env_and_pair(layout_name, horizon)
-        self.teacher0 = teacher_pair.agents[0]
-        self.teacher1 = teacher_pair.agents[1]
+        self.set_layout(layout_name)
 
         # ========================
         # Observation space
         # ========================
-        obs_p0, obs_p1 = self.env.featurize_state_mdp(self.env.state)
-        my_obs = obs_p0 if self.agent_index == 0 else obs_p1
+        my_obs = self._featurize(self.env.state)
 
         self.observation_space = gym.spaces.Box(
             low=-np.inf,
@@ -60,14 +45,53 @@ class OvercookedGym(gym.Env):
 
     # ----------------------------------------------------
 
+    def set_layout(self, layout_name: str):
+        """
+        (Re)target this env to a layout. Called at construction, and by
+        long-lived vectorized workers to switch layout without being rebuilt.
+        The observation and action spaces do not depend on the layout.
+        """
+        self.layout_name = layout_name
+
+        # ========================
+        # Base Overcooked Env
+        # ========================
+        # The MDP and its mlam (used for featurization) are shared with the
+        # teachers and with every other env of this layout in the process
+        self.mdp, self.mlam = get_layout_artifacts(layout_name, old_dynamics=True)
+        self.env = OvercookedEnv.from_mdp(self.mdp, horizon=self.horizon, mlam=self.mlam)
+        self.env.reset()
+
+        # ========================
+        # Teacher partner (GreedyHumanModel)
+        # ========================
+        _, teacher_pair = make_teacher_env_and_pair(layout_name, self.horizon)
+        self.teacher0 = teacher_pair.agents[0]
+        self.teacher1 = teacher_pair.agents[1]
+
+    # ----------------------------------------------------
+
+    def _featurize(self, state):
+        """Float32 features of `state` from the point of view of the student."""
+        # Same values as env.featurize_state_mdp, via the table-based batch path
+        return self.mdp.featurize_states([state], self.mlam)[0, self.agent_index]
+
+    # ----------------------------------------------------
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
         self.env.reset()
 
-        obs_p0, obs_p1 = self.env.featurize_state_mdp(self.env.state)
-        my_obs = obs_p0 if self.agent_index == 0 else obs_p1
+        return self._featurize(self.env.state), {}
 
-        return my_obs.astype(np.float32), {}
+    # ----------------------------------------------------
+
+    def start_episode(self, layout_name: str):
+        """Retarget to layout_name if needed, then reset; returns the first obs."""
+        if layout_name != self.layout_name:
+            self.set_layout(layout_name)
+        obs, _ = self.reset()
+        return obs
 
     # ----------------------------------------------------
 
@@ -93,9 +117,5 @@ class OvercookedGym(gym.Env):
         # Step env
         next_state, reward, done, info = self.env.step(joint_action)
 
-        # Featurize
-        obs_p0, obs_p1 = self.env.featurize_state_mdp(next_state)
-        my_obs = obs_p0 if self.agent_index == 0 else obs_p1
-
         # Gymnasium API: (obs, reward, terminated, truncated, info)
-        return my_obs.astype(np.float32), reward, done, False, info
+        return self._featurize(next_state), reward, done, False, info
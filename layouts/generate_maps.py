@@ -1,87 +1,30 @@
 import os
 import json
 import random
-from PIL import Image
 
 # For validation
 from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
+from overcooked_ai_py.visualization.layout_thumbnails import render_layout_thumbnail
 
 
 # ====================== CONFIG ======================
-BASE_GRAPHICS = os.path.join(os.path.dirname(__file__), "..", "graphics")
 OUTPUT_TXT    = os.path.join(os.path.dirname(__file__), "test_custom_layouts")
 OUTPUT_PNG    = os.path.join(os.path.dirname(__file__), "test_custom_layouts_png")
 MAP_COUNT     = 200
 TILE_SIZE     = 40
 
 
-# Mapping Overcooked chars → sprite names
-TILE_SPRITES = {
-    "X": "counter.png",
-    " ": "floor.png",
-    "O": "onions.png",
-    # "T": "tomatoes.png",
-    "P": "pot.png",
-    "D": "dishes.png",
-    "S": "serve.png",
-}
-
-
-# ================================================================
-# 1) SPRITESHEET LOADER
-# ================================================================
-def load_any_spritesheet(json_path, base_folder):
-    with open(json_path, "r") as f:
-        data = json.load(f)
-
-    sprites = {}
-
-    # TexturePacker format A
-    if "frames" in data and isinstance(data["frames"], dict):
-        sheet = Image.open(json_path.replace(".json", ".png")).convert("RGBA")
-        for name, info in data["frames"].items():
-            f = info["frame"]
-            x, y, w, h = f["x"], f["y"], f["w"], f["h"]
-            sprites[name] = sheet.crop((x, y, x + w, y + h))
-        return sprites
-
-    # TexturePacker format B
-    if "textures" in data:
-        for tex in data["textures"]:
-            sheet = Image.open(os.path.join(base_folder, tex["image"])).convert("RGBA")
-            for frame_info in tex["frames"]:
-                f = frame_info["frame"]
-                x, y, w, h = f["x"], f["y"], f["w"], f["h"]
-                sprites[frame_info["filename"]] = sheet.crop((x, y, x + w, y + h))
-        return sprites
-
-    raise ValueError("Unsupported spritesheet format")
-
-
 # ================================================================
-# 2) PNG RENDERER
+# 1) PNG RENDERER
 # ================================================================
-def render_png_from_grid(grid, sprites, out_path):
-    H, W = len(grid), len(grid[0])
-    canvas = Image.new("RGBA", (W*TILE_SIZE, H*TILE_SIZE))
-
-    for y in range(H):
-        for x in range(W):
-            char = grid[y][x]
-            sprite_name = TILE_SPRITES.get(char)
-
-            if sprite_name not in sprites:
-                tile = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (255,0,0,255))
-            else:
-                tile = sprites[sprite_name].resize((TILE_SIZE, TILE_SIZE), Image.NEAREST)
-
-            canvas.paste(tile, (x*TILE_SIZE, y*TILE_SIZE))
-
-    canvas.save(out_path)
+def render_png_from_grid(grid, out_path):
+    # Terrain sprites of overcooked_ai_py, resized once per tile size and
+    # reused for every map; players are drawn as floor
+    render_layout_thumbnail(grid, out_path, TILE_SIZE)
 
 
 # ================================================================
-# 3) VALIDATION WITH OVERCOOKED-AI
+# 2) VALIDATION WITH OVERCOOKED-AI
 # ================================================================
 def validate_with_overcooked(grid):
     """
@@ -119,7 +62,7 @@ def validate_with_overcooked(grid):
 
 
 # ================================================================
-# 4) GENERATOR FOR ORIGINAL SMALL MAPS
+# 3) GENERATOR FOR ORIGINAL SMALL MAPS
 # ================================================================
 TEMPLATE_SIZES = [
     (4, 5),  # cramped_room 4 rows, width 5
@@ -249,19 +192,9 @@ def save_map_pretty(config: dict, path: str):
 
 
 # ================================================================
-# 5) MAIN
+# 4) MAIN
 # ================================================================
 def main():
-    print("=== LOADING SPRITES ===")
-    sprites = {}
-
-    for fname in ["objects.json", "terrain.json", "soups.json"]:
-        try:
-            sprites.update(load_any_spritesheet(os.path.join(BASE_GRAPHICS, fname), BASE_GRAPHICS))
-            print(f"[OK] Loaded {fname}")
-        except Exception as e:
-            print(f"[WARN] Could not load {fname}: {e}")
-
     os.makedirs(OUTPUT_TXT, exist_ok=True)
     os.makedirs(OUTPUT_PNG, exist_ok=True)
 
@@ -293,7 +226,7 @@ def main():
 
 
         # Write png
-        render_png_from_grid(grid, sprites, os.path.join(OUTPUT_PNG, f"{name}.png"))
+        render_png_from_grid(grid, os.path.join(OUTPUT_PNG, f"{name}.png"))
 
         print(f"[OK] Saved {name}")
 
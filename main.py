@@ -26,7 +26,10 @@ if __name__ == "__main__":
     parser.add_argument("--temperature", type=float, default=1.0, help="Temperature for sampling.")
     parser.add_argument("--s_threshold", type=float, default=2.0, help="Score threshold for adding layouts to buffer.")
     parser.add_argument("--student_verbose", type=int, default=1, help="Verbosity level for student training.")
+    parser.add_argument("--n_envs", type=int, default=1, help="Number of parallel env workers for student training.")
+    parser.add_argument("--n_eval_envs", type=int, default=1, help="Number of parallel env workers for validation.")
     parser.add_argument("--log_dir", type=str, default="./logs", help="Directory to save logs.")
+    parser.add_argument("--novelty_k", type=int, default=5, help="Number of nearest archived layouts for novelty, 0 for the mean distance to the buffer.")
     args = parser.parse_args()
     
     trainer = Trainer(
@@ -39,7 +42,11 @@ if __name__ == "__main__":
         temperature=args.temperature,
         s_threshold=args.s_threshold,
         student_verbose=args.student_verbose,
+        n_envs=args.n_envs,
+        n_eval_envs=args.n_eval_envs,
         log_dir=args.log_dir,
+        novelty_k=args.novelty_k or None,
     )
     trainer.run()
     trainer.eval()
+    trainer.close()
@@ -1,5 +1,9 @@
 import json
+import multiprocessing
+import os
 import time
+from collections import defaultdict
+from functools import partial
 
 import numpy as np
 
@@ -14,6 +18,12 @@ from overcooked_ai_py.mdp.overcooked_mdp import (
 
 AI_ID = "I am robot!"
 
+# Horizon of the mdp of origin of the trajectories
+HUMAN_DATA_HORIZON = 1250
+
+# layout name -> AgentEvaluator, one per process
+_AGENT_EVALUATORS = {}
+
 
 ####################
 # CONVERSION UTILS #
@@ -81,20 +91,33 @@ def extract_df_for_worker_on_layout(main_trials, worker_id, layout_name):
     return worker_layout_traj_df
 
 
+def get_layout_agent_evaluator(layout_name):
+    """
+    AgentEvaluator of the human data on a layout, created once per layout and
+    process. Its env is only used to featurize states, never stepped, so it is
+    shared by all trajectories of the layout
+    """
+    if layout_name not in _AGENT_EVALUATORS:
+        _AGENT_EVALUATORS[layout_name] = AgentEvaluator.from_layout_name(
+            mdp_params={"layout_name": layout_name},
+            env_params={"horizon": HUMAN_DATA_HORIZON},
+        )
+    return _AGENT_EVALUATORS[layout_name]
+
+
 def df_traj_to_python_joint_traj(
-    traj_df, check_trajectories=True, silent=True, **kwargs
+    traj_df,
+    check_trajectories=True,
+    silent=True,
+    check_dynamics="off",
+    **kwargs
 ):
     if len(traj_df) == 0:
         return None
 
     datapoint = traj_df.iloc[0]
     layout_name = datapoint["layout_name"]
-    agent_evaluator = AgentEvaluator.from_layout_name(
-        mdp_params={"layout_name": layout_name},
-        env_params={
-            "horizon": 1250
-        },  # Defining the horizon of the mdp of origin of the trajectories
-    )
+    agent_evaluator = get_layout_agent_evaluator(layout_name)
     mdp = agent_evaluator.env.mdp
     env = agent_evaluator.env
 
@@ -135,19 +158,14 @@ def df_traj_to_python_joint_traj(
     }
 
     if check_trajectories:
-        agent_evaluator.check_trajectories(trajectories, verbose=not silent)
+        agent_evaluator.check_trajectories(
+            trajectories, verbose=not silent, check_dynamics=check_dynamics
+        )
     return trajectories
 
 
-def convert_joint_df_trajs_to_overcooked_single(
-    main_trials, layouts, silent=False, **kwargs
-):
-    """
-    Takes in a dataframe `main_trials` containing joint trajectories, and extract trajectories of workers `worker_ids`
-    on layouts `layouts`, with specific options.
-    """
-
-    single_agent_trajectories = {
+def empty_single_agent_trajectories():
+    return {
         # With shape (n_episodes, game_len), where game_len might vary across games:
         "ep_states": [],
         "ep_actions": [],
@@ -159,41 +177,120 @@ def convert_joint_df_trajs_to_overcooked_single(
         "ep_lengths": [],  # Lengths of each episode
         "mdp_params": [],
         "env_params": [],
-        "metadatas": {"ep_agent_idxs": []},  # Agent index for current episode
+        "metadatas": {
+            "ep_agent_idxs": [],  # Agent index for current episode
+            "ep_worker_ids": [],  # Worker id of that agent
+        },
     }
 
-    human_indices = []
-    num_trials_for_layout = {}
-    for layout_name in layouts:
-        trial_ids = np.unique(
-            main_trials[main_trials["layout_name"] == layout_name]["trial_id"]
-        )
-        num_trials = len(trial_ids)
-        num_trials_for_layout[layout_name] = num_trials
 
-        if num_trials == 0:
+def append_single_agent_trajectories(trajectories, other_trajectories):
+    """Appends the episodes of `other_trajectories` to `trajectories` in place"""
+    for key, value in other_trajectories.items():
+        if key == "metadatas":
+            for metadata_key, metadata in value.items():
+                trajectories["metadatas"][metadata_key].extend(metadata)
+        else:
+            trajectories[key].extend(value)
+    return trajectories
+
+
+def _convert_one_trial(one_traj_df, silent=True, **kwargs):
+    """Single-agent trajectories of the human player(s) of one game"""
+    joint_traj_data = df_traj_to_python_joint_traj(
+        one_traj_df, silent=silent, **kwargs
+    )
+    human_idx = get_human_player_index_for_df(one_traj_df)
+    trajectories = empty_single_agent_trajectories()
+    joint_state_trajectory_to_single(
+        trajectories, joint_traj_data, human_idx, silent=silent, **kwargs
+    )
+    return trajectories, human_idx
+
+
+def iter_joint_df_trajs_to_overcooked_single(
+    main_trials, layouts, silent=False, num_processes=1, **kwargs
+):
+    """
+    Yields (layout_name, single_agent_trajectories, human_idx) for every game of
+    `main_trials` on `layouts`, layout by layout in the order of `layouts` and by
+    trial id within a layout, where single_agent_trajectories is in the format of
+    `empty_single_agent_trajectories` with one episode per human player.
+
+    The dataframe is grouped by (layout_name, trial_id) once, and with
+    num_processes > 1 games are converted by a pool of processes (None for one
+    per cpu), each keeping one AgentEvaluator per layout
+    """
+    layout_trials = main_trials[main_trials["layout_name"].isin(layouts)]
+    trials_by_layout = defaultdict(list)
+    for (layout_name, _), one_traj_df in layout_trials.groupby(
+        ["layout_name", "trial_id"], sort=True
+    ):
+        trials_by_layout[layout_name].append(one_traj_df)
+
+    for layout_name in layouts:
+        if not trials_by_layout[layout_name]:
             print(
                 "WARNING: No trajectories found on {} layout!".format(
                     layout_name
                 )
             )
+    jobs = [
+        (layout_name, one_traj_df)
+        for layout_name in layouts
+        for one_traj_df in trials_by_layout[layout_name]
+    ]
 
-        for trial_id in trial_ids:
-            # Get an single game
-            one_traj_df = main_trials[main_trials["trial_id"] == trial_id]
+    convert = partial(_convert_one_trial, silent=silent, **kwargs)
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    num_processes = min(num_processes, len(jobs))
+    if num_processes <= 1:
+        for layout_name, one_traj_df in jobs:
+            yield (layout_name,) + convert(one_traj_df)
+        return
+
+    # spawned instead of forked processes, forking after the planners or
+    # pygame started threads can deadlock
+    pool = multiprocessing.get_context("spawn").Pool(num_processes)
+    try:
+        chunksize = max(1, len(jobs) // (4 * num_processes))
+        results = pool.imap(
+            convert, [one_traj_df for _, one_traj_df in jobs], chunksize
+        )
+        for (layout_name, _), result in zip(jobs, results):
+            yield (layout_name,) + result
+    finally:
+        pool.close()
+        pool.join()
 
-            # Get python trajectory data and information on which player(s) was/were human
-            joint_traj_data = df_traj_to_python_joint_traj(
-                one_traj_df, silent=silent, **kwargs
-            )
 
-            human_idx = get_human_player_index_for_df(one_traj_df)
-            human_indices.append(human_idx)
+def convert_joint_df_trajs_to_overcooked_single(
+    main_trials, layouts, silent=False, num_processes=1, **kwargs
+):
+    """
+    Takes in a dataframe `main_trials` containing joint trajectories, and extract trajectories of workers `worker_ids`
+    on layouts `layouts`, with specific options.
 
-            # Convert joint trajectories to single agent trajectories, appending recovered info to the `trajectories` dict
-            joint_state_trajectory_to_single(
-                single_agent_trajectories, joint_traj_data, human_idx, **kwargs
-            )
+    See `iter_joint_df_trajs_to_overcooked_single` to process the games one at a time instead of accumulating them.
+    """
+    single_agent_trajectories = empty_single_agent_trajectories()
+    human_indices = []
+    num_trials_for_layout = {layout_name: 0 for layout_name in layouts}
+    for layout_name, trajectories, human_idx in (
+        iter_joint_df_trajs_to_overcooked_single(
+            main_trials,
+            layouts,
+            silent=silent,
+            num_processes=num_processes,
+            **kwargs
+        )
+    ):
+        append_single_agent_trajectories(
+            single_agent_trajectories, trajectories
+        )
+        human_indices.append(human_idx)
+        num_trials_for_layout[layout_name] += 1
 
     if not silent:
         print(
@@ -271,3 +368,6 @@ def joint_state_trajectory_to_single(
         trajectories["mdp_params"].append(env.mdp.mdp_params)
         trajectories["env_params"].append({})
         trajectories["metadatas"]["ep_agent_idxs"].append(agent_idx)
+        trajectories["metadatas"]["ep_worker_ids"].append(
+            joint_traj_data["metadatas"]["player_{}_id".format(agent_idx)][0]
+        )
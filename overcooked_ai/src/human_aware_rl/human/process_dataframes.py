@@ -38,8 +38,10 @@ def get_human_human_trajectories(
 
     Keyword Arguments:
         featurize_states (bool): Whether the states in returned trajectories should be OvercookedState objects (false) or vectorized np.Arrays (true)
-        check_trajectories (bool): If True, we ensure the consistency of the MDP dynamics within the trajectory. This is slow and has lots of overhead
+        check_trajectories (bool): If True, we ensure the trajectories are in the standard format
+        check_dynamics (str): Consistency check of the MDP dynamics within the trajectories when check_trajectories, one of "off" (default), "sampled", "full" or "full_parallel". Full checks are slow and have lots of overhead
         silent (bool): If true, silence logging and print statements
+        num_processes (int): Number of processes converting games in parallel, None for one per cpu (default 1)
     """
     if not set(layouts).issubset(LAYOUTS_WITH_DATA):
         # Note: doesn't necessarily mean we'll find data for this layout as this is a loose check
@@ -62,9 +64,9 @@ def get_human_human_trajectories(
         data_path_to_layouts[curr_data_path].append(layout)
 
     # For each data path, load data once and parse trajectories for all corresponding layouts
-    for data_path in data_path_to_layouts:
+    for curr_data_path, curr_layouts in data_path_to_layouts.items():
         curr_data = get_trajs_from_data(
-            curr_data_path, layouts=[layout], **kwargs
+            curr_data_path, layouts=curr_layouts, **kwargs
         )[0]
         data = append_trajectories(data, curr_data)
 
@@ -1,8 +1,11 @@
 import argparse
 import copy
 import json
+import multiprocessing
 import os
 import pickle
+import shutil
+import time
 
 import pandas as pd
 
@@ -12,6 +15,7 @@ from human_aware_rl.human.data_processing_utils import (
 from overcooked_ai_py.mdp.overcooked_mdp import (
     OvercookedGridworld,
     OvercookedState,
+    Recipe,
 )
 from overcooked_ai_py.planning.planners import (
     NO_COUNTERS_PARAMS,
@@ -30,6 +34,12 @@ JSON_FIXES = [
     ("INTERACT", "interact"),
 ]
 
+# Names of the layouts in the current version of the game
+LAYOUT_NAME_FIXES = {
+    "random0": "forced_coordination",
+    "random3": "counter_circuit_o_1order",
+}
+
 """
 First parse raw pickle file indicated using the first command
 line argument, to generate state action pairs.  Then featurize
@@ -197,54 +207,28 @@ def display_state_dict_and_action(state_dict, actions):
     print()
 
 
-def main(
-    data_infile, data_outdir, insert_interacts, forward_port, fix_json, verbose
+def process_chunk(
+    rows,
+    insert_interacts=False,
+    forward_port=False,
+    fix_json=False,
+    verbose=False,
 ):
     """
     Arguments:
-        data_infile (str): Full path to cleaned, pickled DataFrame of human data we wish to work with
-        data_outdir (str): Directory in which we will save our results. Must exist already
-        insert_interacts (bool): Whether to impute interact actions to be compatible with modern dynamics
-        forward_port (bool): Whether states need to be converted from legacy to current schema
-        fix_json (bool): Whether legacy JSON fixes (ie convert single to double quotes) need to be performed. Unless
-            you are working with a very outdated version of our data, this is most likely not necessary
-        verbose (bool): Whether to include debug logs
-
-    Behavior:
-        Converts data as specified by arguments, then saves 'state_action_pairs' dictionary in
+        rows (list): (layout_name, state, joint_action) tuples of consecutive rows of the raw data
+        insert_interacts, forward_port, fix_json, verbose: see `main`
 
-                {data_outdir}/{data_infile_filename}._state_dict_and_action_{inserted|original}.pickle
-
-        Where {data_infile_filename} is the base filename of the loaded datapath. For example, if data_infile='/foo/bar/baz.pickle', then
-        data_infile_filename='baz'
-
-        The structure of 'state_action_pairs' is as follows:
-
-            state_action_pairs[layout] = [(state_1, joint_action_1), (state_2, joint_action_2), ...]
+    Returns:
+        state_action_pairs (dict): state_action_pairs[layout] = [(state_1, joint_action_1), ...] for the rows, in order
     """
-
-    raw_data = pd.read_pickle(data_infile)
-    N = len(raw_data)
-
-    if verbose:
-        print("Processing Raw Data")
     state_action_pairs = dict()
-
-    for i, datapoint in raw_data.iterrows():
-        if verbose:
-            print(f"Processing {i}/{N}", end="\r")
-
-        layout_name = datapoint.layout_name
-        if layout_name == "random0":
-            layout_name = "forced_coordination"
-        elif layout_name == "random3":
-            layout_name = "counter_circuit_o_1order"
+    for layout_name, state, actions in rows:
+        layout_name = LAYOUT_NAME_FIXES.get(layout_name, layout_name)
         if layout_name not in state_action_pairs:
             state_action_pairs[layout_name] = []
 
         # Fix formatting issues then parse json state
-        state = datapoint.state
-        actions = datapoint.joint_action
         state_dict, insertion_needed = process_state(
             state, forward_port, fix_json
         )
@@ -267,19 +251,231 @@ def main(
         if verbose:
             display_state_dict_and_action(state_dict, actions)
         state_action_pairs[layout_name].append((state_dict, actions))
-    if verbose:
-        print("Done processing raw data!")
+    return state_action_pairs
+
+
+def _chunk_done_path(shards_dir, chunk_idx):
+    return os.path.join(shards_dir, "chunk_{:05d}.done".format(chunk_idx))
+
+
+def _layout_shard_path(shards_dir, layout_name, chunk_idx):
+    return os.path.join(
+        shards_dir, layout_name, "chunk_{:05d}.pickle".format(chunk_idx)
+    )
+
+
+def _process_and_save_chunk(job):
+    """
+    Processes a chunk and saves one shard per layout, then a marker listing the
+    layouts of the chunk, so a chunk with a marker is complete
+    """
+    shards_dir, chunk_idx, rows, options = job
+    state_action_pairs = process_chunk(rows, **options)
+    for layout_name, pairs in state_action_pairs.items():
+        os.makedirs(os.path.join(shards_dir, layout_name), exist_ok=True)
+        with open(
+            _layout_shard_path(shards_dir, layout_name, chunk_idx), "wb"
+        ) as f:
+            pickle.dump(pairs, f)
+    done_path = _chunk_done_path(shards_dir, chunk_idx)
+    with open(done_path + ".tmp", "w") as f:
+        json.dump(list(state_action_pairs), f)
+    os.replace(done_path + ".tmp", done_path)
+    return chunk_idx, len(rows)
+
+
+def load_shards(shards_dir):
+    """
+    Merges the shards written by `main` into a single 'state_action_pairs' dictionary (see `main`), raises a
+    ValueError if some chunks are not processed yet
+    """
+    with open(os.path.join(shards_dir, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    state_action_pairs = dict()
+    for chunk_idx in range(manifest["num_chunks"]):
+        done_path = _chunk_done_path(shards_dir, chunk_idx)
+        if not os.path.exists(done_path):
+            raise ValueError(
+                "Chunk {} of {} is not processed".format(chunk_idx, shards_dir)
+            )
+        with open(done_path, "r") as f:
+            layout_names = json.load(f)
+        for layout_name in layout_names:
+            with open(
+                _layout_shard_path(shards_dir, layout_name, chunk_idx), "rb"
+            ) as f:
+                state_action_pairs.setdefault(layout_name, []).extend(
+                    pickle.load(f)
+                )
+    return state_action_pairs
+
+
+def main(
+    data_infile,
+    data_outdir,
+    insert_interacts,
+    forward_port,
+    fix_json,
+    verbose,
+    num_processes=1,
+    chunk_size=2000,
+    merge=True,
+):
+    """
+    Arguments:
+        data_infile (str): Full path to cleaned, pickled DataFrame of human data we wish to work with
+        data_outdir (str): Directory in which we will save our results. Must exist already
+        insert_interacts (bool): Whether to impute interact actions to be compatible with modern dynamics
+        forward_port (bool): Whether states need to be converted from legacy to current schema
+        fix_json (bool): Whether legacy JSON fixes (ie convert single to double quotes) need to be performed. Unless
+            you are working with a very outdated version of our data, this is most likely not necessary
+        verbose (bool): Whether to include debug logs and throughput
+        num_processes (int): Number of processes converting chunks of rows, None for one per cpu
+        chunk_size (int): Number of rows of the DataFrame per chunk
+        merge (bool): Whether to merge the shards into the single pickle described below
 
+    Behavior:
+        Converts data as specified by arguments, chunk by chunk, saving the pairs of every chunk and layout in
+
+                {data_outdir}/{data_infile_filename}_state_dict_and_action_{inserted|original}_shards/{layout}/chunk_{i}.pickle
+
+        Chunks already processed by an interrupted run with the same input and options are skipped (see
+        manifest.json in the shards directory), and `load_shards` merges the shards.
+
+        If merge, then saves 'state_action_pairs' dictionary in
+
+                {data_outdir}/{data_infile_filename}._state_dict_and_action_{inserted|original}.pickle
+
+        Where {data_infile_filename} is the base filename of the loaded datapath. For example, if data_infile='/foo/bar/baz.pickle', then
+        data_infile_filename='baz'
+
+        The structure of 'state_action_pairs' is as follows:
+
+            state_action_pairs[layout] = [(state_1, joint_action_1), (state_2, joint_action_2), ...]
+
+    Returns:
+        data_outfile (str): Path of the merged pickle if merge, else of the shards directory
+    """
     # The tag to the file such that we know whether insertion has been performed
     filename = os.path.basename(data_infile).split(".")[0]
     tag = "inserted" if insert_interacts else "original"
-
     data_outfile = os.path.join(
         data_outdir, filename + "_state_dict_and_action_{}.pickle".format(tag)
     )
-    with open(data_outfile, "wb") as f:
-        pickle.dump(state_action_pairs, f)
+    shards_dir = os.path.join(
+        data_outdir, filename + "_state_dict_and_action_{}_shards".format(tag)
+    )
+
+    raw_data = pd.read_pickle(data_infile)
+    N = len(raw_data)
+    num_chunks = (N + chunk_size - 1) // chunk_size
+    infile_stat = os.stat(data_infile)
+    manifest = {
+        "data_infile": os.path.abspath(data_infile),
+        "data_infile_size": infile_stat.st_size,
+        "data_infile_mtime_ns": infile_stat.st_mtime_ns,
+        "insert_interacts": bool(insert_interacts),
+        "forward_port": bool(forward_port),
+        "fix_json": bool(fix_json),
+        "chunk_size": chunk_size,
+        "num_chunks": num_chunks,
+    }
+    manifest_path = os.path.join(shards_dir, "manifest.json")
+    old_manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            old_manifest = json.load(f)
+    if old_manifest != manifest:
+        # shards of another input or other options, start over
+        shutil.rmtree(shards_dir, ignore_errors=True)
+        os.makedirs(shards_dir)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+    options = {
+        "insert_interacts": insert_interacts,
+        "forward_port": forward_port,
+        "fix_json": fix_json,
+        "verbose": verbose,
+    }
+    rows = list(
+        zip(
+            raw_data["layout_name"],
+            raw_data["state"],
+            raw_data["joint_action"],
+        )
+    )
+    del raw_data
+    jobs = [
+        (
+            shards_dir,
+            chunk_idx,
+            rows[chunk_idx * chunk_size : (chunk_idx + 1) * chunk_size],
+            options,
+        )
+        for chunk_idx in range(num_chunks)
+        if not os.path.exists(_chunk_done_path(shards_dir, chunk_idx))
+    ]
+    num_rows = sum(len(job[2]) for job in jobs)
+    if verbose:
+        print(
+            "Processing Raw Data: {} rows in {} chunks, {} rows already processed".format(
+                num_rows, len(jobs), N - num_rows
+            )
+        )
 
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    num_processes = min(num_processes, len(jobs))
+    start_time = time.time()
+    rows_done = 0
+
+    def report(chunk_idx):
+        if verbose:
+            elapsed = time.time() - start_time
+            print(
+                "Processed chunk {} ({}/{} rows, {:.0f} rows/s)".format(
+                    chunk_idx,
+                    rows_done,
+                    num_rows,
+                    rows_done / max(elapsed, 1e-9),
+                )
+            )
+
+    if num_processes <= 1:
+        for job in jobs:
+            chunk_idx, chunk_rows = _process_and_save_chunk(job)
+            rows_done += chunk_rows
+            report(chunk_idx)
+    else:
+        # spawned instead of forked processes, forking after the planners
+        # started threads can deadlock; states are parsed with the recipes
+        # configured in this process
+        try:
+            recipe_config = Recipe.configuration
+        except ValueError:
+            recipe_config = None
+        pool = multiprocessing.get_context("spawn").Pool(
+            num_processes,
+            initializer=None if recipe_config is None else Recipe.configure,
+            initargs=(recipe_config,),
+        )
+        try:
+            for chunk_idx, chunk_rows in pool.imap_unordered(
+                _process_and_save_chunk, jobs
+            ):
+                rows_done += chunk_rows
+                report(chunk_idx)
+        finally:
+            pool.close()
+            pool.join()
+    if verbose:
+        print("Done processing raw data!")
+
+    if not merge:
+        return shards_dir
+    with open(data_outfile, "wb") as f:
+        pickle.dump(load_shards(shards_dir), f)
     return data_outfile
 
 
@@ -291,6 +487,20 @@ if __name__ == "__main__":
     parser.add_argument("-j", "--fix-json", action="store_true")
     parser.add_argument("-fp", "--forward-port", action="store_true")
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "-n",
+        "--num-processes",
+        type=int,
+        default=None,
+        help="Processes converting chunks, defaults to the number of cpus",
+    )
+    parser.add_argument("-c", "--chunk-size", type=int, default=2000)
+    parser.add_argument(
+        "--no-merge",
+        dest="merge",
+        action="store_false",
+        help="Only write the per-layout shards, not the merged pickle",
+    )
 
     args = vars(parser.parse_args())
     main(**args)
@@ -8,10 +8,17 @@ import unittest
 import numpy as np
 from numpy.testing._private.utils import assert_raises
 
+from human_aware_rl.human.data_processing_utils import (
+    get_layout_agent_evaluator,
+)
 from human_aware_rl.human.process_dataframes import (
     csv_to_df_pickle,
     get_trajs_from_data,
 )
+from human_aware_rl.human.process_human_trials import (
+    _chunk_done_path,
+    load_shards,
+)
 from human_aware_rl.human.process_human_trials import (
     main as process_human_trials_main,
 )
@@ -116,6 +123,42 @@ class TestProcessDataFrames(unittest.TestCase):
         params["featurize_states"] = True
         trajectories, _ = get_trajs_from_data(**params)
 
+    def test_get_trajs_from_data_parallel(self):
+        # Games converted by a pool of processes come back in the order of a serial conversion
+        for featurize_states in [False, True]:
+            params = copy.deepcopy(self.base_get_trajs_from_data_params)
+            params["featurize_states"] = featurize_states
+            params["layouts"] = [
+                "random3",
+                "cramped_room",
+                "asymmetric_advantages",
+            ]
+            serial_trajectories, _ = get_trajs_from_data(
+                num_processes=1, **params
+            )
+            evaluator = get_layout_agent_evaluator("cramped_room")
+            parallel_trajectories, _ = get_trajs_from_data(
+                num_processes=2, **params
+            )
+            self.assertIs(
+                get_layout_agent_evaluator("cramped_room"), evaluator
+            )
+
+            self.assertEqual(
+                list(
+                    dict.fromkeys(
+                        mdp_params["layout_name"]
+                        for mdp_params in serial_trajectories["mdp_params"]
+                    )
+                ),
+                params["layouts"],
+            )
+            self.assertEqual(
+                serial_trajectories["metadatas"]["ep_worker_ids"],
+                parallel_trajectories["metadatas"]["ep_worker_ids"],
+            )
+            np.testing.assert_equal(parallel_trajectories, serial_trajectories)
+
     def test_get_trajs_from_data_2020(self):
         # Ensure we can properly deserialize states with updated objects (i.e tomatoes)
         params = copy.deepcopy(self.base_get_trajs_from_data_params)
@@ -189,11 +232,22 @@ class TestHumanDataConversion(unittest.TestCase):
             fix_json=False,
         )
         with open(outfile, "rb") as f:
-            self.human_data = pickle.load(f)[self.layout_name]
+            self.all_human_data = pickle.load(f)
+        self.human_data = self.all_human_data[self.layout_name]
 
     def tearDown(self):
         shutil.rmtree(self.temp_dir)
 
+    def _process_human_trials(self, **kwargs):
+        params = {
+            "insert_interacts": True,
+            "verbose": False,
+            "forward_port": False,
+            "fix_json": False,
+        }
+        params.update(kwargs)
+        return process_human_trials_main(self.infile, self.temp_dir, **params)
+
     def test_state(self):
         idx = 0
         for state_dict, joint_action in self.human_data[:100]:
@@ -211,6 +265,44 @@ class TestHumanDataConversion(unittest.TestCase):
             self.env.step(joint_action=joint_action)
             idx += 1
 
+    def test_resume_processing(self):
+        shards_dir = self._process_human_trials(chunk_size=500, merge=False)
+        self.assertEqual(load_shards(shards_dir), self.all_human_data)
+
+        # Simulate an interrupted run, only the chunks without a marker are processed again
+        missing_chunks = [1, 3, 4]
+        kept_mtimes = {}
+        for chunk_idx in range(8):
+            done_path = _chunk_done_path(shards_dir, chunk_idx)
+            if chunk_idx in missing_chunks:
+                os.remove(done_path)
+            else:
+                kept_mtimes[chunk_idx] = os.stat(done_path).st_mtime_ns
+        self.assertRaises(ValueError, load_shards, shards_dir)
+
+        outfile = self._process_human_trials(chunk_size=500, num_processes=2)
+        with open(outfile, "rb") as f:
+            self.assertEqual(pickle.load(f), self.all_human_data)
+        for chunk_idx, mtime in kept_mtimes.items():
+            self.assertEqual(
+                os.stat(_chunk_done_path(shards_dir, chunk_idx)).st_mtime_ns,
+                mtime,
+            )
+
+    def test_rebuild_shards_on_option_change(self):
+        shards_dir = self._process_human_trials(chunk_size=500, merge=False)
+        stale_path = os.path.join(shards_dir, "stale")
+        open(stale_path, "w").close()
+
+        # Same input and options, the shards are kept
+        self._process_human_trials(chunk_size=500, merge=False)
+        self.assertTrue(os.path.exists(stale_path))
+
+        self._process_human_trials(chunk_size=1000, merge=False)
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertFalse(os.path.exists(_chunk_done_path(shards_dir, 4)))
+        self.assertEqual(load_shards(shards_dir), self.all_human_data)
+
 
 if __name__ == "__main__":
     unittest.main()
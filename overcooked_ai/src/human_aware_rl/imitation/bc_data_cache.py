@@ -0,0 +1,408 @@
+"""
+Columnar cache of featurized human-human data for behavior cloning.
+
+Converting the pickled DataFrames (parsing every JSON state and featurizing it)
+is done once per dataset, the result is written as .npy columns that later runs
+memory-map instead of converting again:
+
+    <cache_dir>/<key>/
+        index.json
+        shard_00000/
+            observations.npy    (num_steps, *observation_shape) featurized states
+            actions.npy         (num_steps, 1) action indices
+            seq_lens.npy        (num_episodes,) lengths of the episodes
+            returns.npy         (num_episodes,) sparse returns of the episodes
+            layout_ids.npy      (num_episodes,) index in index.json "layouts"
+            worker_ids.npy      (num_episodes,) index in index.json "workers"
+            agent_idxs.npy      (num_episodes,) player index of the human
+        shard_00001/
+            ...
+
+Episodes are never split across shards, so shards can be streamed one at a
+time (see `BCDataCache.iter_shards`) when the dataset doesn't fit in memory.
+The key hashes the resolved data paths (with their size and mtime), the
+layouts and the conversion options, so editing a DataFrame rebuilds its cache.
+Bump CACHE_VERSION when the featurization changes.
+
+Usage:
+    python -m human_aware_rl.imitation.bc_data_cache --layouts cramped_room [--data_path PATH] [--dataset_type train] [--cache_dir DIR] [--shard_size N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from human_aware_rl.data_dir import DATA_DIR
+from human_aware_rl.human.data_processing_utils import (
+    iter_joint_df_trajs_to_overcooked_single,
+)
+from human_aware_rl.human.process_dataframes import _get_data_path
+from human_aware_rl.static import LAYOUTS_WITH_DATA
+
+BC_DATA_CACHE_DIR = os.path.join(DATA_DIR, "bc_data_cache")
+
+CACHE_VERSION = 1
+
+# Steps per shard, about 200MB of float64 lossy features
+DEFAULT_SHARD_SIZE = 2**18
+
+# Per-episode columns of a shard, besides observations and actions
+EPISODE_COLUMNS = [
+    "seq_lens",
+    "returns",
+    "layout_ids",
+    "worker_ids",
+    "agent_idxs",
+]
+
+
+def data_paths_for_layouts(layouts, dataset_type="train", data_path=None):
+    """Maps every data path to its layouts, resolved like in get_human_human_trajectories"""
+    data_path_to_layouts = {}
+    for layout in layouts:
+        curr_data_path = _get_data_path(layout, dataset_type, data_path)
+        data_path_to_layouts.setdefault(curr_data_path, []).append(layout)
+    return data_path_to_layouts
+
+
+def cache_key(data_path_to_layouts, check_trajectories=False):
+    """Hash of the sources of a cache and of the options used to convert them"""
+    sources = []
+    for data_path, layouts in data_path_to_layouts.items():
+        stat = os.stat(data_path)
+        sources.append(
+            [os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns, layouts]
+        )
+    content = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "sources": sources,
+            "check_trajectories": bool(check_trajectories),
+        }
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class BCDataCache(object):
+    """
+    Read-only view of a cache directory written by `build_bc_data_cache`.
+    Columns are memory-mapped, so opening a cache and indexing it copies
+    nothing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json"), "r") as f:
+            self.index = json.load(f)
+        if self.index["version"] != CACHE_VERSION:
+            raise ValueError(
+                "Cache at {} has version {}, expected {}".format(
+                    path, self.index["version"], CACHE_VERSION
+                )
+            )
+
+    @property
+    def layouts(self):
+        return self.index["layouts"]
+
+    @property
+    def workers(self):
+        return self.index["workers"]
+
+    @property
+    def num_steps(self):
+        return self.index["num_steps"]
+
+    @property
+    def num_episodes(self):
+        return self.index["num_episodes"]
+
+    @property
+    def observation_shape(self):
+        return tuple(self.index["observation_shape"])
+
+    def shard(self, shard_idx, mmap_mode="r"):
+        """Dict of column name to array for one shard"""
+        shard_dir = os.path.join(self.path, self.index["shards"][shard_idx])
+        return {
+            column: np.load(
+                os.path.join(shard_dir, column + ".npy"), mmap_mode=mmap_mode
+            )
+            for column in ["observations", "actions"] + EPISODE_COLUMNS
+        }
+
+    def iter_shards(self, mmap_mode="r"):
+        """Yields the columns of every shard in turn, see `shard`"""
+        for shard_idx in range(len(self.index["shards"])):
+            yield self.shard(shard_idx, mmap_mode)
+
+    def column(self, column, mmap_mode="r"):
+        """
+        Column over all shards. The memory-mapped array itself with a single
+        shard, concatenated (so loaded in memory) otherwise
+        """
+        arrays = [shard[column] for shard in self.iter_shards(mmap_mode)]
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+
+    def load(self, use_lstm=False):
+        """
+        Returns data in the format of behavior_cloning_tf2.load_data
+
+        use_lstm=False: (observations, None, actions), with shapes
+            (num_steps, *observation_shape) and (num_steps, 1)
+        use_lstm=True: (observations, seq_lens, actions) padded with zeros
+            to the longest episode, with shapes
+            (num_episodes, max_len, *observation_shape), (num_episodes,) and
+            (num_episodes, max_len, 1)
+        """
+        observations = self.column("observations")
+        actions = self.column("actions")
+        if not use_lstm:
+            return observations, None, actions
+
+        seq_lens = np.asarray(self.column("seq_lens"))
+        max_len = int(seq_lens.max()) if len(seq_lens) else 0
+        # steps of every episode, in order, are the unmasked cells row by row
+        mask = np.arange(max_len)[None, :] < seq_lens[:, None]
+        padded_observations = np.zeros(
+            (len(seq_lens), max_len) + observations.shape[1:],
+            dtype=observations.dtype,
+        )
+        padded_observations[mask] = observations
+        padded_actions = np.zeros(
+            (len(seq_lens), max_len) + actions.shape[1:], dtype=actions.dtype
+        )
+        padded_actions[mask] = actions
+        return padded_observations, seq_lens, padded_actions
+
+
+class _ShardWriter(object):
+    """Buffers episodes and writes them as shards of at least shard_size steps"""
+
+    def __init__(self, path, shard_size):
+        self.path = path
+        self.shard_size = shard_size
+        self.shard_names = []
+        self.num_steps = 0
+        self.num_episodes = 0
+        self.observation_shape = None
+        self.observation_dtype = None
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self._observations, self._actions = [], []
+        self._episodes = {column: [] for column in EPISODE_COLUMNS}
+        self._buffered_steps = 0
+
+    def add_episode(
+        self, observations, actions, ep_return, layout_id, worker_id, agent_idx
+    ):
+        observations = np.asarray(observations)
+        if self.observation_shape is None:
+            self.observation_shape = observations.shape[1:]
+            self.observation_dtype = observations.dtype
+        self._observations.append(observations)
+        self._actions.append(np.asarray(actions, dtype=np.int64).reshape(-1, 1))
+        for column, value in zip(
+            EPISODE_COLUMNS,
+            [len(observations), ep_return, layout_id, worker_id, agent_idx],
+        ):
+            self._episodes[column].append(value)
+        self._buffered_steps += len(observations)
+        self.num_steps += len(observations)
+        self.num_episodes += 1
+        if self._buffered_steps >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._observations:
+            return
+        shard_name = "shard_{:05d}".format(len(self.shard_names))
+        shard_dir = os.path.join(self.path, shard_name)
+        os.makedirs(shard_dir)
+        np.save(
+            os.path.join(shard_dir, "observations.npy"),
+            np.concatenate(self._observations).astype(
+                self.observation_dtype, copy=False
+            ),
+        )
+        np.save(
+            os.path.join(shard_dir, "actions.npy"),
+            np.concatenate(self._actions),
+        )
+        for column, dtype in zip(
+            EPISODE_COLUMNS,
+            [np.int64, np.float64, np.int32, np.int32, np.int32],
+        ):
+            np.save(
+                os.path.join(shard_dir, column + ".npy"),
+                np.array(self._episodes[column], dtype=dtype),
+            )
+        self.shard_names.append(shard_name)
+        self._reset_buffers()
+
+
+def build_bc_data_cache(
+    layouts,
+    dataset_type="train",
+    data_path=None,
+    check_trajectories=False,
+    cache_dir=BC_DATA_CACHE_DIR,
+    shard_size=DEFAULT_SHARD_SIZE,
+    force=False,
+    num_processes=1,
+    silent=True,
+    **kwargs
+):
+    """
+    Converts and featurizes the human-human trajectories of `layouts` (same
+    data resolution as get_human_human_trajectories) into a cache directory,
+    unless an up-to-date cache already exists.
+
+    The DataFrame of every data path is loaded once and its games are
+    converted by num_processes processes (see
+    iter_joint_df_trajs_to_overcooked_single) and streamed into the shards, so
+    at most a shard of featurized trajectories is held in memory. The cache is
+    written to a temporary directory and renamed, readers never see a partial
+    cache.
+
+    Returns:
+        path (str): directory of the cache, to open with BCDataCache
+    """
+    if not set(layouts).issubset(LAYOUTS_WITH_DATA):
+        raise ValueError("Layout for which no data collected detected")
+    if data_path and not os.path.exists(data_path):
+        raise FileNotFoundError(
+            "Tried to load human data from {} but file does not exist!".format(
+                data_path
+            )
+        )
+
+    data_path_to_layouts = data_paths_for_layouts(layouts, dataset_type, data_path)
+    path = os.path.join(cache_dir, cache_key(data_path_to_layouts, check_trajectories))
+    if os.path.exists(path) and not force:
+        return path
+
+    tmp_path = "{}.tmp.{}".format(path, os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        writer = _ShardWriter(tmp_path, shard_size)
+        cache_layouts, workers, worker_ids = [], [], {}
+        for curr_data_path, curr_layouts in data_path_to_layouts.items():
+            if not silent:
+                print("Loading data from {}".format(curr_data_path))
+            main_trials = pd.read_pickle(curr_data_path)
+            layout_ids = {}
+            for layout in curr_layouts:
+                layout_ids[layout] = len(cache_layouts)
+                cache_layouts.append(layout)
+            for layout, trajs, _ in iter_joint_df_trajs_to_overcooked_single(
+                main_trials,
+                curr_layouts,
+                silent=silent,
+                num_processes=num_processes,
+                check_trajectories=check_trajectories,
+                featurize_states=True,
+            ):
+                metadatas = trajs["metadatas"]
+                for i in range(len(trajs["ep_states"])):
+                    worker = str(metadatas["ep_worker_ids"][i])
+                    if worker not in worker_ids:
+                        worker_ids[worker] = len(workers)
+                        workers.append(worker)
+                    writer.add_episode(
+                        trajs["ep_states"][i],
+                        trajs["ep_actions"][i],
+                        trajs["ep_returns"][i],
+                        layout_ids[layout],
+                        worker_ids[worker],
+                        metadatas["ep_agent_idxs"][i],
+                    )
+        writer.flush()
+
+        index = {
+            "version": CACHE_VERSION,
+            "layouts": cache_layouts,
+            "workers": workers,
+            "data_paths": {
+                os.path.abspath(p): l for p, l in data_path_to_layouts.items()
+            },
+            "check_trajectories": bool(check_trajectories),
+            "observation_shape": list(writer.observation_shape or ()),
+            "observation_dtype": str(writer.observation_dtype),
+            "num_steps": writer.num_steps,
+            "num_episodes": writer.num_episodes,
+            "shards": writer.shard_names,
+        }
+        with open(os.path.join(tmp_path, "index.json"), "w") as f:
+            json.dump(index, f, indent=1)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    if not silent:
+        print(
+            "Cached {} steps of {} episodes at {}".format(
+                writer.num_steps, writer.num_episodes, path
+            )
+        )
+    return path
+
+
+def get_bc_data_cache(data_params, silent=True, **kwargs):
+    """
+    Cache of the data described by BC `data_params` (see DEFAULT_DATA_PARAMS
+    in behavior_cloning_tf2), built on first use
+    """
+    data_params = dict(data_params)
+    cache_dir = data_params.pop("data_cache_dir", None) or BC_DATA_CACHE_DIR
+    data_params.pop("featurize_states", None)
+    path = build_bc_data_cache(
+        cache_dir=cache_dir, silent=silent, **data_params, **kwargs
+    )
+    return BCDataCache(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layouts", nargs="+", required=True)
+    parser.add_argument("--data_path", type=str, default=None)
+    parser.add_argument(
+        "--dataset_type", choices=["train", "test", "all"], default="train"
+    )
+    parser.add_argument("--cache_dir", type=str, default=BC_DATA_CACHE_DIR)
+    parser.add_argument("--shard_size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument("--check_trajectories", action="store_true")
+    parser.add_argument(
+        "--num_processes",
+        type=int,
+        default=None,
+        help="Processes converting games, defaults to the number of cpus",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Rebuild an up-to-date cache"
+    )
+    args = parser.parse_args()
+
+    build_bc_data_cache(
+        args.layouts,
+        dataset_type=args.dataset_type,
+        data_path=args.data_path,
+        check_trajectories=args.check_trajectories,
+        cache_dir=args.cache_dir,
+        shard_size=args.shard_size,
+        force=args.force,
+        num_processes=args.num_processes,
+        silent=False,
+    )
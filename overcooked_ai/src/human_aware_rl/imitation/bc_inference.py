@@ -0,0 +1,366 @@
+"""
+Batched inference for behavior cloning models.
+
+BehaviorCloningPolicy used to run keras `Model.predict` on every single
+observation, whose per-call overhead dwarfs the forward pass of the small BC
+networks. Forward passes are functions
+
+    forward(obs_batch, states) -> (logits, states)
+
+mapping a (batch_size, *observation_shape) batch of featurized observations and
+the LSTM states ([h, c] of shape (batch_size, cell_size), [] for MLPs) to
+(batch_size, num_actions) logits and the next LSTM states. They are built by
+`get_bc_forward`, with one of the INFERENCE_MODES:
+    - "tf_function": the keras model called in a `tf.function` traced once for
+      any batch size (`Model.predict` when eager execution is disabled)
+    - "numpy": the network re-implemented in NumPy from its exported weights
+      (see `export_bc_weights`), which needs no TensorFlow session and runs
+      from any thread
+    - "keras": `Model.predict`, the original path
+
+With max_batch_wait > 0, calls are queued in a `MicroBatcher` so that
+concurrent games (e.g. NPC threads of the demo server) share one forward pass.
+"""
+
+import os
+import threading
+import time
+import weakref
+
+import numpy as np
+
+INFERENCE_MODES = ("tf_function", "numpy", "keras")
+
+# Attribute of a model holding its forward passes by (inference,
+# max_batch_wait), so that they are freed with the model
+_BC_FORWARDS_ATTR = "_bc_forwards"
+
+# abspath(model_dir) -> ((mtime_ns, size) of its model.keras, inference,
+# max_batch_wait) -> forward. Only forwards of the current model.keras of a
+# directory are kept
+_BC_FORWARDS_BY_DIR = {}
+_BC_FORWARDS_LOCK = threading.Lock()
+
+
+def sample_actions(logits, rng=np.random):
+    """
+    Samples one action per row of logits from the softmax of the row, by
+    inverse CDF with a single uniform draw per row
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+    cdf = np.cumsum(probs, axis=1)
+    thresholds = rng.random_sample(len(cdf)) * cdf[:, -1]
+    actions = (cdf <= thresholds[:, None]).sum(axis=1)
+    # rounding of the cdf can't push the action past the last one
+    return np.minimum(actions, logits.shape[1] - 1)
+
+
+######################
+# NumPy forward pass #
+######################
+
+
+def export_bc_weights(model, bc_params):
+    """
+    Returns the weights of a model built by build_bc_model as a dict of NumPy
+    arrays
+        fc_{i}/kernel, fc_{i}/bias      hidden layers
+        lstm/kernel, lstm/recurrent_kernel, lstm/bias     if use_lstm
+        logits/kernel, logits/bias      output layer
+    Layers wrapped in TimeDistributed are found by the name of the wrapped
+    layer.
+    """
+    layers = {}
+    for layer in model.layers:
+        layers[layer.name] = layer
+        inner = getattr(layer, "layer", None)
+        if inner is not None:
+            layers.setdefault(inner.name, layer)
+
+    names = ["fc_{0}".format(i) for i in range(bc_params["mlp_params"]["num_layers"])]
+    if bc_params["use_lstm"]:
+        names.append("lstm")
+    names.append("logits")
+
+    weights = {}
+    for name in names:
+        layer_weights = layers[name].get_weights()
+        if name == "lstm":
+            keys = ["kernel", "recurrent_kernel", "bias"]
+        else:
+            keys = ["kernel", "bias"]
+        for key, value in zip(keys, layer_weights):
+            weights["{0}/{1}".format(name, key)] = np.asarray(value, dtype=np.float32)
+    return weights
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyBCForward(object):
+    """
+    Forward pass of a BC model from its exported weights, with the activations
+    of build_bc_model (relu hidden layers, keras default LSTM gates in i, f, c, o
+    order). Only single steps are computed, as in BehaviorCloningPolicy, so the
+    sequence mask of the LSTM model has no effect.
+    """
+
+    def __init__(self, weights, use_lstm=False):
+        self.use_lstm = use_lstm
+        self.hidden_layers = []
+        i = 0
+        while "fc_{0}/kernel".format(i) in weights:
+            self.hidden_layers.append(
+                (weights["fc_{0}/kernel".format(i)], weights["fc_{0}/bias".format(i)])
+            )
+            i += 1
+        if use_lstm:
+            self.lstm_kernel = weights["lstm/kernel"]
+            self.lstm_recurrent_kernel = weights["lstm/recurrent_kernel"]
+            self.lstm_bias = weights["lstm/bias"]
+        self.logits_kernel = weights["logits/kernel"]
+        self.logits_bias = weights["logits/bias"]
+
+    def __call__(self, obs_batch, states):
+        x = np.asarray(obs_batch, dtype=np.float32)
+        for kernel, bias in self.hidden_layers:
+            x = np.maximum(x @ kernel + bias, 0.0)
+        if self.use_lstm:
+            h, c = [np.asarray(state, dtype=np.float32) for state in states]
+            z = x @ self.lstm_kernel + h @ self.lstm_recurrent_kernel + self.lstm_bias
+            z_i, z_f, z_c, z_o = np.split(z, 4, axis=1)
+            c = _sigmoid(z_f) * c + _sigmoid(z_i) * np.tanh(z_c)
+            h = _sigmoid(z_o) * np.tanh(c)
+            x, states = h, [h, c]
+        else:
+            states = []
+        return x @ self.logits_kernel + self.logits_bias, states
+
+
+###########################
+# TensorFlow forward pass #
+###########################
+
+
+def compile_bc_forward(model, bc_params):
+    """
+    Returns the forward pass of a keras BC model as a tf.function, traced once
+    with a variable batch size. Falls back to Model.predict when eager execution
+    is disabled (e.g. by build_bc_model with eager=False, or rllib), as graph
+    mode tensors can't be fetched as NumPy arrays
+    """
+    import tensorflow as tf
+
+    if not tf.executing_eagerly():
+        return keras_bc_forward(model, bc_params)
+
+    obs_spec = tf.TensorSpec((None, *bc_params["observation_shape"]), tf.float32)
+    if not bc_params["use_lstm"]:
+        call = tf.function(
+            lambda obs: model(obs, training=False), input_signature=[obs_spec]
+        )
+
+        def forward(obs_batch, states):
+            return call(np.asarray(obs_batch, dtype=np.float32)).numpy(), []
+
+        return forward
+
+    state_spec = tf.TensorSpec((None, bc_params["cell_size"]), tf.float32)
+
+    @tf.function(input_signature=[obs_spec, state_spec, state_spec])
+    def call(obs, h, c):
+        seq_lens = tf.ones(tf.shape(obs)[:1], dtype=tf.int32)
+        logits, h_out, c_out = model(
+            [tf.expand_dims(obs, 1), seq_lens, h, c], training=False
+        )
+        return logits[:, 0], h_out, c_out
+
+    def forward(obs_batch, states):
+        logits, h, c = call(
+            np.asarray(obs_batch, dtype=np.float32),
+            *[np.asarray(state, dtype=np.float32) for state in states],
+        )
+        return logits.numpy(), [h.numpy(), c.numpy()]
+
+    return forward
+
+
+def keras_bc_forward(model, bc_params):
+    """Returns the forward pass of a keras BC model through Model.predict"""
+
+    def forward(obs_batch, states):
+        if bc_params["use_lstm"]:
+            obs_batch = np.expand_dims(obs_batch, 1)
+            seq_lens = np.ones(len(obs_batch))
+            model_out = model.predict([obs_batch, seq_lens] + list(states), verbose=0)
+            logits, states = model_out[0], model_out[1:]
+            return logits.reshape((logits.shape[0], -1)), states
+        return model.predict(obs_batch, verbose=0), []
+
+    return forward
+
+
+##################
+# Micro-batching #
+##################
+
+
+class MicroBatcher(object):
+    """
+    Thread-safe wrapper of a forward pass that merges concurrent calls.
+
+    Calls are queued and a background thread runs the forward pass on up to
+    max_batch_size queued rows at a time, waiting at most max_batch_wait
+    seconds after the first queued call for more calls to join the batch.
+    Every call blocks until its own rows are computed, errors of the forward
+    pass are raised in every call of the batch. The background thread only
+    holds the batcher while it computes a batch, and stops once the batcher is
+    garbage collected.
+    """
+
+    # Seconds the background thread waits for a call before checking that the
+    # batcher is still alive
+    idle_timeout = 1.0
+
+    def __init__(self, forward, max_batch_wait=0.002, max_batch_size=256):
+        self.forward = forward
+        self.max_batch_wait = max_batch_wait
+        self.max_batch_size = max_batch_size
+        self._requests = []
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=MicroBatcher._run,
+            args=(
+                weakref.ref(self),
+                self._condition,
+                self._requests,
+                max_batch_wait,
+                max_batch_size,
+            ),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def __call__(self, obs_batch, states):
+        request = {
+            "obs": np.asarray(obs_batch),
+            "states": list(states),
+            "done": threading.Event(),
+        }
+        with self._condition:
+            self._requests.append(request)
+            self._condition.notify()
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["logits"], request["states_out"]
+
+    @staticmethod
+    def _run(batcher_ref, condition, requests, max_batch_wait, max_batch_size):
+        while batcher_ref() is not None:
+            batch = MicroBatcher._next_batch(
+                condition, requests, max_batch_wait, max_batch_size
+            )
+            if batch:
+                # callers hold the batcher until their batch is computed
+                batcher_ref()._compute(batch)
+
+    @staticmethod
+    def _next_batch(condition, requests, max_batch_wait, max_batch_size):
+        """Next batch of queued calls, [] if none was queued for idle_timeout"""
+        with condition:
+            if not requests:
+                condition.wait(MicroBatcher.idle_timeout)
+                if not requests:
+                    return []
+            deadline = time.monotonic() + max_batch_wait
+            while sum(len(request["obs"]) for request in requests) < max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                condition.wait(remaining)
+            batch, num_rows = [], 0
+            while requests and (
+                not batch or num_rows + len(requests[0]["obs"]) <= max_batch_size
+            ):
+                request = requests.pop(0)
+                batch.append(request)
+                num_rows += len(request["obs"])
+            return batch
+
+    def _compute(self, batch):
+        try:
+            logits, states = self.forward(
+                np.concatenate([request["obs"] for request in batch]),
+                [
+                    np.concatenate([request["states"][i] for request in batch])
+                    for i in range(len(batch[0]["states"]))
+                ],
+            )
+            start = 0
+            for request in batch:
+                end = start + len(request["obs"])
+                request["logits"] = logits[start:end]
+                request["states_out"] = [state[start:end] for state in states]
+                start = end
+        except Exception as e:
+            for request in batch:
+                request["error"] = e
+        for request in batch:
+            request["done"].set()
+
+
+def get_bc_forward(
+    model, bc_params, inference="tf_function", max_batch_wait=0, model_dir=None
+):
+    """
+    Returns the forward pass of a BC model, built once per model object (or per
+    saved model with model_dir), inference mode and max_batch_wait. Forwards
+    are stored on the model and freed with it. "numpy" forwards copy the
+    weights when they are built, later training of the model isn't reflected.
+
+    model (keras.Model)         Model built by build_bc_model
+    bc_params (dict)            Parameters used to build the model
+    inference (str)             One of INFERENCE_MODES
+    max_batch_wait (float)      Seconds a call waits for concurrent calls to share its forward pass, 0 to not batch
+    model_dir (str)             Directory the model was loaded from with load_bc_model. Models loaded from the same
+                                directory then share one forward pass, until its model.keras is rewritten
+    """
+    if inference not in INFERENCE_MODES:
+        raise ValueError(
+            "inference must be one of {0}, not {1}".format(INFERENCE_MODES, inference)
+        )
+    key = (inference, max_batch_wait)
+    with _BC_FORWARDS_LOCK:
+        if model_dir is not None:
+            model_dir = os.path.abspath(model_dir)
+            stat = os.stat(os.path.join(model_dir, "model.keras"))
+            version = (stat.st_mtime_ns, stat.st_size)
+            dir_forwards = _BC_FORWARDS_BY_DIR.get(model_dir)
+            if dir_forwards is None or dir_forwards[0] != version:
+                # forwards of a previous model.keras are dropped
+                dir_forwards = (version, {})
+                _BC_FORWARDS_BY_DIR[model_dir] = dir_forwards
+            forwards = dir_forwards[1]
+        else:
+            forwards = model.__dict__.get(_BC_FORWARDS_ATTR)
+            if forwards is None:
+                forwards = {}
+                # set through __dict__ so that keras doesn't track the
+                # forwards as part of the model
+                model.__dict__[_BC_FORWARDS_ATTR] = forwards
+        if key not in forwards:
+            if inference == "tf_function":
+                forward = compile_bc_forward(model, bc_params)
+            elif inference == "keras":
+                forward = keras_bc_forward(model, bc_params)
+            else:
+                forward = NumpyBCForward(
+                    export_bc_weights(model, bc_params), bc_params["use_lstm"]
+                )
+            if max_batch_wait > 0:
+                forward = MicroBatcher(forward, max_batch_wait=max_batch_wait)
+            forwards[key] = forward
+        return forwards[key]
@@ -9,7 +9,12 @@ from tensorflow import keras
 
 from human_aware_rl.data_dir import DATA_DIR
 from human_aware_rl.human.process_dataframes import get_human_human_trajectories
-from human_aware_rl.rllib.rllib import evaluate, get_base_ae, softmax
+from human_aware_rl.imitation.bc_data_cache import (
+    BC_DATA_CACHE_DIR,
+    get_bc_data_cache,
+)
+from human_aware_rl.imitation.bc_inference import get_bc_forward, sample_actions
+from human_aware_rl.rllib.rllib import evaluate, get_base_ae
 from human_aware_rl.static import CLEAN_2019_HUMAN_DATA_TRAIN
 from human_aware_rl.utils import get_flattened_keys, recursive_dict_update
 from overcooked_ai_py.mdp.actions import Action
@@ -26,6 +31,9 @@ DEFAULT_DATA_PARAMS = {
     "check_trajectories": False,
     "featurize_states": True,
     "data_path": CLEAN_2019_HUMAN_DATA_TRAIN,
+    # Featurized data is cached there on first load (see bc_data_cache), None
+    # to convert the DataFrame on every load
+    "data_cache_dir": BC_DATA_CACHE_DIR,
 }
 
 DEFAULT_MLP_PARAMS = {
@@ -135,8 +143,15 @@ def _pad(sequences, maxlen=None, default=0):
 
 
 def load_data(bc_params, verbose=False):
+    data_params = dict(bc_params["data_params"])
+    data_cache_dir = data_params.pop("data_cache_dir", None)
+    if data_cache_dir and data_params["featurize_states"]:
+        # memory-mapped, not copied, unless padded for the lstm
+        cache = get_bc_data_cache(bc_params["data_params"], silent=not verbose)
+        return cache.load(use_lstm=bc_params["use_lstm"])
+
     processed_trajs = get_human_human_trajectories(
-        **bc_params["data_params"], silent=not verbose
+        **data_params, silent=not verbose
     )
     inputs, targets = (
         processed_trajs["ep_states"],
@@ -438,6 +453,9 @@ class BehaviorCloningPolicy(RllibPolicy):
             - bc_model (keras.Model)            Pointer to loaded policy model. Overrides model_dir
             - bc_params (dict)                  Dictionary of parameters used to train model. Required if "model" is present
             - eager (bool)                      Whether the model should run in eager (or graph) mode. Overrides bc_params['eager'] if present
+            - inference (str)                   How forward passes are run, one of bc_inference.INFERENCE_MODES (default "tf_function")
+            - max_batch_wait (float)            Seconds a forward pass waits for concurrent ones of policies sharing the model, to
+                                                run them as one batch. 0 (default) to not batch
         """
         super(BehaviorCloningPolicy, self).__init__(
             observation_space, action_space, config
@@ -449,11 +467,14 @@ class BehaviorCloningPolicy(RllibPolicy):
                 "model must be of type keras.Model"
             )
             model, bc_params = config["bc_model"], config["bc_params"]
+            model_dir = None
         else:
             assert "model_dir" in config, (
                 "must specify model directory if model not specified"
             )
-            model, bc_params = load_bc_model(config["model_dir"])
+            model_dir = config["model_dir"]
+            # policies loaded from the same directory share one forward pass
+            model, bc_params = load_bc_model(model_dir)
 
         self._setup_shapes()
 
@@ -465,6 +486,13 @@ class BehaviorCloningPolicy(RllibPolicy):
         self.stochastic = config["stochastic"]
         self.use_lstm = bc_params["use_lstm"]
         self.cell_size = bc_params["cell_size"]
+        self.forward = get_bc_forward(
+            model,
+            bc_params,
+            inference=config.get("inference", "tf_function"),
+            max_batch_wait=config.get("max_batch_wait", 0),
+            model_dir=model_dir,
+        )
 
     def _setup_shapes(self):
         # This is here to make the class compatible with both tuples or gymnasium.Space objs for the spaces
@@ -525,15 +553,9 @@ class BehaviorCloningPolicy(RllibPolicy):
 
         action_logits, states = self._forward(obs_batch, state_batches)
 
-        action_probs = softmax(action_logits)
         if self.stochastic:
-            # Sample according to action_probs for each row in the output
-            actions = np.array(
-                [
-                    np.random.choice(self.action_shape[0], p=action_probs[i])
-                    for i in range(len(action_probs))
-                ]
-            )
+            # Sample according to the softmax of each row of the output
+            actions = sample_actions(action_logits)
         else:
             actions = np.argmax(action_logits, axis=1)
 
@@ -580,14 +602,9 @@ class BehaviorCloningPolicy(RllibPolicy):
 
     def _forward(self, obs_batch, state_batches):
         if self.use_lstm:
-            obs_batch = np.expand_dims(obs_batch, 1)
-            seq_lens = np.ones(len(obs_batch))
-            model_out = self.model.predict([obs_batch, seq_lens] + state_batches)
-            logits, states = model_out[0], model_out[1:]
-            logits = logits.reshape((logits.shape[0], -1))
-            return logits, states
+            return self.forward(obs_batch, state_batches)
         else:
-            return self.model.predict(obs_batch, verbose=0), []
+            return self.forward(obs_batch, [])
 
 
 if __name__ == "__main__":
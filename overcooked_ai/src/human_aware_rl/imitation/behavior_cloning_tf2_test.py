@@ -4,9 +4,11 @@ import os
 import pickle
 import shutil
 import sys
+import threading
 import time
 import unittest
 import warnings
+import weakref
 
 import numpy as np
 import tensorflow as tf
@@ -15,11 +17,18 @@ import sys
 sys.path.append('/media/yujin/AI611/overcooked_ai/src/')
 
 from human_aware_rl.human.process_dataframes import get_trajs_from_data
+from human_aware_rl.imitation.bc_data_cache import (
+    BCDataCache,
+    build_bc_data_cache,
+)
+from human_aware_rl.imitation.bc_inference import get_bc_forward, sample_actions
 from human_aware_rl.imitation.behavior_cloning_tf2 import (
     BC_SAVE_DIR,
+    BehaviorCloningPolicy,
     build_bc_model,
     evaluate_bc_model,
     get_bc_params,
+    load_data,
     load_bc_model,
     save_bc_model,
     train_bc_model,
@@ -142,6 +151,126 @@ class TestBCTraining(unittest.TestCase):
                 np.allclose(model(self.dummy_input), self.expected["test_training"])
             )
 
+    def test_data_cache(self):
+        cache_dir = os.path.join(self.model_dir, "data_cache")
+        for use_lstm in [False, True]:
+            self.bc_params["use_lstm"] = use_lstm
+            self.bc_params["data_params"]["data_cache_dir"] = None
+            expected = load_data(self.bc_params)
+            self.bc_params["data_params"]["data_cache_dir"] = cache_dir
+            # built on the first load, read back on the second
+            for _ in range(2):
+                inputs, seq_lens, targets = load_data(self.bc_params)
+                self.assertTrue(np.array_equal(inputs, expected[0]))
+                self.assertTrue(np.array_equal(targets, expected[2]))
+                if use_lstm:
+                    self.assertTrue(np.array_equal(seq_lens, expected[1]))
+                else:
+                    self.assertIsNone(seq_lens)
+
+        # Episodes split over several shards load the same
+        sharded_cache = BCDataCache(
+            build_bc_data_cache(
+                cache_dir=os.path.join(self.model_dir, "sharded_cache"),
+                shard_size=100,
+                **self.bc_params["data_params"]
+            )
+        )
+        self.assertGreater(len(sharded_cache.index["shards"]), 1)
+        inputs, _, targets = sharded_cache.load(use_lstm=True)
+        self.assertTrue(np.array_equal(inputs, expected[0]))
+        self.assertTrue(np.array_equal(targets, expected[2]))
+
+    def test_inference(self):
+        model = build_bc_model(**self.bc_params)
+        self._check_inference(model)
+
+    def test_inference_cache(self):
+        model = build_bc_model(**self.bc_params)
+        forward = get_bc_forward(model, self.bc_params, inference="numpy")
+        self.assertIs(forward, get_bc_forward(model, self.bc_params, inference="numpy"))
+        # forwards are freed with their model
+        model_ref = weakref.ref(model)
+        del model, forward
+        gc.collect()
+        self.assertIsNone(model_ref())
+
+        # policies loaded from one directory share a forward until it is rewritten
+        model = build_bc_model(**self.bc_params)
+        save_bc_model(self.model_dir, model, self.bc_params)
+        config = {"model_dir": self.model_dir, "stochastic": False}
+        shape = (self.bc_params["observation_shape"], self.bc_params["action_shape"])
+        policy = BehaviorCloningPolicy(*shape, config)
+        self.assertIs(policy.forward, BehaviorCloningPolicy(*shape, config).forward)
+        new_model = build_bc_model(**self.bc_params)
+        time.sleep(0.01)
+        save_bc_model(self.model_dir, new_model, self.bc_params)
+        new_policy = BehaviorCloningPolicy(*shape, config)
+        self.assertIsNot(policy.forward, new_policy.forward)
+        _, _, infos = new_policy.compute_actions(self.dummy_input)
+        self.assertTrue(
+            np.allclose(
+                infos["action_dist_inputs"], new_model(self.dummy_input), atol=1e-5
+            )
+        )
+
+    def test_sample_actions(self):
+        probs = np.array([[0.1, 0.2, 0.7, 0.0, 0.0, 0.0]] * 10000)
+        with np.errstate(divide="ignore"):
+            actions = sample_actions(np.log(probs))
+        frequencies = np.bincount(actions, minlength=6) / len(actions)
+        self.assertTrue(np.allclose(frequencies, probs[0], atol=0.02))
+
+    def _check_inference(self, model):
+        obs_batch = np.repeat(self.dummy_input, 8, axis=0)
+        obs_batch = obs_batch + np.random.normal(size=obs_batch.shape)
+        if self.bc_params["use_lstm"]:
+            states = [
+                np.random.normal(size=(len(obs_batch), self.bc_params["cell_size"]))
+                for _ in range(2)
+            ]
+        else:
+            states = []
+        expected_logits, expected_states = get_bc_forward(
+            model, self.bc_params, inference="keras"
+        )(obs_batch, states)
+
+        for inference in ["tf_function", "numpy"]:
+            logits, states_out = get_bc_forward(
+                model, self.bc_params, inference=inference
+            )(obs_batch, states)
+            self.assertTrue(np.allclose(logits, expected_logits, atol=1e-5))
+            for state, expected_state in zip(states_out, expected_states):
+                self.assertTrue(np.allclose(state, expected_state, atol=1e-5))
+
+        # Concurrent single observations are batched together
+        forward = get_bc_forward(
+            model, self.bc_params, inference="numpy", max_batch_wait=0.01
+        )
+        results = [None] * len(obs_batch)
+
+        def run(i):
+            results[i] = forward(obs_batch[i : i + 1], [s[i : i + 1] for s in states])
+
+        threads = [
+            threading.Thread(target=run, args=(i,)) for i in range(len(obs_batch))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logits = np.concatenate([result[0] for result in results])
+        self.assertTrue(np.allclose(logits, expected_logits, atol=1e-5))
+
+        policy = BehaviorCloningPolicy.from_model(model, self.bc_params)
+        actions, _, infos = policy.compute_actions(
+            obs_batch, states if self.bc_params["use_lstm"] else None
+        )
+        self.assertEqual(actions.shape, (len(obs_batch),))
+        self.assertTrue(
+            np.allclose(infos["action_dist_inputs"], expected_logits, atol=1e-5)
+        )
+
     def test_agent_evaluation(self):
         self.bc_params["training_params"]["epochs"] = 20
         model = train_bc_model(self.model_dir, self.bc_params)
@@ -213,6 +342,11 @@ class TestBCTrainingLSTM(TestBCTraining):
             )
         )
 
+    def test_lstm_inference(self):
+        self.bc_params["use_lstm"] = True
+        model = build_bc_model(**self.bc_params)
+        self._check_inference(model)
+
     def _lstm_forward(self, model, obs_batch, states=None):
         obs_batch = np.expand_dims(obs_batch, 1)
         seq_lens = np.ones(len(obs_batch))
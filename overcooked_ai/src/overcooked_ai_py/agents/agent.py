@@ -7,7 +7,7 @@ import dill
 import numpy as np
 
 from overcooked_ai_py.mdp.actions import Action
-from overcooked_ai_py.mdp.overcooked_mdp import Recipe
+from overcooked_ai_py.mdp.overcooked_mdp import CompactOvercookedState, Recipe
 from overcooked_ai_py.utils import OvercookedException
 
 
@@ -382,10 +382,12 @@ class GreedyHumanModel(Agent):
                 else:
                     raise ValueError("Player index not recognized")
 
+                # Compact states avoid a full deepcopy of state per joint action
+                compact_state = CompactOvercookedState.from_state(state)
                 unblocking_joint_actions = []
                 for j_a in joint_actions:
                     new_state, _ = self.mlam.mdp.get_state_transition(
-                        state, j_a
+                        compact_state, j_a
                     )
                     if (
                         new_state.player_positions
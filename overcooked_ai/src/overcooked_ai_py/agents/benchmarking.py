@@ -1,4 +1,6 @@
 import copy
+import multiprocessing
+import os
 
 import numpy as np
 
@@ -11,8 +13,10 @@ from overcooked_ai_py.mdp.layout_generator import LayoutGenerator
 from overcooked_ai_py.mdp.overcooked_env import OvercookedEnv
 from overcooked_ai_py.mdp.overcooked_mdp import (
     Action,
+    CompactOvercookedState,
     OvercookedGridworld,
     OvercookedState,
+    Recipe,
 )
 from overcooked_ai_py.mdp.overcooked_trajectory import DEFAULT_TRAJ_KEYS
 from overcooked_ai_py.planning.planners import NO_COUNTERS_PARAMS
@@ -28,6 +32,62 @@ from overcooked_ai_py.utils import (
     take_indexes_from_dict,
 )
 
+# Modes of the dynamics check of AgentEvaluator.check_trajectories:
+# - "off": no check
+# - "sampled": replay num_samples random transitions of every episode
+# - "full": replay every transition
+# - "full_parallel": replay every transition, episodes spread over processes
+CHECK_DYNAMICS_MODES = ("off", "sampled", "full", "full_parallel")
+
+
+def check_episode_dynamics(env, states, actions, rewards, transitions=None):
+    """
+    Replays transitions of an episode on the mdp of env and asserts that they
+    lead to the recorded next states and rewards.
+
+    transitions (list): indices i of the transitions states[i] -> states[i + 1]
+        to replay, all of them if None
+    """
+    assert (
+        len(states) == len(actions) == len(rewards)
+    ), "# states {}\t# actions {}\t# rewards {}".format(
+        len(states), len(actions), len(rewards)
+    )
+    if transitions is None:
+        transitions = range(len(states) - 1)
+    # Compact states are replayed directly on the mdp, which avoids
+    # deep-copying every recorded state
+    compact_states = {}
+
+    def compact_state(i):
+        if i not in compact_states:
+            compact_states[i] = CompactOvercookedState.from_state(states[i])
+        return compact_states[i]
+
+    for i in transitions:
+        next_state, mdp_infos = env.mdp.get_state_transition(
+            compact_state(i), actions[i]
+        )
+        reward = sum(mdp_infos["sparse_reward_by_agent"])
+        expected_state = compact_state(i + 1)
+
+        assert (
+            expected_state.fingerprint() == next_state.fingerprint()
+            or expected_state == next_state
+        ), "States differed (expected vs actual): {}\n\nexpected dict: \t{}\nactual dict: \t{}".format(
+            env.display_states(states[i + 1], next_state.to_state()),
+            states[i + 1].to_dict(),
+            next_state.to_dict(),
+        )
+        assert rewards[i] == reward, "{} \t {}".format(rewards[i], reward)
+
+
+def _check_episode_dynamics_job(job):
+    mdp_params, env_params, states, actions, rewards, transitions = job
+    mdp = OvercookedGridworld.from_layout_name(**mdp_params)
+    env = OvercookedEnv.from_mdp(mdp, **env_params)
+    check_episode_dynamics(env, states, actions, rewards, transitions)
+
 
 class AgentEvaluator(object):
     """
@@ -322,16 +382,27 @@ class AgentEvaluator(object):
         return trajs_0, trajs_1
 
     @staticmethod
-    def check_trajectories(trajectories, from_json=False, **kwargs):
+    def check_trajectories(
+        trajectories, from_json=False, check_dynamics="off", **kwargs
+    ):
         """
-        Checks that of trajectories are in standard format and are consistent with dynamics of mdp.
+        Checks that of trajectories are in standard format and, unless check_dynamics is "off", are consistent with
+        dynamics of mdp (see CHECK_DYNAMICS_MODES and _check_trajectories_dynamics for the kwargs).
         If the trajectories were saves as json, do not check that they have standard traj keys.
         """
+        if check_dynamics not in CHECK_DYNAMICS_MODES:
+            raise ValueError(
+                "check_dynamics must be one of {}, not {}".format(
+                    CHECK_DYNAMICS_MODES, check_dynamics
+                )
+            )
         if not from_json:
             AgentEvaluator._check_standard_traj_keys(set(trajectories.keys()))
         AgentEvaluator._check_right_types(trajectories)
-        # TODO: add this back in
-        # AgentEvaluator._check_trajectories_dynamics(trajectories, **kwargs)
+        if check_dynamics != "off":
+            AgentEvaluator._check_trajectories_dynamics(
+                trajectories, mode=check_dynamics, **kwargs
+            )
         # TODO: Check shapes?
 
     @staticmethod
@@ -363,7 +434,20 @@ class AgentEvaluator(object):
             # TODO: check that are all lists
 
     @staticmethod
-    def _check_trajectories_dynamics(trajectories, verbose=True):
+    def _check_trajectories_dynamics(
+        trajectories,
+        verbose=True,
+        mode="full",
+        num_samples=10,
+        num_processes=None,
+        seed=None,
+    ):
+        """
+        mode (str): "sampled", "full" or "full_parallel", see CHECK_DYNAMICS_MODES
+        num_samples (int): number of transitions replayed per episode in "sampled" mode
+        num_processes (int): number of processes in "full_parallel" mode, None for one per cpu
+        seed (int): seed of the choice of sampled transitions
+        """
         if any(
             env_params["num_mdp"] > 1
             for env_params in trajectories["env_params"]
@@ -375,43 +459,61 @@ class AgentEvaluator(object):
                 )
             return
 
-        _, envs = AgentEvaluator.get_mdps_and_envs_from_trajectories(
-            trajectories
-        )
+        rng = np.random.RandomState(seed)
+        transitions = []
+        for states in trajectories["ep_states"]:
+            num_transitions = max(len(states) - 1, 0)
+            if mode == "sampled" and num_transitions > num_samples:
+                transitions.append(
+                    np.sort(
+                        rng.choice(num_transitions, num_samples, replace=False)
+                    )
+                )
+            else:
+                transitions.append(None)
+
+        num_episodes = len(trajectories["ep_states"])
+        if num_processes is None:
+            num_processes = os.cpu_count() or 1
+        num_processes = min(num_processes, num_episodes)
+        if mode != "full_parallel" or num_processes <= 1:
+            _, envs = AgentEvaluator.get_mdps_and_envs_from_trajectories(
+                trajectories
+            )
+            for idx in range(num_episodes):
+                check_episode_dynamics(
+                    envs[idx],
+                    trajectories["ep_states"][idx],
+                    trajectories["ep_actions"][idx],
+                    trajectories["ep_rewards"][idx],
+                    transitions[idx],
+                )
+            return
 
-        for idx in range(len(trajectories["ep_states"])):
-            states, actions, rewards = (
+        jobs = [
+            (
+                trajectories["mdp_params"][idx],
+                trajectories["env_params"][idx],
                 trajectories["ep_states"][idx],
                 trajectories["ep_actions"][idx],
                 trajectories["ep_rewards"][idx],
+                transitions[idx],
             )
-            simulation_env = envs[idx]
-
-            assert (
-                len(states) == len(actions) == len(rewards)
-            ), "# states {}\t# actions {}\t# rewards {}".format(
-                len(states), len(actions), len(rewards)
-            )
-
-            # Checking that actions would give rise to same behaviour in current MDP
-            for i in range(len(states) - 1):
-                curr_state = states[i]
-                simulation_env.state = curr_state
-
-                next_state, reward, done, info = simulation_env.step(
-                    actions[i]
-                )
-
-                assert (
-                    states[i + 1] == next_state
-                ), "States differed (expected vs actual): {}\n\nexpected dict: \t{}\nactual dict: \t{}".format(
-                    simulation_env.display_states(states[i + 1], next_state),
-                    states[i + 1].to_dict(),
-                    next_state.to_dict(),
-                )
-                assert rewards[i] == reward, "{} \t {}".format(
-                    rewards[i], reward
-                )
+            for idx in range(num_episodes)
+        ]
+        # Spawned processes start unconfigured, and recorded states hold
+        # recipes that can only be unpickled once recipes are configured
+        pool = multiprocessing.get_context("spawn").Pool(
+            num_processes,
+            initializer=Recipe.configure,
+            initargs=(Recipe.configuration,),
+        )
+        try:
+            # the first failed episode re-raises its AssertionError here
+            pool.map(_check_episode_dynamics_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
 
     @staticmethod
     def get_mdps_and_envs_from_trajectories(trajectories):
@@ -0,0 +1,193 @@
+import json
+import mmap
+import os
+import tempfile
+
+from overcooked_ai_py.static import (
+    LAYOUT_STORE_PATH,
+    LAYOUTS_DIR,
+    LAYOUTS_M_DIR,
+)
+from overcooked_ai_py.utils import layout_path, load_dict_from_file
+
+LAYOUT_STORE_VERSION = 1
+
+
+class LayoutStore(object):
+    """
+    Parsed and validated .layout files, compiled into a single JSON-lines file
+    so that looking a layout up by name is a slice of a memory-mapped file and
+    a json.loads instead of an eval of the whole .layout text.
+
+    The first line of the file is the index
+        {"version": ..., "layouts": {name: [source path, source mtime_ns,
+                                            source size, offset, length]}}
+    with offsets relative to the end of the index line. Every other line is
+    the record of a layout
+        {"grid": [row, ...], "valid": bool, "params": {...}}
+    where grid is cleaned like in OvercookedGridworld.from_layout_name, valid
+    tells if it passed validate_grid and params are the rest of the layout
+    dict.
+
+    Every lookup compares the mtime and size of the source file with the
+    index, the store is recompiled when a source changed or a layout is
+    missing. Recompiling copies the records of unchanged layouts and replaces
+    the file atomically, so processes that still map the old file keep
+    reading consistent data; the recompiled store itself is kept in memory by
+    the process that compiled it.
+    """
+
+    def __init__(
+        self,
+        store_path=LAYOUT_STORE_PATH,
+        layouts_dirs=(LAYOUTS_DIR, LAYOUTS_M_DIR),
+        validate_grid=None,
+    ):
+        """
+        store_path: path of the compiled store file
+        layouts_dirs: directories whose .layout files are compiled into the
+            store. Layout names are resolved to files with utils.layout_path,
+            unless that file is outside layouts_dirs and one of them has a
+            file of that name
+        validate_grid: function raising an AssertionError for an invalid grid,
+            if None no grid is marked as valid
+        """
+        self.store_path = store_path
+        self.layouts_dirs = layouts_dirs
+        self.validate_grid = validate_grid
+        self._index = None
+        self._buffer = None
+        self._records_start = 0
+
+    def read(self, layout_name):
+        """
+        Returns the record of the layout as a new dict with keys "grid",
+        "valid" and "params", raises the same errors as reading the .layout
+        file if it doesn't exist or can't be parsed
+        """
+        source_path = self._source_path(layout_name)
+        source_stat = os.stat(source_path)
+        if self._index is None:
+            self._load()
+        entry = self._index.get(layout_name)
+        if entry is None or entry[:3] != [
+            source_path,
+            source_stat.st_mtime_ns,
+            source_stat.st_size,
+        ]:
+            self.compile(extra_layout_names=[layout_name])
+            entry = self._index.get(layout_name)
+            if entry is None:
+                # source couldn't be compiled, compiling it again raises the
+                # error of reading it
+                return json.loads(self._compile_record(source_path))
+        offset = self._records_start + entry[3]
+        return json.loads(self._buffer[offset : offset + entry[4]])
+
+    def compile(self, extra_layout_names=()):
+        """
+        (Re)compiles the store from the .layout files of layouts_dirs and of
+        extra_layout_names, only layouts whose source changed are parsed again
+        """
+        if self._index is None:
+            self._load()
+        layout_names = set(extra_layout_names)
+        for layouts_dir in self.layouts_dirs:
+            layout_names.update(
+                filename[: -len(".layout")]
+                for filename in os.listdir(layouts_dir)
+                if filename.endswith(".layout")
+            )
+
+        index, records, offset = {}, [], 0
+        for layout_name in sorted(layout_names):
+            source_path = self._source_path(layout_name)
+            try:
+                source_stat = os.stat(source_path)
+            except FileNotFoundError:
+                continue
+            entry = [source_path, source_stat.st_mtime_ns, source_stat.st_size]
+            old_entry = self._index.get(layout_name)
+            if old_entry is not None and old_entry[:3] == entry:
+                old_offset = self._records_start + old_entry[3]
+                record = self._buffer[old_offset : old_offset + old_entry[4]]
+            else:
+                try:
+                    record = self._compile_record(source_path)
+                except Exception:
+                    # not indexed, the error is raised when it is read
+                    continue
+            index[layout_name] = entry + [offset, len(record)]
+            records.append(record)
+            offset += len(record)
+
+        header = (
+            json.dumps({"version": LAYOUT_STORE_VERSION, "layouts": index})
+            + "\n"
+        ).encode()
+        self._set_buffer(header + b"".join(records), index, len(header))
+        self._save()
+
+    def _source_path(self, layout_name):
+        source_path = layout_path(layout_name)
+        layouts_dirs = [os.path.abspath(d) for d in self.layouts_dirs]
+        if os.path.dirname(os.path.abspath(source_path)) in layouts_dirs:
+            return source_path
+        for layouts_dir in layouts_dirs:
+            path = os.path.join(layouts_dir, layout_name + ".layout")
+            if os.path.exists(path):
+                return path
+        return source_path
+
+    def _compile_record(self, source_path):
+        layout_dict = load_dict_from_file(source_path)
+        grid = [
+            layout_row.strip()
+            for layout_row in layout_dict.pop("grid").split("\n")
+        ]
+        valid = False
+        if self.validate_grid is not None:
+            try:
+                self.validate_grid(grid)
+                valid = True
+            except AssertionError:
+                pass
+        record = {"grid": grid, "valid": valid, "params": layout_dict}
+        return (json.dumps(record) + "\n").encode()
+
+    def _set_buffer(self, buffer, index, records_start):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = buffer
+        self._index = index
+        self._records_start = records_start
+
+    def _load(self):
+        """Maps the store file, an empty store if it is missing or outdated"""
+        self._set_buffer(b"", {}, 0)
+        try:
+            with open(self.store_path, "rb") as f:
+                header = json.loads(f.readline())
+                if header["version"] != LAYOUT_STORE_VERSION:
+                    return
+                records_start = f.tell()
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self._set_buffer(buffer, header["layouts"], records_start)
+
+    def _save(self):
+        """Writes the compiled store atomically, the store stays in memory"""
+        store_dir = os.path.dirname(os.path.abspath(self.store_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._buffer)
+            # mkstemp creates the file readable only by its owner
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.store_path)
+        except OSError:
+            os.remove(tmp_path)
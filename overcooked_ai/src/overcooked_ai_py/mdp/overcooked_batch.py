@@ -0,0 +1,599 @@
+import itertools
+
+import numpy as np
+
+from overcooked_ai_py.mdp.actions import Action, Direction
+from overcooked_ai_py.mdp.overcooked_mdp import (
+    ObjectState,
+    OvercookedState,
+    PlayerState,
+    Recipe,
+    SoupState,
+)
+
+# Integer codes used for objects, both on the grid and held by players.
+# Ingredient codes double as the codes stored in a soup's ingredient slots.
+EMPTY, ONION, TOMATO, DISH, SOUP = 0, 1, 2, 3, 4
+OBJECT_CODES = {
+    Recipe.ONION: ONION,
+    Recipe.TOMATO: TOMATO,
+    "dish": DISH,
+    "soup": SOUP,
+}
+OBJECT_NAMES = {code: name for name, code in OBJECT_CODES.items()}
+
+INTERACT_INDEX = Action.ACTION_TO_INDEX[Action.INTERACT]
+
+
+class BatchOvercookedState(object):
+    """
+    B OvercookedStates of the same layout, stored as NumPy arrays.
+
+    Cells are indexed by their flat grid index `y * width + x`.
+
+    player_positions (B, num_players):       flat cell index of each player
+    player_orientations (B, num_players):    Direction index of each player
+    held_objects (B, num_players):           object code held by each player
+    held_ingredients (B, num_players, I):    ingredient codes of held soups
+    held_cooking_ticks (B, num_players):     cooking tick of held soups
+    objects (B, num_cells):                  object code lying on each cell
+    ingredients (B, num_cells, I):           ingredient codes of soups on cells
+    cooking_ticks (B, num_cells):            cooking tick of soups on cells
+    timesteps (B,):                          timestep of each game
+
+    where I is Recipe.MAX_NUM_INGREDIENTS. Ingredient slots are filled in the
+    order the ingredients were added, unused slots hold EMPTY and non-soup
+    slots always have a cooking tick of -1.
+
+    Orders never change during a game, so they are shared by the whole batch.
+    """
+
+    def __init__(
+        self,
+        player_positions,
+        player_orientations,
+        held_objects,
+        held_ingredients,
+        held_cooking_ticks,
+        objects,
+        ingredients,
+        cooking_ticks,
+        timesteps,
+        bonus_orders=[],
+        all_orders=[],
+    ):
+        self.player_positions = player_positions
+        self.player_orientations = player_orientations
+        self.held_objects = held_objects
+        self.held_ingredients = held_ingredients
+        self.held_cooking_ticks = held_cooking_ticks
+        self.objects = objects
+        self.ingredients = ingredients
+        self.cooking_ticks = cooking_ticks
+        self.timesteps = timesteps
+        self.bonus_orders = bonus_orders
+        self.all_orders = all_orders
+
+    @property
+    def num_games(self):
+        return len(self.timesteps)
+
+    @property
+    def num_players(self):
+        return self.player_positions.shape[1]
+
+    def copy(self):
+        return BatchOvercookedState(
+            self.player_positions.copy(),
+            self.player_orientations.copy(),
+            self.held_objects.copy(),
+            self.held_ingredients.copy(),
+            self.held_cooking_ticks.copy(),
+            self.objects.copy(),
+            self.ingredients.copy(),
+            self.cooking_ticks.copy(),
+            self.timesteps.copy(),
+            self.bonus_orders,
+            self.all_orders,
+        )
+
+    def __getitem__(self, idx):
+        """Returns the sub-batch of games selected by `idx`"""
+        idx = np.atleast_1d(np.arange(self.num_games)[idx])
+        return BatchOvercookedState(
+            self.player_positions[idx],
+            self.player_orientations[idx],
+            self.held_objects[idx],
+            self.held_ingredients[idx],
+            self.held_cooking_ticks[idx],
+            self.objects[idx],
+            self.ingredients[idx],
+            self.cooking_ticks[idx],
+            self.timesteps[idx],
+            self.bonus_orders,
+            self.all_orders,
+        )
+
+    def __len__(self):
+        return self.num_games
+
+
+class BatchOvercookedGridworld(object):
+    """
+    Steps B games of a single OvercookedGridworld layout at once.
+
+    The dynamics are the same as OvercookedGridworld.get_state_transition
+    (including `old_dynamics`): interacts are resolved player by player,
+    then movement and collisions, then environment effects. Each of these
+    phases is vectorized across the batch.
+
+    Like OvercookedGridworld, an instance has no state: all the per-layout
+    lookup tables are computed once in the constructor. Recipe times and
+    values are read from the Recipe configuration that is active at
+    construction time.
+
+    NOTE: event infos are not computed, only the sparse and shaped rewards.
+    """
+
+    def __init__(self, mdp):
+        self.mdp = mdp
+        self.num_players = mdp.num_players
+        self.width, self.height = mdp.width, mdp.height
+        self.num_cells = self.width * self.height
+        self.max_num_ingredients = Recipe.MAX_NUM_INGREDIENTS
+        self.old_dynamics = mdp.old_dynamics
+
+        terrain = np.array(mdp.terrain_mtx).reshape(-1)
+        self._is_walkable = terrain == " "
+        self._is_counter = terrain == "X"
+        self._terrain_masks = {
+            t: terrain == t for t in ["X", "O", "T", "D", "P", "S"]
+        }
+
+        # Cell faced by a player in each cell and with each orientation
+        cells = np.arange(self.num_cells)
+        xs, ys = cells % self.width, cells // self.width
+        self._facing_cell = np.zeros((self.num_cells, 4), dtype=np.int64)
+        for d_idx, (dx, dy) in enumerate(Direction.INDEX_TO_DIRECTION):
+            fx = np.clip(xs + dx, 0, self.width - 1)
+            fy = np.clip(ys + dy, 0, self.height - 1)
+            self._facing_cell[:, d_idx] = fy * self.width + fx
+
+        # Cell reached by each action from each cell, ignoring collisions
+        self._successor_cell = np.tile(cells[:, None], (1, Action.NUM_ACTIONS))
+        for d_idx in range(len(Direction.INDEX_TO_DIRECTION)):
+            target = self._facing_cell[:, d_idx]
+            a_idx = Action.ACTION_TO_INDEX[Direction.INDEX_TO_DIRECTION[d_idx]]
+            self._successor_cell[:, a_idx] = np.where(
+                self._is_walkable[target], target, cells
+            )
+
+        # Cook times indexed by (num onions, num tomatoes)
+        n = self.max_num_ingredients
+        self._cook_times = np.zeros((n + 1, n + 1), dtype=np.int64)
+        for recipe, (num_onions, num_tomatoes) in self._all_recipes():
+            self._cook_times[num_onions, num_tomatoes] = recipe.time
+        self._recipe_values_cache = {}
+
+        rew_params = mdp.reward_shaping_params
+        self._dish_pickup_rew = rew_params["DISH_PICKUP_REWARD"]
+        self._soup_pickup_rew = rew_params["SOUP_PICKUP_REWARD"]
+        self._placement_in_pot_rew = rew_params["PLACEMENT_IN_POT_REW"]
+        self._shaped_reward_dtype = np.result_type(
+            self._dish_pickup_rew,
+            self._soup_pickup_rew,
+            self._placement_in_pot_rew,
+        )
+
+    def _all_recipes(self):
+        n = self.max_num_ingredients
+        for num_onions in range(n + 1):
+            for num_tomatoes in range(n + 1 - num_onions):
+                if num_onions + num_tomatoes == 0:
+                    continue
+                ingredients = [Recipe.ONION] * num_onions + [
+                    Recipe.TOMATO
+                ] * num_tomatoes
+                yield Recipe(ingredients), (num_onions, num_tomatoes)
+
+    def _recipe_values(self, state):
+        """Delivery values indexed by (num onions, num tomatoes) for the orders of `state`"""
+        key = (
+            tuple(tuple(o["ingredients"]) for o in state.bonus_orders),
+            tuple(tuple(o["ingredients"]) for o in state.all_orders),
+        )
+        if key not in self._recipe_values_cache:
+            order_state = OvercookedState(
+                [],
+                {},
+                bonus_orders=state.bonus_orders,
+                all_orders=state.all_orders,
+            )
+            values = [
+                self.mdp.get_recipe_value(order_state, recipe)
+                for recipe, _ in self._all_recipes()
+            ]
+            n = self.max_num_ingredients
+            table = np.zeros((n + 1, n + 1), dtype=np.result_type(*values))
+            for value, (_, counts) in zip(values, self._all_recipes()):
+                table[counts] = value
+            self._recipe_values_cache[key] = table
+        return self._recipe_values_cache[key]
+
+    #########################
+    # STATE CONVERSION UTILS #
+    #########################
+
+    def _cell(self, pos):
+        x, y = pos
+        return y * self.width + x
+
+    def _pos(self, cell):
+        return (int(cell % self.width), int(cell // self.width))
+
+    def states_to_batch(self, states):
+        """Packs a list of OvercookedStates of this layout into a BatchOvercookedState"""
+        B, N, C = len(states), self.num_players, self.num_cells
+        I = self.max_num_ingredients
+        bonus_orders = [o.to_dict() for o in states[0].bonus_orders]
+        all_orders = [o.to_dict() for o in states[0].all_orders]
+
+        batch = BatchOvercookedState(
+            player_positions=np.zeros((B, N), dtype=np.int64),
+            player_orientations=np.zeros((B, N), dtype=np.int64),
+            held_objects=np.zeros((B, N), dtype=np.int64),
+            held_ingredients=np.zeros((B, N, I), dtype=np.int64),
+            held_cooking_ticks=np.full((B, N), -1, dtype=np.int64),
+            objects=np.zeros((B, C), dtype=np.int64),
+            ingredients=np.zeros((B, C, I), dtype=np.int64),
+            cooking_ticks=np.full((B, C), -1, dtype=np.int64),
+            timesteps=np.zeros(B, dtype=np.int64),
+            bonus_orders=bonus_orders,
+            all_orders=all_orders,
+        )
+        for b, state in enumerate(states):
+            assert len(state.players) == N, "Wrong number of players"
+            assert (
+                state.all_orders == states[0].all_orders
+                and state.bonus_orders == states[0].bonus_orders
+            ), "All states in a batch must share the same orders"
+            batch.timesteps[b] = state.timestep
+            for i, player in enumerate(state.players):
+                batch.player_positions[b, i] = self._cell(player.position)
+                batch.player_orientations[b, i] = Direction.DIRECTION_TO_INDEX[
+                    player.orientation
+                ]
+                if player.has_object():
+                    self._pack_object(
+                        player.get_object(),
+                        batch.held_objects[b],
+                        batch.held_ingredients[b],
+                        batch.held_cooking_ticks[b],
+                        i,
+                    )
+            for pos, obj in state.objects.items():
+                self._pack_object(
+                    obj,
+                    batch.objects[b],
+                    batch.ingredients[b],
+                    batch.cooking_ticks[b],
+                    self._cell(pos),
+                )
+        return batch
+
+    def _pack_object(self, obj, codes, ingredients, ticks, idx):
+        codes[idx] = OBJECT_CODES[obj.name]
+        if obj.name == "soup":
+            for slot, ingredient in enumerate(obj.ingredients):
+                ingredients[idx, slot] = OBJECT_CODES[ingredient]
+            ticks[idx] = obj._cooking_tick
+
+    def _unpack_object(self, code, ingredients, tick, pos):
+        name = OBJECT_NAMES[code]
+        if name != "soup":
+            return ObjectState(name, pos)
+        soup_ingredients = [
+            ObjectState(OBJECT_NAMES[i], pos) for i in ingredients if i
+        ]
+        return SoupState(pos, soup_ingredients, int(tick))
+
+    def batch_to_states(self, batch):
+        """Unpacks a BatchOvercookedState into a list of OvercookedStates"""
+        states = []
+        for b in range(batch.num_games):
+            players = []
+            for i in range(self.num_players):
+                pos = self._pos(batch.player_positions[b, i])
+                orientation = Direction.INDEX_TO_DIRECTION[
+                    batch.player_orientations[b, i]
+                ]
+                held_obj = None
+                if batch.held_objects[b, i] != EMPTY:
+                    held_obj = self._unpack_object(
+                        batch.held_objects[b, i],
+                        batch.held_ingredients[b, i],
+                        batch.held_cooking_ticks[b, i],
+                        pos,
+                    )
+                players.append(PlayerState(pos, orientation, held_obj))
+            objects = {}
+            for cell in np.flatnonzero(batch.objects[b]):
+                pos = self._pos(cell)
+                objects[pos] = self._unpack_object(
+                    batch.objects[b, cell],
+                    batch.ingredients[b, cell],
+                    batch.cooking_ticks[b, cell],
+                    pos,
+                )
+            states.append(
+                OvercookedState(
+                    players,
+                    objects,
+                    bonus_orders=batch.bonus_orders,
+                    all_orders=batch.all_orders,
+                    timestep=int(batch.timesteps[b]),
+                )
+            )
+        return states
+
+    def get_standard_start_state(self, batch_size):
+        start_state = self.mdp.get_standard_start_state()
+        return self.states_to_batch([start_state] * batch_size)
+
+    def joint_actions_to_indices(self, joint_actions):
+        """Converts a list of B joint actions to a (B, num_players) array of action indices"""
+        return np.array(
+            [
+                [Action.ACTION_TO_INDEX[a] for a in joint_action]
+                for joint_action in joint_actions
+            ],
+            dtype=np.int64,
+        ).reshape(-1, self.num_players)
+
+    ##############
+    # GAME LOGIC #
+    ##############
+
+    def _soup_info(self, ingredients, ticks):
+        """Returns the (num ingredients, cook time, is_idle, is_ready) arrays of soups"""
+        num_onions = (ingredients == ONION).sum(-1)
+        num_tomatoes = (ingredients == TOMATO).sum(-1)
+        cook_time = self._cook_times[num_onions, num_tomatoes]
+        is_idle = ticks < 0
+        is_ready = ~is_idle & (ticks >= cook_time)
+        return num_onions + num_tomatoes, cook_time, is_idle, is_ready
+
+    def get_state_transition(self, state, joint_action, inplace=False):
+        """Steps every game in the batch once.
+
+        joint_action is either a (B, num_players) array of action indices or
+        a list of B joint actions. Returns the next BatchOvercookedState and
+        an infos dict whose `sparse_reward_by_agent` and
+        `shaped_reward_by_agent` are (B, num_players) arrays.
+
+        If `inplace` is True, `state` is updated and returned instead of
+        being copied first.
+        """
+        if not (
+            isinstance(joint_action, np.ndarray)
+            and np.issubdtype(joint_action.dtype, np.integer)
+        ):
+            joint_action = self.joint_actions_to_indices(joint_action)
+        assert joint_action.shape == (state.num_games, self.num_players)
+        if np.any((joint_action < 0) | (joint_action >= Action.NUM_ACTIONS)):
+            raise ValueError("Illegal action in joint action batch")
+
+        new_state = state if inplace else state.copy()
+        sparse_reward, shaped_reward = self.resolve_interacts(
+            new_state, joint_action
+        )
+        self.resolve_movement(new_state, joint_action)
+        self.step_environment_effects(new_state)
+
+        infos = {
+            "sparse_reward_by_agent": sparse_reward,
+            "shaped_reward_by_agent": shaped_reward,
+        }
+        return new_state, infos
+
+    def _num_non_empty_pots(self, state):
+        """Number of ready, cooking and partially full pots in each game,
+        as counted by OvercookedGridworld.is_dish_pickup_useful"""
+        pot_cells = self._terrain_masks["P"]
+        num_ingredients, _, is_idle, is_ready = self._soup_info(
+            state.ingredients[:, pot_cells], state.cooking_ticks[:, pot_cells]
+        )
+        has_soup = state.objects[:, pot_cells] == SOUP
+        partially_full = (
+            is_idle
+            & (num_ingredients >= 1)
+            & (num_ingredients < self.max_num_ingredients)
+        )
+        return (has_soup & (~is_idle | partially_full)).sum(-1)
+
+    def _is_dish_pickup_useful(self, state, games, non_empty_pots):
+        if self.num_players != 2:
+            return np.zeros(len(games), dtype=bool)
+        dishes_on_counters = (
+            (state.objects[games] == DISH) & self._is_counter
+        ).any(-1)
+        num_player_dishes = (state.held_objects[games] == DISH).sum(-1)
+        return ~dishes_on_counters & (
+            num_player_dishes < non_empty_pots[games]
+        )
+
+    def _give_to_players(self, state, games, player_idx, cells):
+        """Moves the objects on `cells` into the hands of the players"""
+        state.held_objects[games, player_idx] = state.objects[games, cells]
+        state.held_ingredients[games, player_idx] = state.ingredients[
+            games, cells
+        ]
+        state.held_cooking_ticks[games, player_idx] = state.cooking_ticks[
+            games, cells
+        ]
+        state.objects[games, cells] = EMPTY
+        state.ingredients[games, cells] = EMPTY
+        state.cooking_ticks[games, cells] = -1
+
+    def _take_from_players(self, state, games, player_idx, cells):
+        """Moves the objects held by the players onto `cells`"""
+        state.objects[games, cells] = state.held_objects[games, player_idx]
+        state.ingredients[games, cells] = state.held_ingredients[
+            games, player_idx
+        ]
+        state.cooking_ticks[games, cells] = state.held_cooking_ticks[
+            games, player_idx
+        ]
+        self._clear_hands(state, games, player_idx)
+
+    def _clear_hands(self, state, games, player_idx):
+        state.held_objects[games, player_idx] = EMPTY
+        state.held_ingredients[games, player_idx] = EMPTY
+        state.held_cooking_ticks[games, player_idx] = -1
+
+    def resolve_interacts(self, state, joint_action):
+        """
+        Resolve any INTERACT actions, if present.
+
+        As in OvercookedGridworld.resolve_interacts, player 1's interacts are
+        resolved before player 2's. Within one player, every game falls in
+        at most one of the cases below, so the cases can be applied one
+        after the other.
+        """
+        B = state.num_games
+        recipe_values = self._recipe_values(state)
+        sparse_reward = np.zeros((B, self.num_players), recipe_values.dtype)
+        shaped_reward = np.zeros(
+            (B, self.num_players), self._shaped_reward_dtype
+        )
+
+        # Pot states are computed before any interact, like the scalar version
+        non_empty_pots = self._num_non_empty_pots(state)
+
+        for player_idx in range(self.num_players):
+            games = np.flatnonzero(
+                joint_action[:, player_idx] == INTERACT_INDEX
+            )
+            if len(games) == 0:
+                continue
+
+            cells = self._facing_cell[
+                state.player_positions[games, player_idx],
+                state.player_orientations[games, player_idx],
+            ]
+            held = state.held_objects[games, player_idx]
+            obj = state.objects[games, cells]
+            terrain = {
+                t: mask[cells] for t, mask in self._terrain_masks.items()
+            }
+            has_held, has_obj = held != EMPTY, obj != EMPTY
+            num_ingredients, _, is_idle, is_ready = self._soup_info(
+                state.ingredients[games, cells],
+                state.cooking_ticks[games, cells],
+            )
+            is_soup = obj == SOUP
+
+            # Drop object on counter
+            sel = terrain["X"] & has_held & ~has_obj
+            self._take_from_players(state, games[sel], player_idx, cells[sel])
+
+            # Pick up object from counter
+            sel = terrain["X"] & ~has_held & has_obj
+            self._give_to_players(state, games[sel], player_idx, cells[sel])
+
+            # Onion and tomato pickup from dispensers
+            sel = terrain["O"] & ~has_held
+            state.held_objects[games[sel], player_idx] = ONION
+            sel = terrain["T"] & ~has_held
+            state.held_objects[games[sel], player_idx] = TOMATO
+
+            # Dish pickup from dispenser, with shaped reward if useful
+            sel = terrain["D"] & ~has_held
+            useful = self._is_dish_pickup_useful(
+                state, games[sel], non_empty_pots
+            )
+            shaped_reward[
+                games[sel][useful], player_idx
+            ] += self._dish_pickup_rew
+            state.held_objects[games[sel], player_idx] = DISH
+
+            # An interact only starts cooking the soup with the new dynamics
+            if not self.old_dynamics:
+                sel = (
+                    terrain["P"]
+                    & ~has_held
+                    & is_soup
+                    & is_idle
+                    & (num_ingredients > 0)
+                )
+                state.cooking_ticks[games[sel], cells[sel]] = 0
+
+            # Pick up soup with a dish
+            sel = terrain["P"] & (held == DISH) & is_soup & is_ready
+            self._give_to_players(state, games[sel], player_idx, cells[sel])
+            shaped_reward[games[sel], player_idx] += self._soup_pickup_rew
+
+            # Add ingredient to soup, creating the soup if the pot was empty
+            is_full = is_soup & (
+                ~is_idle | (num_ingredients == self.max_num_ingredients)
+            )
+            sel = (
+                terrain["P"]
+                & ((held == ONION) | (held == TOMATO))
+                & (~has_obj | is_soup)
+                & ~is_full
+            )
+            g, c = games[sel], cells[sel]
+            state.objects[g, c] = SOUP
+            state.ingredients[g, c, num_ingredients[sel]] = held[sel]
+            self._clear_hands(state, g, player_idx)
+            shaped_reward[g, player_idx] += self._placement_in_pot_rew
+
+            # Deliver soup
+            sel = terrain["S"] & (held == SOUP)
+            g = games[sel]
+            held_ingredients = state.held_ingredients[g, player_idx]
+            sparse_reward[g, player_idx] += recipe_values[
+                (held_ingredients == ONION).sum(-1),
+                (held_ingredients == TOMATO).sum(-1),
+            ]
+            self._clear_hands(state, g, player_idx)
+
+        return sparse_reward, shaped_reward
+
+    def resolve_movement(self, state, joint_action):
+        """Resolve player movement and deal with possible collisions"""
+        old_positions = state.player_positions
+        new_positions = self._successor_cell[old_positions, joint_action]
+        is_direction = joint_action < len(Direction.ALL_DIRECTIONS)
+        state.player_orientations = np.where(
+            is_direction, joint_action, state.player_orientations
+        )
+
+        # If agents collide, they stay at their old locations
+        collision = np.zeros(state.num_games, dtype=bool)
+        for idx0, idx1 in itertools.combinations(range(self.num_players), 2):
+            collision |= new_positions[:, idx0] == new_positions[:, idx1]
+            collision |= (new_positions[:, idx0] == old_positions[:, idx1]) & (
+                new_positions[:, idx1] == old_positions[:, idx0]
+            )
+        state.player_positions = np.where(
+            collision[:, None], old_positions, new_positions
+        )
+
+    def step_environment_effects(self, state):
+        state.timesteps += 1
+        is_soup = state.objects == SOUP
+        num_ingredients, cook_time, is_idle, _ = self._soup_info(
+            state.ingredients, state.cooking_ticks
+        )
+        if self.old_dynamics:
+            # automatically starts cooking when the pot has 3 ingredients
+            starts = is_soup & is_idle & (num_ingredients == 3)
+            state.cooking_ticks[starts] = 0
+        is_cooking = (
+            is_soup
+            & (state.cooking_ticks >= 0)
+            & (state.cooking_ticks < cook_time)
+        )
+        state.cooking_ticks[is_cooking] += 1
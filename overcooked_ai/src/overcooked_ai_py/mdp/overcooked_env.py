@@ -55,12 +55,14 @@ class OvercookedEnv(object):
         info_level=0,
         num_mdp=1,
         initial_info={},
+        mlam=None,
     ):
         """
         mdp_generator_fn (callable):    A no-argument function that returns a OvercookedGridworld instance
         start_state_fn (callable):      Function that returns start state for the MDP, called at each environment reset
         horizon (int):                  Number of steps before the environment returns done=True
         mlam_params (dict):             params for MediumLevelActionManager
+        mlam (MediumLevelActionManager): already computed action manager for the mdp, to share it between envs
         info_level (int):               Change amount of logging
         num_mdp (int):                  the number of mdp if we are using a list of mdps
         initial_info (dict):            the initial outside information feed into the generator function
@@ -77,7 +79,7 @@ class OvercookedEnv(object):
         self.variable_mdp = num_mdp > 1
         self.mdp_generator_fn = mdp_generator_fn
         self.horizon = horizon
-        self._mlam = None
+        self._mlam = mlam
         self._mp = None
         self.mlam_params = mlam_params
         self.start_state_fn = start_state_fn
@@ -122,6 +124,7 @@ class OvercookedEnv(object):
         mlam_params=NO_COUNTERS_PARAMS,
         info_level=1,
         num_mdp=None,
+        mlam=None,
     ):
         """
         Create an OvercookedEnv directly from a OvercookedGridworld mdp
@@ -138,6 +141,7 @@ class OvercookedEnv(object):
             mlam_params=mlam_params,
             info_level=info_level,
             num_mdp=1,
+            mlam=mlam,
         )
 
     #####################
@@ -273,6 +277,42 @@ class OvercookedEnv(object):
         timestep_sparse_reward = sum(mdp_infos["sparse_reward_by_agent"])
         return (next_state, timestep_sparse_reward, done, env_info)
 
+    def step_fast(self, joint_action, validate=True, log_events=False):
+        """Lean version of step for training loops.
+
+        Updates the environment state and returns
+        (next_state, sparse_reward_by_agent, shaped_reward_by_agent).
+        No info dict is built, and the game stats (and so the episode info
+        added by step when done) are only updated if log_events is True.
+        Use is_done to know whether the episode is over.
+        """
+        if validate:
+            assert not self.is_done()
+        events_infos = (
+            {event: [False] * self.mdp.num_players for event in EVENT_TYPES}
+            if log_events
+            else None
+        )
+        (
+            next_state,
+            sparse_reward_by_agent,
+            shaped_reward_by_agent,
+        ) = self.mdp.step_fast(
+            self.state, joint_action, validate, events_infos
+        )
+
+        if log_events:
+            self._update_game_stats(
+                {
+                    "event_infos": events_infos,
+                    "sparse_reward_by_agent": sparse_reward_by_agent,
+                    "shaped_reward_by_agent": shaped_reward_by_agent,
+                }
+            )
+
+        self.state = next_state
+        return next_state, sparse_reward_by_agent, shaped_reward_by_agent
+
     def lossless_state_encoding_mdp(self, state):
         """
         Wrapper of the mdp's lossless_encoding
@@ -298,8 +338,11 @@ class OvercookedEnv(object):
         """
         if regen_mdp:
             self.mdp = self.mdp_generator_fn(outside_info)
-            self._mlam = None
-            self._mp = None
+            # Planners are only dropped if they were computed for another mdp
+            if self._mlam is not None and self._mlam.mdp is not self.mdp:
+                self._mlam = None
+            if self._mp is not None and self._mp.mdp is not self.mdp:
+                self._mp = None
         if self.start_state_fn is None:
             self.state = self.mdp.get_standard_start_state()
         else:
@@ -494,6 +537,7 @@ class OvercookedEnv(object):
         metadata_fn=None,
         metadata_info_fn=None,
         info=True,
+        check_dynamics="off",
     ):
         """
         Simulate `num_games` number rollouts with the current agent_pair and returns processed
@@ -505,6 +549,9 @@ class OvercookedEnv(object):
         metadata_fn returns some metadata information computed at the end of each trajectory based on
         some of the trajectory data.
 
+        check_dynamics replays the rollouts on the mdp to check their consistency, one of "off", "sampled", "full" or
+        "full_parallel" (see AgentEvaluator.check_trajectories)
+
         NOTE: this is the standard trajectories format used throughout the codebase
         """
         trajectories = {k: [] for k in DEFAULT_TRAJ_KEYS}
@@ -581,7 +628,9 @@ class OvercookedEnv(object):
         # TODO: should probably transfer check methods over to Env class
         from overcooked_ai_py.agents.benchmarking import AgentEvaluator
 
-        AgentEvaluator.check_trajectories(trajectories, verbose=info)
+        AgentEvaluator.check_trajectories(
+            trajectories, verbose=info, check_dynamics=check_dynamics
+        )
         return trajectories
 
     ####################
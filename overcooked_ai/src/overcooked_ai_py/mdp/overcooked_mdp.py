@@ -7,11 +7,11 @@ from functools import reduce
 import numpy as np
 
 from overcooked_ai_py.mdp.actions import Action, Direction
+from overcooked_ai_py.mdp.layout_store import LayoutStore
 from overcooked_ai_py.utils import (
     OvercookedException,
     classproperty,
     pos_distance,
-    read_layout_dict,
 )
 
 
@@ -950,13 +950,17 @@ class OvercookedState(object):
         )
 
     def deepcopy(self):
-        return OvercookedState(
-            players=[player.deepcopy() for player in self.players],
-            objects={pos: obj.deepcopy() for pos, obj in self.objects.items()},
-            bonus_orders=[order.to_dict() for order in self.bonus_orders],
-            all_orders=[order.to_dict() for order in self.all_orders],
-            timestep=self.timestep,
-        )
+        # Recipes are immutable singletons, so the orders can be shared
+        # instead of round-tripping them through Recipe.to_dict/from_dict
+        new_state = OvercookedState.__new__(OvercookedState)
+        new_state.players = tuple(player.deepcopy() for player in self.players)
+        new_state.objects = {
+            pos: obj.deepcopy() for pos, obj in self.objects.items()
+        }
+        new_state._bonus_orders = self.bonus_orders
+        new_state._all_orders = self.all_orders
+        new_state.timestep = self.timestep
+        return new_state
 
     def time_independent_equal(self, other):
         order_lists_equal = (
@@ -1015,6 +1019,199 @@ class OvercookedState(object):
         return OvercookedState(**state_dict)
 
 
+class CompactOvercookedState(object):
+    """
+    A compact, immutable counterpart of OvercookedState.
+
+    Players are stored as (position, orientation, held_object) tuples and
+    objects as a dict mapping positions to object tuples, where an object
+    tuple is (name,) for plain objects and (name, ingredients, cooking_tick)
+    for soups. None of these are ever modified in place, so `clone` is O(1):
+    clones share all of their data, and any change builds new containers
+    (copy-on-write).
+
+    Soups always use their recipe's cook time, as is already the case for
+    OvercookedState after a deepcopy.
+    """
+
+    __slots__ = (
+        "players",
+        "objects",
+        "_bonus_orders",
+        "_all_orders",
+        "timestep",
+    )
+
+    def __init__(
+        self, players, objects, bonus_orders=(), all_orders=(), timestep=0
+    ):
+        """
+        players (tuple): (position, orientation, held_object) of each player,
+            with held_object None or an object tuple
+        objects (dict): mapping from positions to object tuples
+        bonus_orders (tuple(Recipe)):   Current orders worth a bonus
+        all_orders (tuple(Recipe)):     Current orders allowed at all
+        timestep (int):  The current timestep of the state
+        """
+        self.players = tuple(players)
+        self.objects = objects
+        self._bonus_orders = tuple(bonus_orders)
+        self._all_orders = tuple(all_orders)
+        self.timestep = timestep
+
+    @staticmethod
+    def _compact_object(obj):
+        if obj.name == "soup":
+            return (obj.name, tuple(obj.ingredients), obj._cooking_tick)
+        return (obj.name,)
+
+    @staticmethod
+    def _full_object(obj_tuple, pos):
+        if obj_tuple[0] != "soup":
+            return ObjectState(obj_tuple[0], pos)
+        _, ingredients, cooking_tick = obj_tuple
+        return SoupState(
+            pos,
+            [ObjectState(name, pos) for name in ingredients],
+            cooking_tick,
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        """Builds a CompactOvercookedState from an OvercookedState"""
+        players = tuple(
+            (
+                player.position,
+                player.orientation,
+                None
+                if player.held_object is None
+                else cls._compact_object(player.held_object),
+            )
+            for player in state.players
+        )
+        objects = {
+            pos: cls._compact_object(obj) for pos, obj in state.objects.items()
+        }
+        return cls(
+            players,
+            objects,
+            state._bonus_orders,
+            state._all_orders,
+            state.timestep,
+        )
+
+    def to_state(self):
+        """Builds a new OvercookedState, which can be freely modified"""
+        state = OvercookedState.__new__(OvercookedState)
+        state.players = tuple(
+            PlayerState(
+                pos,
+                orientation,
+                None if held is None else self._full_object(held, pos),
+            )
+            for pos, orientation, held in self.players
+        )
+        state.objects = {
+            pos: self._full_object(obj, pos)
+            for pos, obj in self.objects.items()
+        }
+        state._bonus_orders = list(self._bonus_orders)
+        state._all_orders = list(self._all_orders)
+        state.timestep = self.timestep
+        return state
+
+    def clone(self):
+        return CompactOvercookedState(
+            self.players,
+            self.objects,
+            self._bonus_orders,
+            self._all_orders,
+            self.timestep,
+        )
+
+    # Compact states are never modified in place, so a clone is a deepcopy
+    deepcopy = clone
+
+    @property
+    def player_positions(self):
+        return tuple(player[0] for player in self.players)
+
+    @property
+    def player_orientations(self):
+        return tuple(player[1] for player in self.players)
+
+    @property
+    def players_pos_and_or(self):
+        """Returns a ((pos1, or1), (pos2, or2)) tuple"""
+        return tuple((player[0], player[1]) for player in self.players)
+
+    @property
+    def all_orders(self):
+        return (
+            sorted(self._all_orders)
+            if self._all_orders
+            else sorted(Recipe.ALL_RECIPES)
+        )
+
+    @property
+    def bonus_orders(self):
+        return sorted(self._bonus_orders)
+
+    def has_object(self, pos):
+        return pos in self.objects
+
+    def fingerprint(self):
+        """
+        Tuple that is equal for two states only if the states are equal, and
+        cheaper to compare than the states as orders are not sorted. Equal
+        states can have different fingerprints (e.g. with orders listed in
+        another order), so fall back to == when fingerprints differ
+        """
+        return (
+            self.timestep,
+            self.players,
+            self.objects,
+            self._bonus_orders,
+            self._all_orders,
+        )
+
+    def time_independent_equal(self, other):
+        return (
+            isinstance(other, CompactOvercookedState)
+            and self.players == other.players
+            and self.objects == other.objects
+            and self.all_orders == other.all_orders
+            and self.bonus_orders == other.bonus_orders
+        )
+
+    def __eq__(self, other):
+        return (
+            self.time_independent_equal(other)
+            and self.timestep == other.timestep
+        )
+
+    def __hash__(self):
+        # NOTE: hash doesn't take into account timestep
+        order_list_hash = hash(tuple(self.bonus_orders)) + hash(
+            tuple(self.all_orders)
+        )
+        return hash(
+            (self.players, frozenset(self.objects.items()), order_list_hash)
+        )
+
+    def __str__(self):
+        return "Compact" + str(self.to_state())
+
+    def to_dict(self):
+        return self.to_state().to_dict()
+
+    @staticmethod
+    def from_dict(state_dict):
+        return CompactOvercookedState.from_state(
+            OvercookedState.from_dict(state_dict)
+        )
+
+
 BASE_REW_SHAPING_PARAMS = {
     "PLACEMENT_IN_POT_REW": 3,
     "DISH_PICKUP_REWARD": 3,
@@ -1057,6 +1254,9 @@ EVENT_TYPES = [
     "useless_tomato_potting",
 ]
 
+# Default maximum number of entries of a lazily filled joint movement table
+JOINT_MOVEMENT_TABLE_SIZE = 200000
+
 POTENTIAL_CONSTANTS = {
     "default": {
         "max_delivery_steps": 10,
@@ -1073,6 +1273,61 @@ POTENTIAL_CONSTANTS = {
 }
 
 
+class TerrainIndex(object):
+    """
+    Static lookups into the terrain of a layout, compiled once so that the
+    game logic never has to scan position lists.
+
+    Attributes:
+        walkable (np.ndarray): (width, height) boolean grid of the positions
+            players can stand on
+        positions (dict): terrain type -> frozenset of its positions
+        successors (dict): (pos, orientation, action) -> (pos', orientation')
+            of a single player acting from every walkable position,
+            ignoring other players
+        facing (dict): (pos, orientation) -> (pos faced, terrain type there)
+            for every walkable position
+    """
+
+    def __init__(self, terrain_mtx, terrain_pos_dict):
+        width, height = len(terrain_mtx[0]), len(terrain_mtx)
+        self.walkable = np.zeros((width, height), dtype=bool)
+        for x, y in terrain_pos_dict[" "]:
+            self.walkable[x, y] = True
+        self.positions = defaultdict(frozenset)
+        for terrain_type, pos_list in terrain_pos_dict.items():
+            self.positions[terrain_type] = frozenset(pos_list)
+
+        self.successors, self.facing = {}, {}
+        for pos in terrain_pos_dict[" "]:
+            for orientation in Direction.ALL_DIRECTIONS:
+                faced_x, faced_y = Action.move_in_direction(pos, orientation)
+                if 0 <= faced_x < width and 0 <= faced_y < height:
+                    self.facing[pos, orientation] = (
+                        (faced_x, faced_y),
+                        terrain_mtx[faced_y][faced_x],
+                    )
+                for action in Action.ALL_ACTIONS:
+                    self.successors[
+                        pos, orientation, action
+                    ] = self.compute_successor(pos, orientation, action)
+
+    def is_walkable(self, pos):
+        x, y = pos
+        width, height = self.walkable.shape
+        return 0 <= x < width and 0 <= y < height and self.walkable[x, y]
+
+    def compute_successor(self, position, orientation, action):
+        """Position and orientation after a single player executes action"""
+        if action not in Action.MOTION_ACTIONS:
+            return position, orientation
+        new_pos = Action.move_in_direction(position, action)
+        new_orientation = orientation if action == Action.STAY else action
+        if not self.is_walkable(new_pos):
+            return position, new_orientation
+        return new_pos, new_orientation
+
+
 class OvercookedGridworld(object):
     """
     An MDP grid world based off of the Overcooked game.
@@ -1130,6 +1385,7 @@ class OvercookedGridworld(object):
         self.shape = (self.width, self.height)
         self.terrain_mtx = terrain
         self.terrain_pos_dict = self._get_terrain_type_pos_dict()
+        self.terrain_index = TerrainIndex(terrain, self.terrain_pos_dict)
         self.start_player_positions = start_player_positions
         self.num_players = len(start_player_positions)
         self.start_bonus_orders = start_bonus_orders
@@ -1146,6 +1402,21 @@ class OvercookedGridworld(object):
         self._prev_potential_params = {}
         # determines whether to start cooking automatically once 3 items are in the pot
         self.old_dynamics = old_dynamics
+        # (players pos and or, joint action) -> movement, see enable_joint_movement_table
+        self.joint_movement_table = None
+        self._joint_movement_table_size = None
+
+    # parsed and validated .layout files, see layout_store
+    _layout_store = None
+
+    @staticmethod
+    def layout_store():
+        """LayoutStore of the .layout files, shared within the process"""
+        if OvercookedGridworld._layout_store is None:
+            OvercookedGridworld._layout_store = LayoutStore(
+                validate_grid=OvercookedGridworld._assert_valid_grid
+            )
+        return OvercookedGridworld._layout_store
 
     @staticmethod
     def from_layout_name(layout_name, **params_to_overwrite):
@@ -1155,36 +1426,43 @@ class OvercookedGridworld(object):
         One can overwrite the default mdp configuration using partial_mdp_config.
         """
         params_to_overwrite = params_to_overwrite.copy()
-        base_layout_params = read_layout_dict(layout_name)
+        # grid of the record is already cleaned and validated
+        layout = OvercookedGridworld.layout_store().read(layout_name)
+        base_layout_params = layout["params"]
 
-        grid = base_layout_params["grid"]
-        del base_layout_params["grid"]
         base_layout_params["layout_name"] = layout_name
         if "start_state" in base_layout_params:
             base_layout_params["start_state"] = OvercookedState.from_dict(
                 base_layout_params["start_state"]
             )
 
-        # Clean grid
-        grid = [layout_row.strip() for layout_row in grid.split("\n")]
         return OvercookedGridworld.from_grid(
-            grid, base_layout_params, params_to_overwrite
+            layout["grid"],
+            base_layout_params,
+            params_to_overwrite,
+            validate_grid=not layout["valid"],
         )
 
     @staticmethod
     def from_grid(
-        layout_grid, base_layout_params={}, params_to_overwrite={}, debug=False
+        layout_grid,
+        base_layout_params={},
+        params_to_overwrite={},
+        debug=False,
+        validate_grid=True,
     ):
         """
         Returns instance of OvercookedGridworld with terrain and starting
         positions derived from layout_grid.
         One can override default configuration parameters of the mdp in
         partial_mdp_config.
+        validate_grid can be turned off for grids that are known to be valid.
         """
         mdp_config = copy.deepcopy(base_layout_params)
 
         layout_grid = [[c for c in row] for row in layout_grid]
-        OvercookedGridworld._assert_valid_grid(layout_grid)
+        if validate_grid:
+            OvercookedGridworld._assert_valid_grid(layout_grid)
 
         if "layout_name" not in mdp_config:
             layout_name = "|".join(["".join(line) for line in layout_grid])
@@ -1235,6 +1513,23 @@ class OvercookedGridworld(object):
     # BASIC CLASS UTILS #
     #####################
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Can be large and is cheap to rebuild, so it is not pickled (along
+        # with planners, for instance) and has to be enabled again
+        state["joint_movement_table"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "terrain_index" not in state:
+            # Pickled before the terrain index was added
+            self.terrain_index = TerrainIndex(
+                self.terrain_mtx, self.terrain_pos_dict
+            )
+        self.__dict__.setdefault("joint_movement_table", None)
+        self.__dict__.setdefault("_joint_movement_table_size", None)
+
     def __eq__(self, other):
         return (
             np.array_equal(self.terrain_mtx, other.terrain_mtx)
@@ -1383,6 +1678,9 @@ class OvercookedGridworld(object):
         NOTE: Sparse reward is given only when soups are delivered,
         shaped reward is given only for completion of subgoals
         (not soup deliveries).
+
+        `state` can also be a CompactOvercookedState, in which case the
+        next state is returned as a CompactOvercookedState too.
         """
         events_infos = {
             event: [False] * self.num_players for event in EVENT_TYPES
@@ -1391,13 +1689,25 @@ class OvercookedGridworld(object):
             state
         ), "Trying to find successor of a terminal state: {}".format(state)
 
-        for action, action_set in zip(joint_action, self.get_actions(state)):
+        # Compact states build fresh objects when converted, so the
+        # converted state can be stepped without a deepcopy
+        is_compact = isinstance(state, CompactOvercookedState)
+        new_state = state.to_state() if is_compact else state.deepcopy()
+
+        for action, action_set in zip(
+            joint_action, self.get_actions(new_state)
+        ):
             if action not in action_set:
                 raise ValueError(
                     "Illegal action %s in state %s" % (action, state)
                 )
 
-        new_state = state.deepcopy()
+        if display_phi:
+            assert (
+                motion_planner is not None
+            ), "motion planner must be defined if display_phi is true"
+            phi_s = self.potential_function(new_state, motion_planner)
+
         # Resolve interacts first
         (
             sparse_reward_by_agent,
@@ -1420,21 +1730,66 @@ class OvercookedGridworld(object):
             "shaped_reward_by_agent": shaped_reward_by_agent,
         }
         if display_phi:
-            assert (
-                motion_planner is not None
-            ), "motion planner must be defined if display_phi is true"
-            infos["phi_s"] = self.potential_function(state, motion_planner)
+            infos["phi_s"] = phi_s
             infos["phi_s_prime"] = self.potential_function(
                 new_state, motion_planner
             )
+        if is_compact:
+            new_state = CompactOvercookedState.from_state(new_state)
         return new_state, infos
 
+    def step_fast(self, state, joint_action, validate=True, events_infos=None):
+        """Lean version of get_state_transition for training loops.
+
+        Returns only the next state, the sparse reward by agent and the
+        shaped reward by agent, which are the same as the ones of
+        get_state_transition.
+
+        Args:
+            validate (bool): whether to check that the state is not terminal
+                and that the joint action is legal. Turning it off skips the
+                per-step state validation of get_actions.
+            events_infos (dict): event_type -> list of bools by agent, as in
+                the infos of get_state_transition. Events are only logged
+                (and their usefulness computed) if it is given, e.g. as
+                `{event: [False] * num_players for event in EVENT_TYPES}`.
+        """
+        if validate:
+            assert not self.is_terminal(
+                state
+            ), "Trying to find successor of a terminal state: {}".format(state)
+
+        is_compact = isinstance(state, CompactOvercookedState)
+        new_state = state.to_state() if is_compact else state.deepcopy()
+
+        if validate:
+            for action, action_set in zip(
+                joint_action, self.get_actions(new_state)
+            ):
+                if action not in action_set:
+                    raise ValueError(
+                        "Illegal action %s in state %s" % (action, state)
+                    )
+
+        (
+            sparse_reward_by_agent,
+            shaped_reward_by_agent,
+        ) = self.resolve_interacts(new_state, joint_action, events_infos)
+        self.resolve_movement(new_state, joint_action)
+        self.step_environment_effects(new_state)
+
+        if is_compact:
+            new_state = CompactOvercookedState.from_state(new_state)
+        return new_state, sparse_reward_by_agent, shaped_reward_by_agent
+
     def resolve_interacts(self, new_state, joint_action, events_infos):
         """
         Resolve any INTERACT actions, if present.
 
         Currently if two players both interact with a terrain, we resolve player 1's interact
         first and then player 2's, without doing anything like collision checking.
+
+        Events are not logged if `events_infos` is None.
         """
         pot_states = self.get_pot_states(new_state)
         # We divide reward by agent to keep track of who contributed
@@ -1450,8 +1805,11 @@ class OvercookedGridworld(object):
                 continue
 
             pos, o = player.position, player.orientation
-            i_pos = Action.move_in_direction(pos, o)
-            terrain_type = self.get_terrain_type_at_pos(i_pos)
+            facing = self.terrain_index.facing.get((pos, o))
+            if facing is None:
+                i_pos = Action.move_in_direction(pos, o)
+                facing = i_pos, self.get_terrain_type_at_pos(i_pos)
+            i_pos, terrain_type = facing
 
             # NOTE: we always log pickup/drop before performing it, as that's
             # what the logic of determining whether the pickup/drop is useful assumes
@@ -1564,7 +1922,10 @@ class OvercookedGridworld(object):
                             obj.name,
                             player_idx,
                         )
-                        if obj.name == Recipe.ONION:
+                        if (
+                            obj.name == Recipe.ONION
+                            and events_infos is not None
+                        ):
                             events_infos["potting_onion"][player_idx] = True
 
             elif terrain_type == "S" and player.has_object():
@@ -1574,7 +1935,8 @@ class OvercookedGridworld(object):
                     sparse_reward[player_idx] += delivery_rew
 
                     # Log soup delivery
-                    events_infos["soup_delivery"][player_idx] = True
+                    if events_infos is not None:
+                        events_infos["soup_delivery"][player_idx] = True
 
         return sparse_reward, shaped_reward
 
@@ -1654,19 +2016,72 @@ class OvercookedGridworld(object):
         ):
             player_state.update_pos_and_or(new_pos, new_o)
 
+    def enable_joint_movement_table(
+        self, precompute=False, max_size=JOINT_MOVEMENT_TABLE_SIZE
+    ):
+        """
+        Memoize the movement phase of get_state_transition: the new positions
+        and orientations of all players are then looked up by their current
+        ones and the joint action, rather than recomputed with collisions.
+
+        Args:
+            precompute (bool): fill the table right away with every valid
+                joint position and orientation and joint action. The number
+                of entries grows with the square of the number of positions
+                (for two players), so this is meant for small layouts
+            max_size (int): when not precomputing, the table is filled as
+                movements are computed, and emptied whenever it reaches
+                max_size entries (None for no limit). A plain dict is much
+                cheaper to query than an LRU structure, and the movements
+                that matter are quickly computed again
+        """
+        table = self.joint_movement_table = {}
+        self._joint_movement_table_size = None if precompute else max_size
+        if not precompute:
+            return
+
+        joint_actions = list(
+            itertools.product(Action.ALL_ACTIONS, repeat=self.num_players)
+        )
+        valid_states = self.get_valid_joint_player_positions_and_orientations()
+        for joint_pos_and_or in valid_states:
+            for joint_action in joint_actions:
+                key = (joint_pos_and_or, joint_action)
+                table[key] = self._compute_joint_movement(*key)
+
+    def disable_joint_movement_table(self):
+        self.joint_movement_table = None
+        self._joint_movement_table_size = None
+
     def compute_new_positions_and_orientations(
         self, old_player_states, joint_action
     ):
-        """Compute new positions and orientations ignoring collisions"""
+        """Compute new positions and orientations, resolving collisions"""
+        joint_pos_and_or = tuple([p.pos_and_or for p in old_player_states])
+        table = self.joint_movement_table
+        if table is None:
+            return self._compute_joint_movement(joint_pos_and_or, joint_action)
+
+        key = (joint_pos_and_or, tuple(joint_action))
+        movement = table.get(key)
+        if movement is None:
+            movement = self._compute_joint_movement(*key)
+            max_size = self._joint_movement_table_size
+            if max_size is not None and len(table) >= max_size:
+                table.clear()
+            table[key] = movement
+        return movement
+
+    def _compute_joint_movement(self, joint_pos_and_or, joint_action):
         new_positions, new_orientations = list(
             zip(
                 *[
-                    self._move_if_direction(p.position, p.orientation, a)
-                    for p, a in zip(old_player_states, joint_action)
+                    self._move_if_direction(pos, o, a)
+                    for (pos, o), a in zip(joint_pos_and_or, joint_action)
                 ]
             )
         )
-        old_positions = tuple(p.position for p in old_player_states)
+        old_positions = tuple(pos for pos, _ in joint_pos_and_or)
         new_positions = self._handle_collisions(old_positions, new_positions)
         return new_positions, new_orientations
 
@@ -1718,13 +2133,15 @@ class OvercookedGridworld(object):
     def _move_if_direction(self, position, orientation, action):
         """Returns position and orientation that would
         be obtained after executing action"""
-        if action not in Action.MOTION_ACTIONS:
-            return position, orientation
-        new_pos = Action.move_in_direction(position, action)
-        new_orientation = orientation if action == Action.STAY else action
-        if new_pos not in self.get_valid_player_positions():
-            return position, new_orientation
-        return new_pos, new_orientation
+        successor = self.terrain_index.successors.get(
+            (position, orientation, action)
+        )
+        if successor is None:
+            # Not starting from a walkable position
+            successor = self.terrain_index.compute_successor(
+                position, orientation, action
+            )
+        return successor
 
     #######################
     # LAYOUT / STATE INFO #
@@ -1840,9 +2257,9 @@ class OvercookedGridworld(object):
     def get_counter_objects_dict(self, state, counter_subset=None):
         """Returns a dictionary of pos:objects on counters by type"""
         counters_considered = (
-            self.terrain_pos_dict["X"]
+            self.terrain_index.positions["X"]
             if counter_subset is None
-            else counter_subset
+            else frozenset(counter_subset)
         )
         counter_objects_dict = defaultdict(list)
         for obj in state.objects.values():
@@ -1921,7 +2338,7 @@ class OvercookedGridworld(object):
         for player_state in state.players:
             # Check that players are not on terrain
             pos = player_state.position
-            assert pos in self.get_valid_player_positions()
+            assert self.terrain_index.is_walkable(pos)
 
             # Check that held objects have the same position
             if player_state.held_object is not None:
@@ -2122,6 +2539,8 @@ class OvercookedGridworld(object):
         self, events_infos, state, old_soup, new_soup, obj_name, player_index
     ):
         """Player added an ingredient to a pot"""
+        if events_infos is None:
+            return
         obj_pickup_key = "potting_" + obj_name
         if obj_pickup_key not in events_infos:
             raise ValueError("Unknown event {}".format(obj_pickup_key))
@@ -2143,6 +2562,8 @@ class OvercookedGridworld(object):
         self, events_infos, state, obj_name, pot_states, player_index
     ):
         """Player picked an object up from a counter or a dispenser"""
+        if events_infos is None:
+            return
         obj_pickup_key = obj_name + "_pickup"
         if obj_pickup_key not in events_infos:
             raise ValueError("Unknown event {}".format(obj_pickup_key))
@@ -2162,6 +2583,8 @@ class OvercookedGridworld(object):
         self, events_infos, state, obj_name, pot_states, player_index
     ):
         """Player dropped the object on a counter"""
+        if events_infos is None:
+            return
         obj_drop_key = obj_name + "_drop"
         if obj_drop_key not in events_infos:
             raise ValueError("Unknown event {}".format(obj_drop_key))
@@ -2386,179 +2809,244 @@ class OvercookedGridworld(object):
         self, overcooked_state, horizon=400, debug=False
     ):
         """Featurizes a OvercookedState object into a stack of boolean masks that are easily readable by a CNN"""
-        assert (
-            self.num_players == 2
-        ), "Functionality has to be added to support encondings for > 2 players"
         assert type(debug) is bool
-        base_map_features = [
-            "pot_loc",
-            "counter_loc",
-            "onion_disp_loc",
-            "tomato_disp_loc",
-            "dish_disp_loc",
-            "serve_loc",
-        ]
-        variable_map_features = [
-            "onions_in_pot",
-            "tomatoes_in_pot",
-            "onions_in_soup",
-            "tomatoes_in_soup",
-            "soup_cook_time_remaining",
-            "soup_done",
-            "dishes",
-            "onions",
-            "tomatoes",
-        ]
-        urgency_features = ["urgency"]
-        all_objects = overcooked_state.all_objects_list
-
-        def make_layer(position, value):
-            layer = np.zeros(self.shape)
-            layer[position] = value
-            return layer
-
-        def process_for_player(primary_agent_idx):
-            # Ensure that primary_agent_idx layers are ordered before other_agent_idx layers
-            other_agent_idx = 1 - primary_agent_idx
-            ordered_player_features = [
-                "player_{}_loc".format(primary_agent_idx),
-                "player_{}_loc".format(other_agent_idx),
-            ] + [
-                "player_{}_orientation_{}".format(
-                    i, Direction.DIRECTION_TO_INDEX[d]
-                )
-                for i, d in itertools.product(
-                    [primary_agent_idx, other_agent_idx],
-                    Direction.ALL_DIRECTIONS,
+        final_obs_for_players = tuple(
+            self.lossless_state_encodings([overcooked_state], horizon)[0]
+        )
+
+        if debug:
+            for primary_agent_idx, obs in enumerate(final_obs_for_players):
+                LAYERS = self._lossless_state_encoding_layers(
+                    primary_agent_idx
                 )
-            ]
+                print("terrain----")
+                print(np.array(self.terrain_mtx))
+                print("-----------")
+                print(len(LAYERS))
+                for layer_id, layer in zip(LAYERS, np.moveaxis(obs, -1, 0)):
+                    print(layer_id)
+                    print(np.transpose(layer, (1, 0)))
+        return final_obs_for_players
 
-            # LAYERS = ordered_player_features + base_map_features + variable_map_features
-            LAYERS = (
-                ordered_player_features
-                + base_map_features
-                + variable_map_features
-                + urgency_features
-            )
-            state_mask_dict = {k: np.zeros(self.shape) for k in LAYERS}
+    def lossless_state_encodings(
+        self, overcooked_states, horizon=400, dtype=int, out=None
+    ):
+        """
+        Batched version of lossless_state_encoding for many states of this
+        layout.
 
-            # MAP LAYERS
-            if horizon - overcooked_state.timestep < 40:
-                state_mask_dict["urgency"] = np.ones(self.shape)
+        The static map layers (pots, counters, dispensers, serving
+        locations) are computed once per layout, and only the player, object
+        and urgency layers are written for each state, directly into the
+        output array. The encoding of the second player is the one of the
+        first player with the player layers swapped.
 
-            for loc in self.get_counter_locations():
-                state_mask_dict["counter_loc"][loc] = 1
+        Arguments:
+            overcooked_states (list[OvercookedState]): states to encode
+            horizon (int): as in lossless_state_encoding
+            dtype: dtype of the encodings. Defaults to int, as returned by
+                lossless_state_encoding. np.uint8 is still lossless as long
+                as cook times are below 256, while bool only keeps whether
+                each layer is non-zero
+            out (np.ndarray): optional array of shape
+                (len(overcooked_states), num_players, *get_lossless_state_encoding_shape())
+                that is overwritten with the encodings, e.g. to reuse the
+                same buffer across calls. Its dtype takes precedence
 
-            for loc in self.get_pot_locations():
-                state_mask_dict["pot_loc"][loc] = 1
+        Returns:
+            encodings (np.ndarray): array of shape
+                (len(overcooked_states), num_players, *get_lossless_state_encoding_shape()),
+                such that encodings[b][i] == lossless_state_encoding(overcooked_states[b])[i]
+        """
+        assert (
+            self.num_players == 2
+        ), "Functionality has to be added to support encondings for > 2 players"
+        LAYERS = self._lossless_state_encoding_layers(0)
+        LAYER_IDX = {layer_id: idx for idx, layer_id in enumerate(LAYERS)}
+        # Layers of the second player, in its order, among those of the first
+        OTHER_PLAYER_LAYER_IDX = [
+            LAYER_IDX[layer_id]
+            for layer_id in self._lossless_state_encoding_layers(1)
+        ]
 
-            for loc in self.get_onion_dispenser_locations():
-                state_mask_dict["onion_disp_loc"][loc] = 1
+        shape = (len(overcooked_states), self.num_players) + tuple(
+            self.get_lossless_state_encoding_shape()
+        )
+        if out is None:
+            out = np.zeros(shape, dtype=dtype)
+        else:
+            assert out.shape == shape, "{} vs {}".format(out.shape, shape)
+            out[...] = 0
+
+        # Encodings from the point of view of the first player
+        obs = out[:, 0]
+        static_layers = self._get_lossless_static_layers()
+        obs[..., LAYER_IDX["pot_loc"] : LAYER_IDX["serve_loc"] + 1] = (
+            static_layers
+        )
 
-            for loc in self.get_tomato_dispenser_locations():
-                state_mask_dict["tomato_disp_loc"][loc] = 1
+        pot_locations = set(self.get_pot_locations())
+        # (state, x, y, layer) indices and values of all non-static layers
+        indices, values = [], []
 
-            for loc in self.get_dish_dispenser_locations():
-                state_mask_dict["dish_disp_loc"][loc] = 1
+        def add_to_layer(b, position, layer_id, value):
+            indices.append((b,) + tuple(position) + (LAYER_IDX[layer_id],))
+            values.append(value)
 
-            for loc in self.get_serving_locations():
-                state_mask_dict["serve_loc"][loc] = 1
+        for b, overcooked_state in enumerate(overcooked_states):
+            if horizon - overcooked_state.timestep < 40:
+                obs[b, ..., LAYER_IDX["urgency"]] = 1
 
-            # PLAYER LAYERS
             for i, player in enumerate(overcooked_state.players):
-                player_orientation_idx = Direction.DIRECTION_TO_INDEX[
-                    player.orientation
-                ]
-                state_mask_dict["player_{}_loc".format(i)] = make_layer(
-                    player.position, 1
-                )
-                state_mask_dict[
+                add_to_layer(b, player.position, "player_{}_loc".format(i), 1)
+                add_to_layer(
+                    b,
+                    player.position,
                     "player_{}_orientation_{}".format(
-                        i, player_orientation_idx
-                    )
-                ] = make_layer(player.position, 1)
+                        i, Direction.DIRECTION_TO_INDEX[player.orientation]
+                    ),
+                    1,
+                )
 
-            # OBJECT & STATE LAYERS
-            for obj in all_objects:
+            for obj in overcooked_state.all_objects_list:
                 if obj.name == "soup":
-                    # removed the next line because onion doesn't have to be in all the soups?
-                    # if Recipe.ONION in obj.ingredients:
-                    # get the ingredients into a {object: number} dictionary
                     ingredients_dict = Counter(obj.ingredients)
-                    # assert "onion" in ingredients_dict.keys()
-                    if obj.position in self.get_pot_locations():
+                    if obj.position in pot_locations:
                         if obj.is_idle:
                             # onions_in_pot and tomatoes_in_pot are used when the soup is idling, and ingredients could still be added
-                            state_mask_dict["onions_in_pot"] += make_layer(
-                                obj.position, ingredients_dict["onion"]
+                            add_to_layer(
+                                b,
+                                obj.position,
+                                "onions_in_pot",
+                                ingredients_dict["onion"],
                             )
-                            state_mask_dict["tomatoes_in_pot"] += make_layer(
-                                obj.position, ingredients_dict["tomato"]
+                            add_to_layer(
+                                b,
+                                obj.position,
+                                "tomatoes_in_pot",
+                                ingredients_dict["tomato"],
                             )
                         else:
-                            state_mask_dict["onions_in_soup"] += make_layer(
-                                obj.position, ingredients_dict["onion"]
+                            add_to_layer(
+                                b,
+                                obj.position,
+                                "onions_in_soup",
+                                ingredients_dict["onion"],
                             )
-                            state_mask_dict["tomatoes_in_soup"] += make_layer(
-                                obj.position, ingredients_dict["tomato"]
+                            add_to_layer(
+                                b,
+                                obj.position,
+                                "tomatoes_in_soup",
+                                ingredients_dict["tomato"],
                             )
-                            state_mask_dict[
-                                "soup_cook_time_remaining"
-                            ] += make_layer(
-                                obj.position, obj.cook_time - obj._cooking_tick
+                            add_to_layer(
+                                b,
+                                obj.position,
+                                "soup_cook_time_remaining",
+                                obj.cook_time - obj._cooking_tick,
                             )
                             if obj.is_ready:
-                                state_mask_dict["soup_done"] += make_layer(
-                                    obj.position, 1
-                                )
+                                add_to_layer(b, obj.position, "soup_done", 1)
 
                     else:
                         # If player soup is not in a pot, treat it like a soup that is cooked with remaining time 0
-                        state_mask_dict["onions_in_soup"] += make_layer(
-                            obj.position, ingredients_dict["onion"]
+                        add_to_layer(
+                            b,
+                            obj.position,
+                            "onions_in_soup",
+                            ingredients_dict["onion"],
                         )
-                        state_mask_dict["tomatoes_in_soup"] += make_layer(
-                            obj.position, ingredients_dict["tomato"]
-                        )
-                        state_mask_dict["soup_done"] += make_layer(
-                            obj.position, 1
+                        add_to_layer(
+                            b,
+                            obj.position,
+                            "tomatoes_in_soup",
+                            ingredients_dict["tomato"],
                         )
+                        add_to_layer(b, obj.position, "soup_done", 1)
 
                 elif obj.name == "dish":
-                    state_mask_dict["dishes"] += make_layer(obj.position, 1)
+                    add_to_layer(b, obj.position, "dishes", 1)
                 elif obj.name == "onion":
-                    state_mask_dict["onions"] += make_layer(obj.position, 1)
+                    add_to_layer(b, obj.position, "onions", 1)
                 elif obj.name == "tomato":
-                    state_mask_dict["tomatoes"] += make_layer(obj.position, 1)
+                    add_to_layer(b, obj.position, "tomatoes", 1)
                 else:
                     raise ValueError("Unrecognized object")
 
-            if debug:
-                print("terrain----")
-                print(np.array(self.terrain_mtx))
-                print("-----------")
-                print(len(LAYERS))
-                print(len(state_mask_dict))
-                for k, v in state_mask_dict.items():
-                    print(k)
-                    print(np.transpose(v, (1, 0)))
-
-            # Stack of all the state masks, order decided by order of LAYERS
-            state_mask_stack = np.array(
-                [state_mask_dict[layer_id] for layer_id in LAYERS]
+        if indices:
+            np.add.at(
+                obs,
+                tuple(np.array(indices).T),
+                np.array(values).astype(out.dtype),
             )
-            state_mask_stack = np.transpose(state_mask_stack, (1, 2, 0))
-            assert state_mask_stack.shape[:2] == self.shape
-            assert state_mask_stack.shape[2] == len(LAYERS)
-            # NOTE: currently not including time left or order_list in featurization
-            return np.array(state_mask_stack).astype(int)
-
-        # NOTE: Currently not very efficient, a decent amount of computation repeated here
-        num_players = len(overcooked_state.players)
-        final_obs_for_players = tuple(
-            process_for_player(i) for i in range(num_players)
+
+        out[:, 1] = obs[..., OTHER_PLAYER_LAYER_IDX]
+        return out
+
+    def _lossless_state_encoding_layers(self, primary_agent_idx):
+        """Names of the layers of the lossless encoding of a player"""
+        # Ensure that primary_agent_idx layers are ordered before other_agent_idx layers
+        other_agent_idx = 1 - primary_agent_idx
+        ordered_player_features = [
+            "player_{}_loc".format(primary_agent_idx),
+            "player_{}_loc".format(other_agent_idx),
+        ] + [
+            "player_{}_orientation_{}".format(
+                i, Direction.DIRECTION_TO_INDEX[d]
+            )
+            for i, d in itertools.product(
+                [primary_agent_idx, other_agent_idx],
+                Direction.ALL_DIRECTIONS,
+            )
+        ]
+        base_map_features = [
+            "pot_loc",
+            "counter_loc",
+            "onion_disp_loc",
+            "tomato_disp_loc",
+            "dish_disp_loc",
+            "serve_loc",
+        ]
+        variable_map_features = [
+            "onions_in_pot",
+            "tomatoes_in_pot",
+            "onions_in_soup",
+            "tomatoes_in_soup",
+            "soup_cook_time_remaining",
+            "soup_done",
+            "dishes",
+            "onions",
+            "tomatoes",
+        ]
+        urgency_features = ["urgency"]
+        return (
+            ordered_player_features
+            + base_map_features
+            + variable_map_features
+            + urgency_features
         )
-        return final_obs_for_players
+
+    def _get_lossless_static_layers(self):
+        """
+        (width, height, 6) masks of the pot, counter, onion dispenser, tomato
+        dispenser, dish dispenser and serving locations, computed once per
+        layout
+        """
+        if getattr(self, "_lossless_static_layers", None) is None:
+            static_locations = [
+                self.get_pot_locations(),
+                self.get_counter_locations(),
+                self.get_onion_dispenser_locations(),
+                self.get_tomato_dispenser_locations(),
+                self.get_dish_dispenser_locations(),
+                self.get_serving_locations(),
+            ]
+            layers = np.zeros(tuple(self.shape) + (len(static_locations),))
+            for layer_idx, locations in enumerate(static_locations):
+                for loc in locations:
+                    layers[tuple(loc) + (layer_idx,)] = 1
+            self._lossless_static_layers = layers
+        return self._lossless_static_layers
 
     @property
     def featurize_state_shape(self):
@@ -2806,15 +3294,16 @@ class OvercookedGridworld(object):
                     i, player, "serving", self.get_serving_locations()
                 ),
             )
-            all_features = concat_dicts(
-                all_features,
-                make_closest_feature(
-                    i,
-                    player,
-                    "empty_counter",
-                    self.get_empty_counter_locations(overcooked_state),
-                ),
+            # Empty counters are all counters but the few holding objects
+            table = mlam.motion_planner.feature_distances
+            _, closest_empty_counter = table.min_distance_to_static_feature(
+                player.pos_and_or,
+                self.get_counter_locations(),
+                excluded_pos=overcooked_state.objects,
             )
+            all_features[
+                "p{}_closest_empty_counter".format(i)
+            ] = self.get_deltas_to_location(player, closest_empty_counter)
 
             # Closest pots info
             pot_locations = self.get_pot_locations().copy()
@@ -2897,6 +3386,241 @@ class OvercookedGridworld(object):
 
         return ordered_features
 
+    def featurize_states(self, overcooked_states, mlam, num_pots=2):
+        """
+        Batched version of featurize_state for many states of this layout.
+
+        Closest features are looked up in the FeatureDistanceTable of the
+        mlam's motion planner instead of being searched for separately for
+        each player and feature type.
+
+        Arguments:
+            overcooked_states (list[OvercookedState]): states to featurize
+            mlam (MediumLevelActionManager): used for distance computations
+            num_pots (int): as in featurize_state
+
+        Returns:
+            features (np.ndarray): float32 array of shape
+                (len(overcooked_states), num_players, D), such that
+                features[b] == np.array(self.featurize_state(overcooked_states[b], mlam, num_pots))
+        """
+        table = mlam.motion_planner.feature_distances
+        num_states, num_players = len(overcooked_states), self.num_players
+        pad = table.padding_index
+
+        IDX_TO_OBJ = ["onion", "soup", "dish", "tomato"]
+        OBJ_TO_IDX = {o_name: idx for idx, o_name in enumerate(IDX_TO_OBJ)}
+        # Closest feature types, in the order featurize_state encodes them
+        CLOSEST_FEATURES = [
+            "onion",
+            "tomato",
+            "dish",
+            "soup",
+            "serving",
+            "empty_counter",
+        ]
+        SOUP_FEATURE_IDX = CLOSEST_FEATURES.index("soup")
+
+        def columns(locations):
+            return [table.feature_index[pos] for pos in locations]
+
+        static_candidates = {
+            "onion": columns(self.get_onion_dispenser_locations()),
+            "tomato": columns(self.get_tomato_dispenser_locations()),
+            "dish": columns(self.get_dish_dispenser_locations()),
+            "soup": [],
+            "serving": columns(self.get_serving_locations()),
+            "empty_counter": [],
+        }
+        counter_locations = self.get_counter_locations()
+        counter_columns = columns(counter_locations)
+        pot_locations = self.get_pot_locations()
+        pot_columns = np.array(columns(pot_locations), dtype=int)
+
+        # Per player info
+        start_rows = np.zeros((num_states, num_players), dtype=int)
+        positions = np.zeros((num_states, num_players, 2), dtype=int)
+        orientations = np.zeros((num_states, num_players), dtype=int)
+        # Index in CLOSEST_FEATURES of the held object, -1 if none
+        held_features = np.full((num_states, num_players), -1)
+        held_objs = np.full((num_states, num_players), -1)
+        held_soup_ingredients = np.zeros((num_states, num_players, 2))
+
+        # Per state info: closest feature candidates, ingredients of soups
+        # on counters, and pot states
+        candidate_lists = []
+        soup_ingredients = np.zeros((num_states, pad + 1, 2))
+        num_pot_features = 7
+        pot_features = np.zeros(
+            (num_states, len(pot_locations), num_pot_features)
+        )
+
+        for b, state in enumerate(overcooked_states):
+            for i, player in enumerate(state.players):
+                start_rows[b, i] = table.start_index[player.pos_and_or]
+                positions[b, i] = player.position
+                orientations[b, i] = Direction.DIRECTION_TO_INDEX[
+                    player.orientation
+                ]
+                obj = player.held_object
+                if obj is not None:
+                    held_objs[b, i] = OBJ_TO_IDX[obj.name]
+                    held_features[b, i] = CLOSEST_FEATURES.index(obj.name)
+                    if obj.name == "soup":
+                        ingredients_cnt = Counter(obj.ingredients)
+                        held_soup_ingredients[b, i] = (
+                            ingredients_cnt["onion"],
+                            ingredients_cnt["tomato"],
+                        )
+
+            counter_objects = self.get_counter_objects_dict(state)
+            for pos in counter_objects["soup"]:
+                ingredients_cnt = Counter(state.get_object(pos).ingredients)
+                soup_ingredients[b, table.feature_index[pos]] = (
+                    ingredients_cnt["onion"],
+                    ingredients_cnt["tomato"],
+                )
+            candidates = [
+                static_candidates[name] + columns(counter_objects[name])
+                for name in CLOSEST_FEATURES[:4]
+            ]
+            candidates.append(static_candidates["serving"])
+            candidates.append(
+                [
+                    col
+                    for pos, col in zip(counter_locations, counter_columns)
+                    if not state.has_object(pos)
+                ]
+            )
+            candidate_lists.append(candidates)
+
+            for k, pot_pos in enumerate(pot_locations):
+                if not state.has_object(pot_pos):
+                    # is_empty
+                    pot_features[b, k, 0] = 1
+                    continue
+                soup = state.get_object(pot_pos)
+                ingredients_cnt = Counter(soup.ingredients)
+                is_idle = soup.is_idle
+                is_ready = soup.is_ready
+                pot_features[b, k] = (
+                    0,
+                    not is_idle
+                    or len(soup.ingredients) == Recipe.MAX_NUM_INGREDIENTS,
+                    not is_idle and not is_ready,
+                    is_ready,
+                    ingredients_cnt["onion"],
+                    ingredients_cnt["tomato"],
+                    0 if is_idle else soup.cook_time_remaining,
+                )
+
+        # Closest feature of each type, for every player of every state
+        max_candidates = max(
+            [len(c) for cands in candidate_lists for c in cands] + [1]
+        )
+        candidate_columns = np.full(
+            (num_states, len(CLOSEST_FEATURES), max_candidates), pad
+        )
+        for b, candidates in enumerate(candidate_lists):
+            for f, cols in enumerate(candidates):
+                candidate_columns[b, f, : len(cols)] = cols
+        closest_columns, closest_distances = table.closest(
+            np.repeat(start_rows[:, :, None], len(CLOSEST_FEATURES), axis=2),
+            candidate_columns[:, None],
+        )
+        held = held_features[:, :, None] == np.arange(len(CLOSEST_FEATURES))
+        found = np.isfinite(closest_distances) & ~held
+        closest_deltas = np.where(
+            found[..., None],
+            table.feature_positions[closest_columns] - positions[:, :, None],
+            0,
+        )
+        closest_soup_ingredients = np.where(
+            held[:, :, SOUP_FEATURE_IDX, None],
+            held_soup_ingredients,
+            np.where(
+                found[:, :, SOUP_FEATURE_IDX, None],
+                soup_ingredients[
+                    np.arange(num_states)[:, None],
+                    closest_columns[:, :, SOUP_FEATURE_IDX],
+                ],
+                0,
+            ),
+        )
+
+        # Closest pots are the reachable ones in order of distance, ties
+        # being broken by pot order like repeated min_cost_to_feature calls
+        pot_distances = table.distances[start_rows[:, :, None], pot_columns]
+        pot_order = np.argsort(pot_distances, axis=-1, kind="stable")
+        pot_order = pot_order[:, :, :num_pots]
+        pot_exists = np.isfinite(
+            np.take_along_axis(pot_distances, pot_order, axis=-1)
+        )
+        closest_pot_features = pot_features[
+            np.arange(num_states)[:, None, None], pot_order
+        ]
+        pot_deltas = (
+            np.array(pot_locations, dtype=int).reshape(-1, 2)[pot_order]
+            - positions[:, :, None]
+        )
+        pot_block = np.concatenate(
+            [pot_exists[..., None], closest_pot_features, pot_deltas], axis=-1
+        )
+        pot_block = np.where(pot_exists[..., None], pot_block, 0)
+        # Pots that do not exist on the layout are encoded as all zeros
+        missing_pots = num_pots - pot_block.shape[2]
+        pot_block = np.concatenate(
+            [
+                pot_block,
+                np.zeros((num_states, num_players, missing_pots, 10)),
+            ],
+            axis=2,
+        )
+
+        # Walls around each player
+        terrain = np.array(self.terrain_mtx)
+        walls = np.zeros((num_states, num_players, 4))
+        for d, direction in enumerate(Direction.ALL_DIRECTIONS):
+            adj_x = positions[..., 0] + direction[0]
+            adj_y = positions[..., 1] + direction[1]
+            walls[..., d] = terrain[adj_y, adj_x] != " "
+
+        player_blocks = np.concatenate(
+            [
+                np.eye(4)[orientations],
+                np.eye(len(IDX_TO_OBJ) + 1)[held_objs][..., :-1],
+                closest_deltas[:, :, : SOUP_FEATURE_IDX + 1].reshape(
+                    num_states, num_players, -1
+                ),
+                closest_soup_ingredients,
+                closest_deltas[:, :, SOUP_FEATURE_IDX + 1 :].reshape(
+                    num_states, num_players, -1
+                ),
+                pot_block.reshape(num_states, num_players, -1),
+                walls,
+            ],
+            axis=-1,
+        )
+
+        # Player-centric ordering, as in featurize_state
+        features = []
+        for i in range(num_players):
+            others = [j for j in range(num_players) if j != i]
+            features.append(
+                np.concatenate(
+                    [
+                        player_blocks[:, i],
+                        player_blocks[:, others].reshape(num_states, -1),
+                        (positions[:, others] - positions[:, i, None]).reshape(
+                            num_states, -1
+                        ),
+                        positions[:, i],
+                    ],
+                    axis=-1,
+                )
+            )
+        return np.stack(features, axis=1).astype(np.float32)
+
     def get_deltas_to_closest_location(self, player, locations, mlam):
         _, closest_loc = mlam.motion_planner.min_cost_to_feature(
             player.pos_and_or, locations, with_argmin=True
@@ -0,0 +1,106 @@
+"""
+Steps per second of OvercookedGridworld.get_state_transition on the
+bundled layouts, with and without the joint movement table.
+
+Usage:
+    python -m overcooked_ai_py.mdp.step_benchmark [--layouts L1 L2 ...] [--all] [--precompute]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from overcooked_ai_py.mdp.actions import Action
+from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
+from overcooked_ai_py.static import LAYOUTS_DIR
+
+DEFAULT_LAYOUTS = [
+    "cramped_room",
+    "asymmetric_advantages",
+    "coordination_ring",
+    "forced_coordination",
+    "counter_circuit",
+]
+
+
+def bundled_layouts():
+    return sorted(
+        os.path.splitext(filename)[0]
+        for filename in os.listdir(LAYOUTS_DIR)
+        if filename.endswith(".layout")
+    )
+
+
+def steps_per_second(mdp, num_steps=10000, horizon=400, seed=0):
+    """Steps per second of random joint actions, resetting every horizon steps"""
+    rng = np.random.RandomState(seed)
+    action_indices = rng.randint(
+        len(Action.ALL_ACTIONS), size=(num_steps, mdp.num_players)
+    )
+    joint_actions = [
+        tuple(Action.INDEX_TO_ACTION[i] for i in indices)
+        for indices in action_indices
+    ]
+
+    start_time = time.perf_counter()
+    for t, joint_action in enumerate(joint_actions):
+        if t % horizon == 0:
+            state = mdp.get_standard_start_state()
+        state, _ = mdp.get_state_transition(state, joint_action)
+    return num_steps / (time.perf_counter() - start_time)
+
+
+def benchmark(layout_names, num_steps=10000, precompute=False):
+    """
+    Returns:
+        results (dict): layout_name -> (steps/sec without the joint movement
+            table, steps/sec with it). The lazily filled table starts empty,
+            so its cost of filling is included
+    """
+    results = {}
+    for layout_name in layout_names:
+        mdp = OvercookedGridworld.from_layout_name(layout_name)
+        without_table = steps_per_second(mdp, num_steps)
+        mdp.enable_joint_movement_table(precompute=precompute)
+        with_table = steps_per_second(mdp, num_steps)
+        results[layout_name] = (without_table, with_table)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layouts", nargs="+", default=DEFAULT_LAYOUTS)
+    parser.add_argument(
+        "--all", action="store_true", help="Benchmark every bundled layout"
+    )
+    parser.add_argument("--num_steps", type=int, default=10000)
+    parser.add_argument(
+        "--precompute",
+        action="store_true",
+        help="Fill the joint movement table before stepping",
+    )
+    args = parser.parse_args()
+
+    layout_names = bundled_layouts() if args.all else args.layouts
+    print(
+        "{:<40} {:>12} {:>12} {:>8}".format(
+            "layout", "steps/s", "table", "speedup"
+        )
+    )
+    for layout_name in layout_names:
+        try:
+            results = benchmark([layout_name], args.num_steps, args.precompute)
+        except Exception as e:
+            print("{:<40} skipped: {}".format(layout_name, e))
+            continue
+        without_table, with_table = results[layout_name]
+        print(
+            "{:<40} {:>12.0f} {:>12.0f} {:>7.2f}x".format(
+                layout_name,
+                without_table,
+                with_table,
+                with_table / without_table,
+            )
+        )
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from contextlib import contextmanager
+
+from overcooked_ai_py.static import PLANNER_CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where index updates are then not locked
+    fcntl = None
+
+# Bump whenever the pickled planner classes change in an incompatible way,
+# so that stale cache entries are never loaded
+PLANNER_CACHE_VERSION = 2
+
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024**3
+
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = "index.lock"
+
+
+def geometry_key(mdp):
+    """
+    Hash of everything about an mdp the planners depend on when they
+    are computed: its terrain and number of players. Layouts that only
+    differ in name, start positions, orders or reward shaping (e.g.
+    mutated variants that only move players around) share the same key.
+    """
+    geometry = {
+        "terrain": [list(row) for row in mdp.terrain_mtx],
+        "num_players": mdp.num_players,
+    }
+    return _hash(geometry)
+
+
+def planner_key(kind, mdp, params):
+    """Cache key of a planner of a certain kind computed with params on mdp"""
+    return _hash(
+        {
+            "version": PLANNER_CACHE_VERSION,
+            "kind": kind,
+            "geometry": geometry_key(mdp),
+            "params": params,
+        }
+    )
+
+
+def _hash(obj):
+    serialized = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+
+class PlannerCache(object):
+    """
+    Content-addressed on-disk store of planners.
+
+    Each planner is pickled to `<key>.pkl`, where the key is a hash of the
+    layout geometry, the planner kind and its params (see `planner_key`).
+    Pickles are written to a temporary file and atomically moved in place,
+    so concurrent workers never read a partially written planner. An
+    `index.json` file records the kind, size and layouts of every entry,
+    and the least recently used entries are evicted once the total size
+    exceeds `max_size_bytes`.
+
+    Args:
+        cache_dir (str): directory in which planners are stored
+        max_size_bytes (int): maximum total size of the stored pickles
+    """
+
+    def __init__(
+        self,
+        cache_dir=PLANNER_CACHE_DIR,
+        max_size_bytes=DEFAULT_MAX_CACHE_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+    def get_or_compute(
+        self, kind, mdp, params, compute_fn, force_compute=False, info=False
+    ):
+        """
+        Returns the planner of this kind for mdp and params, loading it from
+        the cache if possible and otherwise computing it with compute_fn and
+        storing it. A planner loaded from an entry shared with another
+        layout of the same geometry is re-bound to mdp before being returned.
+        """
+        key = planner_key(kind, mdp, params)
+        if not force_compute:
+            planner = self.load(key, info=info)
+            if planner is not None:
+                planner.set_mdp(mdp)
+                return planner
+
+        start_time = time.time()
+        planner = compute_fn()
+        if info:
+            print(
+                "It took {} seconds to compute {} for {}".format(
+                    time.time() - start_time, kind, mdp.layout_name
+                )
+            )
+        self.save(key, planner, kind, mdp.layout_name, info=info)
+        return planner
+
+    def filepath(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def load(self, key, info=False):
+        """Returns the planner stored under key, or None if there is none"""
+        filepath = self.filepath(key)
+        try:
+            with open(filepath, "rb") as f:
+                planner = pickle.load(f)
+        except (
+            FileNotFoundError,
+            ModuleNotFoundError,
+            EOFError,
+            AttributeError,
+            pickle.UnpicklingError,
+        ) as e:
+            if info and not isinstance(e, FileNotFoundError):
+                print("Ignoring cached planner {} due to: {}".format(key, e))
+            return None
+
+        # The modification time of a pickle doubles as its last access time,
+        # which avoids rewriting the index on every load
+        try:
+            os.utime(filepath)
+        except FileNotFoundError:
+            pass
+        if info:
+            print("Loaded planner from {}".format(filepath))
+        return planner
+
+    def save(self, key, planner, kind, layout_name, info=False):
+        """Atomically stores planner under key and evicts old entries"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_filepath = tempfile.mkstemp(
+            dir=self.cache_dir, prefix=key, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(planner, f, pickle.HIGHEST_PROTOCOL)
+            os.chmod(tmp_filepath, 0o644)
+            size = os.path.getsize(tmp_filepath)
+            os.replace(tmp_filepath, self.filepath(key))
+        except BaseException:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+
+        with self._locked_index() as index:
+            entry = index.get(key, {"kind": kind, "layouts": []})
+            if layout_name not in entry["layouts"]:
+                entry["layouts"].append(layout_name)
+            entry["size"] = size
+            index[key] = entry
+            self._evict(index, keep=key)
+        if info:
+            print("Saved planner to {}".format(self.filepath(key)))
+
+    def clear(self):
+        """Removes every stored planner"""
+        with self._locked_index() as index:
+            for key in list(index.keys()):
+                self._remove(index, key)
+
+    def _evict(self, index, keep=None):
+        """Drops least recently used entries until the cache fits its size"""
+        total_size = sum(entry["size"] for entry in index.values())
+        by_last_access = sorted(
+            index.keys(), key=lambda k: index[k]["last_access"]
+        )
+        for key in by_last_access:
+            if total_size <= self.max_size_bytes:
+                break
+            if key == keep:
+                continue
+            total_size -= index[key]["size"]
+            self._remove(index, key)
+
+    def _remove(self, index, key):
+        del index[key]
+        try:
+            os.remove(self.filepath(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked_index(self):
+        """
+        Yields the index dict while holding an exclusive lock on it, and
+        atomically writes it back afterwards
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, LOCK_FILENAME), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self._read_index()
+                yield index
+                self._write_index(index)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        index_filepath = os.path.join(self.cache_dir, INDEX_FILENAME)
+        try:
+            with open(index_filepath, "r") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {}
+
+        # Entries whose pickle was removed are dropped, and pickles missing
+        # from the index (e.g. after the index was deleted) are re-added
+        stored_keys = [
+            os.path.splitext(filename)[0]
+            for filename in os.listdir(self.cache_dir)
+            if filename.endswith(".pkl")
+        ]
+        index = {
+            key: index.get(
+                key,
+                {
+                    "kind": None,
+                    "layouts": [],
+                    "size": os.path.getsize(self.filepath(key)),
+                },
+            )
+            for key in stored_keys
+        }
+        for key, entry in index.items():
+            entry["last_access"] = os.path.getmtime(self.filepath(key))
+        return index
+
+    def _write_index(self, index):
+        fd, tmp_filepath = tempfile.mkstemp(
+            dir=self.cache_dir, prefix="index", suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.chmod(tmp_filepath, 0o644)
+        os.replace(tmp_filepath, os.path.join(self.cache_dir, INDEX_FILENAME))
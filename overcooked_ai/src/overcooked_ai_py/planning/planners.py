@@ -4,6 +4,7 @@ import pickle
 import time
 
 import numpy as np
+import scipy.sparse
 
 from overcooked_ai_py.data.planners import (
     PLANNERS_DIR,
@@ -17,8 +18,9 @@ from overcooked_ai_py.mdp.overcooked_mdp import (
     OvercookedState,
     PlayerState,
 )
+from overcooked_ai_py.planning.planner_cache import PlannerCache
 from overcooked_ai_py.planning.search import Graph, NotConnectedError
-from overcooked_ai_py.utils import manhattan_distance
+from overcooked_ai_py.utils import LRUCache, manhattan_distance
 
 # Run planning logic with additional checks and
 # computation to prevent or identify possible minor errors
@@ -67,6 +69,21 @@ class MotionPlanner(object):
 
         self.all_plans = self._populate_all_plans()
 
+        # Distances to every terrain feature, used by min_cost_to_feature
+        self._feature_distances = FeatureDistanceTable(self)
+
+    def set_mdp(self, mdp):
+        """Re-binds the planner to an mdp with the same terrain"""
+        self.mdp = mdp
+
+    @property
+    def feature_distances(self):
+        """FeatureDistanceTable of this planner (built on first access for
+        planners pickled before it was computed at construction)"""
+        if getattr(self, "_feature_distances", None) is None:
+            self._feature_distances = FeatureDistanceTable(self)
+        return self._feature_distances
+
     def save_to_file(self, filename):
         with open(filename, "wb") as output:
             pickle.dump(self, output, pickle.HIGHEST_PROTOCOL)
@@ -82,15 +99,29 @@ class MotionPlanner(object):
         custom_filename=None,
         force_compute=False,
         info=False,
+        planner_cache=None,
     ):
+        """
+        Loads the motion planner for mdp from the planner cache, which is
+        keyed by terrain and counter_goals, or computes and caches it.
+        If a custom_filename is provided, the planner is instead pickled to
+        and loaded from that file in PLANNERS_DIR.
+        """
         assert isinstance(mdp, OvercookedGridworld)
 
-        filename = (
-            custom_filename
-            if custom_filename is not None
-            else mdp.layout_name + "_mp.pkl"
-        )
+        if custom_filename is None:
+            if planner_cache is None:
+                planner_cache = PlannerCache()
+            return planner_cache.get_or_compute(
+                "mp",
+                mdp,
+                {"counter_goals": counter_goals},
+                lambda: MotionPlanner(mdp, counter_goals),
+                force_compute=force_compute,
+                info=info,
+            )
 
+        filename = custom_filename
         if force_compute:
             return MotionPlanner.compute_mp(filename, mdp, counter_goals)
 
@@ -212,7 +243,7 @@ class MotionPlanner(object):
         """Checks that desired single-agent goal state (position and orientation)
         is reachable and is facing a terrain feature"""
         goal_position, goal_orientation = goal_pos_and_or
-        if goal_position not in self.mdp.get_valid_player_positions():
+        if not self.mdp.terrain_index.is_walkable(goal_position):
             return False
 
         # Restricting goals to be facing a terrain feature
@@ -364,27 +395,23 @@ class MotionPlanner(object):
         Determines the minimum number of timesteps necessary for a player to go from any
         terrain feature in list1 to any feature in list2 and perform an interact action
         """
-        min_dist = np.inf
-        min_manhattan = np.inf
-        for pos1, pos2 in itertools.product(pos_list1, pos_list2):
-            for mg1, mg2 in itertools.product(
-                self.motion_goals_for_pos[pos1],
-                self.motion_goals_for_pos[pos2],
-            ):
-                if not self.is_valid_motion_start_goal_pair(mg1, mg2):
-                    if manhattan_if_fail:
-                        pos0, pos1 = mg1[0], mg2[0]
-                        curr_man_dist = manhattan_distance(pos0, pos1)
-                        if curr_man_dist < min_manhattan:
-                            min_manhattan = curr_man_dist
-                    continue
-                curr_dist = self.get_gridworld_distance(mg1, mg2)
-                if curr_dist < min_dist:
-                    min_dist = curr_dist
+        min_dist = self.feature_distances.min_distance_between_features(
+            pos_list1, pos_list2
+        )
 
         # +1 to account for interaction action
         if manhattan_if_fail and min_dist == np.inf:
-            min_dist = min_manhattan
+            min_dist = min(
+                (
+                    manhattan_distance(mg1[0], mg2[0])
+                    for pos1, pos2 in itertools.product(pos_list1, pos_list2)
+                    for mg1, mg2 in itertools.product(
+                        self.motion_goals_for_pos[pos1],
+                        self.motion_goals_for_pos[pos2],
+                    )
+                ),
+                default=np.inf,
+            )
         min_cost = min_dist + 1
         return min_cost
 
@@ -401,20 +428,10 @@ class MotionPlanner(object):
         """
         start_pos = start_pos_and_or[0]
         assert self.mdp.get_terrain_type_at_pos(start_pos) != "X"
-        min_dist = np.inf
-        best_feature = None
-        for feature_pos in feature_pos_list:
-            for feature_goal in self.motion_goals_for_pos[feature_pos]:
-                if not self.is_valid_motion_start_goal_pair(
-                    start_pos_and_or, feature_goal
-                ):
-                    continue
-                curr_dist = self.get_gridworld_distance(
-                    start_pos_and_or, feature_goal
-                )
-                if curr_dist < min_dist:
-                    best_feature = feature_pos
-                    min_dist = curr_dist
+        table = self.feature_distances
+        min_dist, best_feature = table.min_distance_to_feature(
+            start_pos_and_or, feature_pos_list
+        )
         # +1 to account for interaction action
         min_cost = min_dist + 1
         if with_argmin:
@@ -450,16 +467,196 @@ class MotionPlanner(object):
         return goals
 
 
+class FeatureDistanceTable(object):
+    """
+    Table of the number of actions (not including the interaction) needed
+    to go from each valid position and orientation to a motion goal of each
+    terrain feature, i.e. the distances min_cost_to_feature minimizes over.
+
+    Attributes:
+        start_index (dict): (pos, or) -> row of `distances`
+        feature_index (dict): feature position -> column of `distances`
+        feature_positions (np.ndarray): (num_features + 1, 2) positions of
+            the features, indexed by column
+        distances (np.ndarray): (num_starts, num_features + 1) distances,
+            np.inf if the feature can not be reached. The last column is
+            always np.inf, so that `padding_index` can be used to pad lists
+            of candidate features without affecting their closest one
+        feature_to_feature (np.ndarray): (num_features + 1, num_features + 1)
+            distances from the motion goals of a feature to other features
+        static_sorted (dict): tuple of all positions of a terrain type ->
+            per start row, list of (distance, position) sorted by distance
+
+    The table is built with the motion planner and pickled along with it.
+    """
+
+    def __init__(self, motion_planner):
+        mdp = motion_planner.mdp
+        starts = mdp.get_valid_player_positions_and_orientations()
+        features = list(motion_planner.motion_goals_for_pos.keys())
+
+        self.start_index = {start: i for i, start in enumerate(starts)}
+        self.feature_index = {pos: j for j, pos in enumerate(features)}
+        self.padding_index = len(features)
+        self.feature_positions = np.zeros((len(features) + 1, 2), dtype=int)
+        if features:
+            self.feature_positions[:-1] = features
+
+        self.distances = np.full((len(starts), len(features) + 1), np.inf)
+        for start, i in self.start_index.items():
+            for feature_pos, j in self.feature_index.items():
+                for goal in motion_planner.motion_goals_for_pos[feature_pos]:
+                    if not motion_planner.is_valid_motion_start_goal_pair(
+                        start, goal
+                    ):
+                        continue
+                    dist = motion_planner.get_gridworld_distance(start, goal)
+                    if dist < self.distances[i, j]:
+                        self.distances[i, j] = dist
+
+        # Distance from the motion goals of a feature to the other features
+        self.feature_to_feature = np.full(
+            (len(features) + 1, len(features) + 1), np.inf
+        )
+        for feature_pos, j in self.feature_index.items():
+            goal_rows = [
+                self.start_index[goal]
+                for goal in motion_planner.motion_goals_for_pos[feature_pos]
+            ]
+            if goal_rows:
+                self.feature_to_feature[j] = self.distances[goal_rows].min(0)
+
+        # Single queries index plain lists, which is much cheaper than numpy
+        # scalar indexing for the handful of features they usually involve
+        self._distance_rows = self.distances.tolist()
+
+        # For every static terrain type, (distance, position) of the features
+        # of that type sorted by distance from each start (ties broken by
+        # terrain order), so that the closest one is a lookup and the closest
+        # one outside of a small dynamic set (e.g. the empty counters) is
+        # found by a short scan
+        self.static_sorted = {}
+        self._static_list_by_first_pos = {}
+        for terrain_type, positions in mdp.terrain_pos_dict.items():
+            if terrain_type == " " or not positions:
+                continue
+            positions = tuple(positions)
+            columns = [self.feature_index[pos] for pos in positions]
+            self.static_sorted[positions] = [
+                sorted(
+                    zip([row[j] for j in columns], positions),
+                    key=lambda dist_and_pos: dist_and_pos[0],
+                )
+                for row in self._distance_rows
+            ]
+            self._static_list_by_first_pos[positions[0]] = positions
+
+    def min_distance_to_feature(self, start_pos_and_or, feature_pos_list):
+        """
+        Distance from start_pos_and_or to the closest feature of
+        feature_pos_list, and that feature (None if none can be reached).
+        When the list starts with all features of a static terrain type (as
+        in dispensers + objects on counters), these are answered by a
+        lookup in `static_sorted` and only the remaining ones are scanned.
+        """
+        row = self.start_index[start_pos_and_or]
+        best_dist, best_pos = np.inf, None
+        rest = feature_pos_list
+        if len(feature_pos_list):
+            static_list = self._static_list_by_first_pos.get(
+                feature_pos_list[0]
+            )
+            if (
+                static_list is not None
+                and tuple(feature_pos_list[: len(static_list)]) == static_list
+            ):
+                best_dist, best_pos = self.static_sorted[static_list][row][0]
+                rest = feature_pos_list[len(static_list) :]
+
+        distances = self._distance_rows[row]
+        for pos in rest:
+            dist = distances[self.feature_index[pos]]
+            if dist < best_dist:
+                best_dist, best_pos = dist, pos
+        if best_dist == np.inf:
+            return np.inf, None
+        # Distances are whole numbers of actions, as with get_gridworld_distance
+        return int(best_dist), best_pos
+
+    def min_distance_to_static_feature(
+        self, start_pos_and_or, static_pos_list, excluded_pos=()
+    ):
+        """
+        Incremental counterpart of min_distance_to_feature for all features
+        of a static terrain type but a changing set of excluded positions
+        (e.g. counters without objects): the presorted features are scanned
+        until one that is not excluded, rather than re-ranking all of them.
+        """
+        if not len(static_pos_list):
+            return np.inf, None
+        row = self.start_index[start_pos_and_or]
+        for dist, pos in self.static_sorted[tuple(static_pos_list)][row]:
+            if dist == np.inf:
+                break
+            if pos not in excluded_pos:
+                return int(dist), pos
+        return np.inf, None
+
+    def min_distance_between_features(self, pos_list1, pos_list2):
+        """Distance from the closest motion goal of any feature of pos_list1
+        to any feature of pos_list2"""
+        if not len(pos_list1) or not len(pos_list2):
+            return np.inf
+        rows = [self.feature_index[pos] for pos in pos_list1]
+        columns = [self.feature_index[pos] for pos in pos_list2]
+        dist = self.feature_to_feature[np.ix_(rows, columns)].min()
+        return np.inf if dist == np.inf else int(dist)
+
+    def closest(self, start_rows, candidate_columns):
+        """
+        Closest candidate feature for each start, breaking ties in favor of
+        the first candidate, like min_cost_to_feature.
+
+        Args:
+            start_rows (np.ndarray): int array of start rows, of any shape S
+            candidate_columns (np.ndarray): int array of shape S + (L,)
+                (or broadcastable to it) of candidate feature columns,
+                padded with `padding_index`
+
+        Returns:
+            columns (np.ndarray): S array of the closest feature columns
+            distances (np.ndarray): S array of their distances (np.inf and
+                an arbitrary column if no candidate can be reached)
+        """
+        costs = self.distances[start_rows[..., None], candidate_columns]
+        best = np.argmin(costs, axis=-1)[..., None]
+        columns = np.take_along_axis(
+            np.broadcast_to(candidate_columns, costs.shape), best, axis=-1
+        )
+        distances = np.take_along_axis(costs, best, axis=-1)
+        return columns[..., 0], distances[..., 0]
+
+
 class JointMotionPlanner(object):
     """A planner that computes optimal plans for a two agents to
     arrive at goal positions and orientations in a OvercookedGridworld.
 
+    By default all joint plans are pre-computed when the planner is created.
+    If params["lazy_joint_plans"] is True, plans are instead computed the
+    first time they are requested, and the most recent
+    params["joint_plans_cache_size"] of them are memoized. The joint graph
+    is then kept sparse and searched one goal at a time, keeping the
+    distances to the params["joint_graph_cache_size"] most recent goals.
+
     Args:
         mdp (OvercookedGridworld): gridworld of interest
     """
 
     def __init__(self, mdp, params, debug=False):
         self.mdp = mdp
+        self.lazy = params.get("lazy_joint_plans", False)
+        self.cache_size = params.get("joint_plans_cache_size", 10000)
+        self.graph_cache_size = params.get("joint_graph_cache_size", 1000)
 
         # Whether starting orientations should be accounted for
         # when solving all motion problems
@@ -481,7 +678,15 @@ class JointMotionPlanner(object):
         # starting positions to goal positions (without
         # accounting for orientations)
         self.joint_graph_problem = self._joint_graph_from_grid()
-        self.all_plans = self._populate_all_plans()
+        if self.lazy:
+            self.all_plans = LRUCache(maxsize=self.cache_size)
+        else:
+            self.all_plans = self._populate_all_plans()
+
+    def set_mdp(self, mdp):
+        """Re-binds the planner to an mdp with the same terrain"""
+        self.mdp = mdp
+        self.motion_planner.set_mdp(mdp)
 
     def get_low_level_action_plan(self, start_jm_state, goal_jm_state):
         """
@@ -539,7 +744,10 @@ class JointMotionPlanner(object):
             )
             plan_key = (dummy_start_jm_state, goal_jm_state)
 
-        if plan_key not in self.all_plans:
+        if self.lazy and plan_key not in self.all_plans:
+            self.all_plans[plan_key] = self._compute_lazy_plan(*plan_key)
+
+        if self.all_plans.get(plan_key) is None:
             num_player = len(goal_jm_state)
             return [], None, [np.inf] * num_player
         joint_action_plan, end_jm_state, plan_lengths = self.all_plans[
@@ -547,6 +755,28 @@ class JointMotionPlanner(object):
         ]
         return joint_action_plan, end_jm_state, plan_lengths
 
+    def _compute_lazy_plan(self, joint_start_state, joint_goal_state):
+        """
+        Computes the plan that _populate_all_plans would have stored under
+        this key, or None if it would not have stored any
+        """
+        start_positions = [pos for pos, _ in joint_start_state]
+        valid_positions = self.mdp.get_valid_player_positions()
+        if self._agents_are_in_same_position(joint_start_state) or any(
+            pos not in valid_positions for pos in start_positions
+        ):
+            return None
+        if not self.is_valid_jm_start_goal_pair(
+            joint_start_state, joint_goal_state
+        ):
+            return None
+        joint_action_list, end_statuses, plan_lengths = self._obtain_plan(
+            joint_start_state, joint_goal_state
+        )
+        if end_statuses is None:
+            return None
+        return joint_action_list, end_statuses, plan_lengths
+
     def _populate_all_plans(self):
         """Pre-compute all valid plans"""
         all_plans = {}
@@ -1011,7 +1241,8 @@ class JointMotionPlanner(object):
         state_encoder = {v: k for k, v in state_decoder.items()}
         num_graph_nodes = len(state_decoder)
 
-        adjacency_matrix = np.zeros((num_graph_nodes, num_graph_nodes))
+        # Cheapest joint action cost for each (start, successor) edge
+        edge_costs = {}
         for start_state_index, start_joint_positions in state_decoder.items():
             for (
                 joint_action,
@@ -1019,19 +1250,29 @@ class JointMotionPlanner(object):
             ) in self._get_valid_successor_joint_positions(
                 start_joint_positions
             ).items():
-                successor_node_index = state_encoder[successor_jm_state]
-
+                edge = (start_state_index, state_encoder[successor_jm_state])
                 this_action_cost = self._graph_joint_action_cost(joint_action)
-                current_cost = adjacency_matrix[start_state_index][
-                    successor_node_index
-                ]
-
-                if current_cost == 0 or this_action_cost < current_cost:
-                    adjacency_matrix[start_state_index][
-                        successor_node_index
-                    ] = this_action_cost
+                if (
+                    edge not in edge_costs
+                    or this_action_cost < edge_costs[edge]
+                ):
+                    edge_costs[edge] = this_action_cost
 
-        return Graph(adjacency_matrix, state_encoder, state_decoder)
+        rows, cols = zip(*edge_costs.keys())
+        adjacency_matrix = scipy.sparse.csr_matrix(
+            (list(edge_costs.values()), (rows, cols)),
+            shape=(num_graph_nodes, num_graph_nodes),
+        )
+        if not self.lazy:
+            adjacency_matrix = adjacency_matrix.toarray()
+
+        return Graph(
+            adjacency_matrix,
+            state_encoder,
+            state_decoder,
+            lazy=self.lazy,
+            cache_size=self.graph_cache_size,
+        )
 
     def _graph_joint_action_cost(self, joint_action):
         """The cost used in the graph shortest-path problem for a certain joint-action"""
@@ -1124,6 +1365,11 @@ class MediumLevelActionManager(object):
         self.joint_motion_planner = JointMotionPlanner(mdp, mlam_params)
         self.motion_planner = self.joint_motion_planner.motion_planner
 
+    def set_mdp(self, mdp):
+        """Re-binds the action manager to an mdp with the same terrain"""
+        self.mdp = mdp
+        self.joint_motion_planner.set_mdp(mdp)
+
     def save_to_file(self, filename):
         with open(filename, "wb") as output:
             pickle.dump(self, output, pickle.HIGHEST_PROTOCOL)
@@ -1134,16 +1380,34 @@ class MediumLevelActionManager(object):
 
     @staticmethod
     def from_pickle_or_compute(
-        mdp, mlam_params, custom_filename=None, force_compute=False, info=False
+        mdp,
+        mlam_params,
+        custom_filename=None,
+        force_compute=False,
+        info=False,
+        planner_cache=None,
     ):
+        """
+        Loads the action manager for mdp from the planner cache, which is
+        keyed by terrain and mlam_params, or computes and caches it.
+        If a custom_filename is provided, the action manager is instead
+        pickled to and loaded from that file in PLANNERS_DIR.
+        """
         assert isinstance(mdp, OvercookedGridworld)
 
-        filename = (
-            custom_filename
-            if custom_filename is not None
-            else mdp.layout_name + "_am.pkl"
-        )
+        if custom_filename is None:
+            if planner_cache is None:
+                planner_cache = PlannerCache()
+            return planner_cache.get_or_compute(
+                "mlam",
+                mdp,
+                mlam_params,
+                lambda: MediumLevelActionManager(mdp, mlam_params),
+                force_compute=force_compute,
+                info=info,
+            )
 
+        filename = custom_filename
         if force_compute:
             return MediumLevelActionManager.compute_mlam(
                 filename, mdp, mlam_params, info=info
@@ -4,6 +4,8 @@ import time
 import numpy as np
 import scipy.sparse
 
+from overcooked_ai_py.utils import LRUCache
+
 
 class SearchTree(object):
     """
@@ -165,20 +167,41 @@ class SearchNode(object):
 
 
 class Graph(object):
-    def __init__(self, dense_adjacency_matrix, encoder, decoder, debug=False):
+    def __init__(
+        self,
+        dense_adjacency_matrix,
+        encoder,
+        decoder,
+        debug=False,
+        lazy=False,
+        cache_size=None,
+    ):
         """
         Each graph node is distinguishable by a key, encoded by the encoder into
         a index that corresponds to that node in the adjacency matrix defining the graph.
 
         Arguments:
-            dense_adjacency_matrix: 2D array with distances between nodes
+            dense_adjacency_matrix: 2D array with distances between nodes, or a scipy
+                sparse matrix with the same (non-zero) entries
             encoder: Dictionary mapping each graph node key to the adj mtx index it corresponds to
             decoder: Dictionary mapping each adj mtx index to a graph node key
+            lazy: If True, the all-pairs distance matrix is never computed. Instead, the distances
+                towards a goal node are computed with a single Dijkstra search the first time
+                that goal is queried, and memoized for the `cache_size` most recent goals.
         """
         self.sparse_adjacency_matrix = scipy.sparse.csr_matrix(
             dense_adjacency_matrix
         )
-        self.distance_matrix = self.shortest_paths(dense_adjacency_matrix)
+        self.lazy = lazy
+        if lazy:
+            self.distance_matrix = None
+            # Reversed graph, to search for shortest paths towards a goal
+            self._reverse_adjacency_matrix = (
+                self.sparse_adjacency_matrix.transpose().tocsr()
+            )
+            self._distances_to_goal = LRUCache(maxsize=cache_size)
+        else:
+            self.distance_matrix = self.shortest_paths(dense_adjacency_matrix)
         self._encoder = encoder
         self._decoder = decoder
         start_time = time.time()
@@ -203,18 +226,36 @@ class Graph(object):
         Uses scipy's implementation of shortest paths to compute a distance
         matrix between all elements of the graph
         """
-        csgraph = scipy.sparse.csgraph.csgraph_from_dense(
-            dense_adjacency_matrix
-        )
+        if scipy.sparse.issparse(dense_adjacency_matrix):
+            csgraph = self.sparse_adjacency_matrix
+        else:
+            csgraph = scipy.sparse.csgraph.csgraph_from_dense(
+                dense_adjacency_matrix
+            )
         return scipy.sparse.csgraph.shortest_path(csgraph)
 
+    def _get_distances_to(self, goal_index):
+        """
+        Returns the array of shortest distances from every node index
+        to the goal node index
+        """
+        if not self.lazy:
+            return self.distance_matrix[:, goal_index]
+        if goal_index not in self._distances_to_goal:
+            self._distances_to_goal[
+                goal_index
+            ] = scipy.sparse.csgraph.dijkstra(
+                self._reverse_adjacency_matrix, indices=goal_index
+            )
+        return self._distances_to_goal[goal_index]
+
     def dist(self, node1, node2):
         """
         Returns the calculated shortest distance between two nodes of the graph.
         Takes in as input the node keys.
         """
         idx1, idx2 = self._encoder[node1], self._encoder[node2]
-        return self.distance_matrix[idx1][idx2]
+        return self._get_distances_to(idx2)[idx1]
 
     def get_children(self, node):
         """
@@ -259,12 +300,13 @@ class Graph(object):
             return [goal_index]
 
         successors = self._get_children(start_index)
+        distances_to_goal = self._get_distances_to(goal_index)
 
         # NOTE: Currently does not support multiple equally costly paths
         best_index = None
         smallest_dist = np.inf
         for s in successors:
-            curr_dist = self.distance_matrix[s][goal_index]
+            curr_dist = distances_to_goal[s]
             if curr_dist < smallest_dist:
                 best_index = s
                 smallest_dist = curr_dist
@@ -4,8 +4,10 @@ _current_dir = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(_current_dir, "data")
 HUMAN_DATA_DIR = os.path.join(DATA_DIR, "human_data")
 PLANNERS_DIR = os.path.join(DATA_DIR, "planners")
+PLANNER_CACHE_DIR = os.path.join(PLANNERS_DIR, "cache")
 LAYOUTS_DIR = os.path.join(DATA_DIR, "layouts")
 LAYOUTS_M_DIR = os.path.join(DATA_DIR, "layouts_mutated")
+LAYOUT_STORE_PATH = os.path.join(DATA_DIR, "layout_store.jsonl")
 GRAPHICS_DIR = os.path.join(DATA_DIR, "graphics")
 FONTS_DIR = os.path.join(DATA_DIR, "fonts")
 TESTING_DATA_DIR = os.path.join(DATA_DIR, "testing")
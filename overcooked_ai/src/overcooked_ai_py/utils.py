@@ -6,7 +6,7 @@ import pickle
 import pstats
 import tempfile
 import uuid
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from collections.abc import Iterable
 from pathlib import Path
 
@@ -242,20 +242,19 @@ def profile(fnc):
     return inner
 
 
-def read_layout_dict(layout_name):
+def layout_path(layout_name):
+    """Path of the .layout file, mutated layouts (with '_M' in the name) are
+    in LAYOUTS_M_DIR"""
     if '_M' in layout_name :
-        return load_dict_from_file(
-            os.path.join(LAYOUTS_M_DIR, layout_name + ".layout")
-        )
-    return load_dict_from_file(
-        os.path.join(LAYOUTS_DIR, layout_name + ".layout")
-    )
+        return os.path.join(LAYOUTS_M_DIR, layout_name + ".layout")
+    return os.path.join(LAYOUTS_DIR, layout_name + ".layout")
+
+
+def read_layout_dict(layout_name):
+    return load_dict_from_file(layout_path(layout_name))
 
 def write_layout_dict(layout_name, layout_dict):
-    if '_M' in layout_name :
-        save_map_pretty(layout_dict, os.path.join(LAYOUTS_M_DIR, layout_name + ".layout"))
-    else :
-        save_map_pretty(layout_dict, os.path.join(LAYOUTS_DIR, layout_name + ".layout"))
+    save_map_pretty(layout_dict, layout_path(layout_name))
 
 
 class classproperty(property):
@@ -267,5 +266,34 @@ class OvercookedException(Exception):
     pass
 
 
+class LRUCache(OrderedDict):
+    """
+    Dictionary that keeps at most `maxsize` entries, evicting the least
+    recently used ones first. A `maxsize` of None means unbounded. Reads with
+    [] and get count as uses, membership tests with `in` don't.
+    """
+
+    def __init__(self, maxsize=None):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        # OrderedDict.get doesn't go through __getitem__
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if self.maxsize is not None and len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 def is_iterable(obj):
     return isinstance(obj, Iterable)
@@ -0,0 +1,137 @@
+"""
+Renders png thumbnails of the terrain of .layout files. Layout grids are read
+straight from the files (no OvercookedGridworld or planners are built), resized
+sprites are cached by the visualizer and layouts are rendered in parallel.
+Layouts whose png is already newer than the .layout file are skipped.
+
+Usage:
+    python -m overcooked_ai_py.visualization.layout_thumbnails OUTPUT_DIR [--layouts_dirs D1 D2 ...] [--tile_size 15] [--num_processes N] [--force]
+"""
+
+import argparse
+import multiprocessing
+import os
+
+from overcooked_ai_py.static import LAYOUTS_DIR, LAYOUTS_M_DIR
+from overcooked_ai_py.utils import load_dict_from_file
+from overcooked_ai_py.visualization.state_visualizer import StateVisualizer
+
+# one visualizer per tile size and process, so scaled sprites are reused
+_visualizers = {}
+
+
+def read_layout_grid(layout_path):
+    """Grid of a .layout file cleaned like in from_layout_name"""
+    grid = load_dict_from_file(layout_path)["grid"]
+    return [layout_row.strip() for layout_row in grid.split("\n")]
+
+
+def layout_paths_in_dirs(layouts_dirs):
+    return [
+        os.path.join(layouts_dir, filename)
+        for layouts_dir in layouts_dirs
+        for filename in sorted(os.listdir(layouts_dir))
+        if filename.endswith(".layout")
+    ]
+
+
+def thumbnail_path(layout_path, output_dir):
+    layout_name = os.path.splitext(os.path.basename(layout_path))[0]
+    return os.path.join(output_dir, layout_name + ".png")
+
+
+def is_thumbnail_up_to_date(layout_path, img_path):
+    if not os.path.exists(img_path):
+        return False
+    return os.path.getmtime(img_path) >= os.path.getmtime(layout_path)
+
+
+def render_layout_thumbnail(grid, img_path, tile_size=15):
+    """Saves png of the terrain of grid with tiles of tile_size pixels"""
+    visualizer = _visualizers.get(tile_size)
+    if visualizer is None:
+        visualizer = _visualizers[tile_size] = StateVisualizer(
+            tile_size=tile_size
+        )
+    visualizer.render_layout(grid, img_path)
+    return img_path
+
+
+def _render_layout_file(job):
+    layout_path, img_path, tile_size = job
+    return render_layout_thumbnail(
+        read_layout_grid(layout_path), img_path, tile_size
+    )
+
+
+def render_layout_thumbnails(
+    layout_paths, output_dir, tile_size=15, num_processes=None, force=False
+):
+    """
+    Renders png thumbnail of every .layout file to output_dir/<layout_name>.png
+
+    Args:
+        layout_paths (list): paths of .layout files
+        output_dir (str): directory for the pngs, created if missing
+        tile_size (int): size of a tile in pixels
+        num_processes (int): number of rendering processes, defaults to the
+            number of cpus; with 1 or less layouts are rendered in this process
+        force (bool): also render layouts whose png is newer than the .layout
+            file
+    Returns:
+        img_paths (list): paths of the rendered pngs, skipped layouts excluded
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for layout_path in layout_paths:
+        img_path = thumbnail_path(layout_path, output_dir)
+        if force or not is_thumbnail_up_to_date(layout_path, img_path):
+            jobs.append((layout_path, img_path, tile_size))
+
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    num_processes = min(num_processes, len(jobs))
+    if num_processes <= 1:
+        return [_render_layout_file(job) for job in jobs]
+
+    # spawned instead of forked processes, forking after pygame and cv2
+    # started their threads can deadlock; pool is closed and joined
+    # (not terminated) as SDL handles SIGTERM by itself
+    pool = multiprocessing.get_context("spawn").Pool(num_processes)
+    try:
+        chunksize = max(1, len(jobs) // (4 * num_processes))
+        img_paths = pool.map(_render_layout_file, jobs, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+    return img_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--layouts_dirs", nargs="+", default=[LAYOUTS_DIR, LAYOUTS_M_DIR]
+    )
+    parser.add_argument("--tile_size", type=int, default=15)
+    parser.add_argument("--num_processes", type=int, default=None)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render also layouts with png newer than the .layout file",
+    )
+    args = parser.parse_args()
+
+    layout_paths = layout_paths_in_dirs(args.layouts_dirs)
+    img_paths = render_layout_thumbnails(
+        layout_paths,
+        args.output_dir,
+        args.tile_size,
+        args.num_processes,
+        args.force,
+    )
+    print(
+        "rendered {} of {} layouts to {}".format(
+            len(img_paths), len(layout_paths), args.output_dir
+        )
+    )
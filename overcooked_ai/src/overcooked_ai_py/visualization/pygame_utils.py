@@ -81,6 +81,7 @@ class MultiFramePygameImage:
         self.frames_rectangles = MultiFramePygameImage.load_frames_rectangles(
             frames_path
         )
+        self._scaled_frames = {}
 
     def blit_on_surface(
         self, surface, top_left_pixel_position, frame_name, **kwargs
@@ -92,6 +93,34 @@ class MultiFramePygameImage:
             **kwargs
         )
 
+    def scaled_frame(self, frame_name, scale_by_factor):
+        """frame scaled by scale_by_factor, scaled only once per factor
+
+        sizes are rounded (not truncated like in scale_surface_by_factor) so
+        non-integral factors like 40 / 15 give frames of exactly the tile size
+        """
+        key = (frame_name, scale_by_factor)
+        frame = self._scaled_frames.get(key)
+        if frame is None:
+            rectangle = self.frames_rectangles[frame_name]
+            scaled_frame = pygame.transform.scale(
+                self.image.subsurface(rectangle),
+                (
+                    round(rectangle.width * scale_by_factor),
+                    round(rectangle.height * scale_by_factor),
+                ),
+            )
+            # copy to the pixel format of new surfaces (plus alpha) as blits
+            # between surfaces of different formats are several times slower
+            frame = pygame.surface.Surface(
+                scaled_frame.get_size(), pygame.SRCALPHA, 32
+            )
+            frame.blit(
+                scaled_frame, (0, 0), special_flags=pygame.BLEND_RGBA_MAX
+            )
+            self._scaled_frames[key] = frame
+        return frame
+
     @staticmethod
     def load_frames_rectangles(json_path):
         frames_json = load_from_json(json_path)
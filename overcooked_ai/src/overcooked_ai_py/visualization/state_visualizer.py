@@ -1,7 +1,10 @@
 import copy
 import math
+import multiprocessing
 import os
 
+import cv2
+import numpy as np
 import pygame
 
 from overcooked_ai_py.mdp.actions import Action, Direction
@@ -14,8 +17,10 @@ from overcooked_ai_py.mdp.layout_generator import (
     SERVING_LOC,
     TOMATO_DISPENSER,
 )
+from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld, OvercookedState
 from overcooked_ai_py.static import FONTS_DIR, GRAPHICS_DIR
 from overcooked_ai_py.utils import (
+    LRUCache,
     cumulative_rewards_from_rew_list,
     generate_temporary_file_path,
 )
@@ -24,7 +29,6 @@ from overcooked_ai_py.visualization.pygame_utils import (
     blit_on_new_surface_of_size,
     run_static_resizeable_window,
     scale_surface_by_factor,
-    vstack_surfaces,
 )
 from overcooked_ai_py.visualization.visualization_utils import (
     show_image_in_ipython,
@@ -33,6 +37,9 @@ from overcooked_ai_py.visualization.visualization_utils import (
 
 roboto_path = os.path.join(FONTS_DIR, "Roboto-Regular.ttf")
 
+# codecs used by cv2.VideoWriter for supported video file extensions
+VIDEO_FOURCC_BY_EXTENSION = {".mp4": "mp4v", ".avi": "MJPG"}
+
 
 class StateVisualizer:
     TERRAINS_IMG = MultiFramePygameImage(
@@ -55,6 +62,8 @@ class StateVisualizer:
     INTERACT_IMG = pygame.image.load(os.path.join(GRAPHICS_DIR, "interact.png"))
     STAY_IMG = pygame.image.load(os.path.join(GRAPHICS_DIR, "stay.png"))
     UNSCALED_TILE_SIZE = 15
+    # number of rendered static backgrounds (one per grid and scale) kept in memory
+    BACKGROUND_CACHE_SIZE = 32
     DEFAULT_VALUES = {
         "height": None,  # if None use grid_width - NOTE: can chop down hud if hud is wider than grid
         "width": None,  # if None use (hud_height+grid_height)
@@ -104,6 +113,9 @@ class StateVisualizer:
         params.update(kwargs)
         self.configure(**params)
         self.reload_fonts()
+        self._backgrounds = LRUCache(maxsize=self.BACKGROUND_CACHE_SIZE)
+        self._hud_recipes_surfaces = {}
+        self._action_prob_images = {}
 
     def reload_fonts(self):
         pygame.font.init()
@@ -218,6 +230,145 @@ class StateVisualizer:
 
         return img_directory_path
 
+    def iter_rendered_trajectory(
+        self, trajectories, trajectory_idx=0, hud_data=None, action_probs=None
+    ):
+        """
+        yields rendered frames of every timestep from trajectory as uint8 RGB arrays of
+        shape (height, width, 3), without writing any file
+        trajectories, trajectory_idx, hud_data, action_probs: same as in display_rendered_trajectory
+        """
+        states = trajectories["ep_states"][trajectory_idx]
+        grid = trajectories["mdp_params"][trajectory_idx]["terrain"]
+        if hud_data is None and self.is_rendering_hud:
+            hud_data = StateVisualizer.default_hud_data_from_trajectories(
+                trajectories, trajectory_idx
+            )
+        return self._iter_rendered_states(states, grid, hud_data, action_probs)
+
+    def render_trajectory_frames(
+        self, trajectories, trajectory_idx=0, hud_data=None, action_probs=None
+    ):
+        """
+        returns uint8 RGB array of shape (timesteps, height, width, 3) with rendered
+        frames of every timestep from trajectory
+        trajectories, trajectory_idx, hud_data, action_probs: same as in display_rendered_trajectory
+        """
+        num_frames = len(trajectories["ep_states"][trajectory_idx])
+        frames = None
+        for i, frame in enumerate(
+            self.iter_rendered_trajectory(
+                trajectories, trajectory_idx, hud_data, action_probs
+            )
+        ):
+            if frames is None:
+                frames = np.empty((num_frames,) + frame.shape, dtype=np.uint8)
+            StateVisualizer._check_frame_shape(frame, frames.shape[1:])
+            frames[i] = frame
+        return frames
+
+    def save_trajectory_video(
+        self,
+        trajectories,
+        video_path,
+        trajectory_idx=0,
+        hud_data=None,
+        action_probs=None,
+        fps=10,
+    ):
+        """
+        streams rendered frames of every timestep from trajectory into a video file,
+        with no per-frame file writes. Frames of odd width or height are padded with
+        background color as most codecs only support even sizes
+        video_path (str): path of the video, its extension (one of VIDEO_FOURCC_BY_EXTENSION keys) selects the codec
+        fps (int): frames per second of the video
+        trajectories, trajectory_idx, hud_data, action_probs: same as in display_rendered_trajectory
+        """
+        self._save_frames_as_video(
+            self.iter_rendered_trajectory(
+                trajectories, trajectory_idx, hud_data, action_probs
+            ),
+            video_path,
+            fps,
+        )
+        return video_path
+
+    def save_trajectory_videos(
+        self,
+        trajectories,
+        video_directory_path=None,
+        video_extension=".mp4",
+        video_prefix="",
+        action_probs=None,
+        fps=10,
+        num_processes=None,
+    ):
+        """
+        saves a video of every trajectory inside trajectories param in video_directory_path
+        (or temporary directory if path is not specified), rendering them in parallel
+        video_extension (str): one of VIDEO_FOURCC_BY_EXTENSION keys
+        action_probs(list(list(list((list(float)))))): action probs for every trajectory, timestep and player, or None
+        num_processes (int): number of worker processes, if None use number of cpus, if 1 render in this process
+        returns list of video paths, in the order of the trajectories
+        """
+        if not video_directory_path:
+            video_directory_path = generate_temporary_file_path(
+                prefix="overcooked_visualized_trajectories", extension=""
+            )
+        os.makedirs(video_directory_path, exist_ok=True)
+        video_pathes = [
+            os.path.join(
+                video_directory_path, video_prefix + str(idx) + video_extension
+            )
+            for idx in range(len(trajectories["ep_states"]))
+        ]
+        num_processes = min(num_processes or os.cpu_count(), len(video_pathes))
+        if num_processes <= 1:
+            for idx, video_path in enumerate(video_pathes):
+                self.save_trajectory_video(
+                    trajectories,
+                    video_path,
+                    idx,
+                    action_probs=(
+                        action_probs[idx] if action_probs is not None else None
+                    ),
+                    fps=fps,
+                )
+            return video_pathes
+
+        config = {
+            param_name: getattr(self, param_name)
+            for param_name in StateVisualizer.DEFAULT_VALUES
+        }
+        # states are sent as dicts as workers need the recipes configured to build them
+        jobs = [
+            (
+                config,
+                trajectories["mdp_params"][idx],
+                [state.to_dict() for state in trajectories["ep_states"][idx]],
+                (
+                    StateVisualizer.default_hud_data_from_trajectories(
+                        trajectories, idx
+                    )
+                    if self.is_rendering_hud
+                    else None
+                ),
+                action_probs[idx] if action_probs is not None else None,
+                video_path,
+                fps,
+            )
+            for idx, video_path in enumerate(video_pathes)
+        ]
+        # forked workers can deadlock on locks of the threads started by cv2 and pygame
+        pool = multiprocessing.get_context("spawn").Pool(num_processes)
+        try:
+            pool.map(_save_video_of_states, jobs)
+        finally:
+            # workers are not terminated as SDL handles SIGTERM by itself
+            pool.close()
+            pool.join()
+        return video_pathes
+
     def display_rendered_state(
         self,
         state,
@@ -259,21 +410,114 @@ class StateVisualizer:
 
         return img_path
 
+    def _iter_rendered_states(self, states, grid, hud_data=None, action_probs=None):
+        for i, state in enumerate(states):
+            surface = self.render_state(
+                state,
+                grid,
+                hud_data[i] if hud_data is not None else None,
+                action_probs=action_probs[i] if action_probs is not None else None,
+            )
+            # bytes of a surface are already in (height, width) order, unlike surfarray
+            yield np.frombuffer(
+                pygame.image.tobytes(surface, "RGB"), dtype=np.uint8
+            ).reshape(surface.get_height(), surface.get_width(), 3)
+
+    @staticmethod
+    def _check_frame_shape(frame, expected_shape):
+        if frame.shape != expected_shape:
+            raise ValueError(
+                "frames have different shapes %s and %s, set width and height of the visualizer to render frames of the same shape"
+                % (str(expected_shape), str(frame.shape))
+            )
+
+    def _save_frames_as_video(self, frames, video_path, fps=10):
+        extension = os.path.splitext(video_path)[1].lower()
+        if extension not in VIDEO_FOURCC_BY_EXTENSION:
+            raise ValueError(
+                "unsupported video extension %s, use one of %s"
+                % (extension, str(list(VIDEO_FOURCC_BY_EXTENSION)))
+            )
+        fourcc = cv2.VideoWriter_fourcc(*VIDEO_FOURCC_BY_EXTENSION[extension])
+        writer = None
+        try:
+            for frame in frames:
+                if writer is None:
+                    frame_shape = frame.shape
+                    height, width = frame_shape[:2]
+                    # most codecs only encode frames of even size, so frames are padded
+                    padding = (height % 2, width % 2)
+                    writer = cv2.VideoWriter(
+                        video_path,
+                        fourcc,
+                        fps,
+                        (width + padding[1], height + padding[0]),
+                    )
+                StateVisualizer._check_frame_shape(frame, frame_shape)
+                if any(padding):
+                    frame = cv2.copyMakeBorder(
+                        frame,
+                        0,
+                        padding[0],
+                        0,
+                        padding[1],
+                        cv2.BORDER_CONSTANT,
+                        value=self.background_color,
+                    )
+                writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        finally:
+            if writer is not None:
+                writer.release()
+
     def render_state(self, state, grid, hud_data=None, action_probs=None):
         """
         returns surface with rendered game state scaled to selected size,
         decoupled from display_rendered_state function to make testing easier
+
+        The terrain is rendered once per grid and tile size, and only players,
+        objects, timers and the hud are rendered on top of it for every state.
+        When the tile size is a multiple of UNSCALED_TILE_SIZE players and objects
+        are blitted with sprite frames scaled in advance, which gives the same
+        pixels as scaling the whole grid surface afterwards
         """
-        pygame.init()
+        if not pygame.get_init():
+            pygame.init()
         grid = grid or self.grid
         assert grid
-        grid_surface = pygame.surface.Surface(self._unscaled_grid_pixel_size(grid))
-        self._render_grid(grid_surface, grid)
-        self._render_players(grid_surface, state.players)
-        self._render_objects(grid_surface, state.objects, grid)
+        if self.tile_size % self.UNSCALED_TILE_SIZE == 0:
+            sprites_scale_by_factor = self.tile_size // self.UNSCALED_TILE_SIZE
+            unscaled_grid_surface = None
+            background = self._static_background(grid, sprites_scale_by_factor)
+            grid_size = background.get_size()
+        else:
+            unscaled_grid_surface = self._static_background(grid).copy()
+            self._render_players(unscaled_grid_surface, state.players)
+            self._render_objects(unscaled_grid_surface, state.objects, grid)
+            background = scale_surface_by_factor(
+                unscaled_grid_surface, self.scale_by_factor
+            )
+            grid_size = background.get_size()
 
-        if self.scale_by_factor != 1:
-            grid_surface = scale_surface_by_factor(grid_surface, self.scale_by_factor)
+        # the hud and the grid are rendered on subsurfaces of the stacked surface
+        if self.is_rendering_hud and hud_data:
+            hud_size = (
+                self.width or grid_size[0],
+                self._calculate_hud_height(hud_data),
+            )
+        else:
+            hud_size = (0, 0)
+        rendered_surface = pygame.surface.Surface(
+            (max(hud_size[0], grid_size[0]), hud_size[1] + grid_size[1])
+        )
+        if self.background_color and rendered_surface.get_size() != grid_size:
+            rendered_surface.fill(self.background_color)
+        grid_surface = rendered_surface.subsurface((0, hud_size[1]), grid_size)
+        grid_surface.blit(background, (0, 0))
+        if unscaled_grid_surface is None:
+            self._render_players(grid_surface, state.players, sprites_scale_by_factor)
+            self._render_objects(
+                grid_surface, state.objects, grid, sprites_scale_by_factor
+            )
 
         # render text after rescaling as text looks bad when is rendered small resolution and then rescalled to bigger one
         if self.is_rendering_cooking_timer:
@@ -283,19 +527,10 @@ class StateVisualizer:
         if self.is_rendering_action_probs and action_probs is not None:
             self._render_actions_probs(grid_surface, state.players, action_probs)
 
-        if self.is_rendering_hud and hud_data:
-            hud_width = self.width or grid_surface.get_width()
-            hud_surface = pygame.surface.Surface(
-                (hud_width, self._calculate_hud_height(hud_data))
-            )
+        if hud_size[1]:
+            hud_surface = rendered_surface.subsurface((0, 0), hud_size)
             hud_surface.fill(self.background_color)
             self._render_hud_data(hud_surface, hud_data)
-            rendered_surface = vstack_surfaces(
-                [hud_surface, grid_surface], self.background_color
-            )
-        else:
-            hud_width = None
-            rendered_surface = grid_surface
 
         result_surface_size = (
             self.width or rendered_surface.get_width(),
@@ -327,6 +562,31 @@ class StateVisualizer:
         pygame.image.save(grid_surface, save_path)
         return grid_surface
 
+    def render_layout(self, grid, img_path=None):
+        """
+        returns surface with the terrain of a layout grid, every tile scaled to
+        tile_size, players start positions (digits in the grid) are rendered as
+        floor; there is no need to build OvercookedGridworld of the layout.
+        Saves surface as png if img_path is given
+        """
+        surface = pygame.surface.Surface(
+            (self.tile_size * len(grid[0]), self.tile_size * len(grid))
+        )
+        for y_tile, row in enumerate(grid):
+            for x_tile, tile in enumerate(row):
+                if tile.isdigit():
+                    tile = EMPTY
+                self._blit_frame(
+                    surface,
+                    self.TERRAINS_IMG,
+                    (x_tile, y_tile),
+                    StateVisualizer.TILE_TO_FRAME_NAME[tile],
+                    self.scale_by_factor,
+                )
+        if img_path is not None:
+            pygame.image.save(surface, img_path)
+        return surface
+
     @property
     def scale_by_factor(self):
         return self.tile_size / StateVisualizer.UNSCALED_TILE_SIZE
@@ -359,6 +619,32 @@ class StateVisualizer:
             y_tiles * self.UNSCALED_TILE_SIZE,
         )
 
+    def _static_background(self, grid, scale_by_factor=1):
+        """surface with the rendered terrain of the grid, cached per grid and scale"""
+        key = (tuple("".join(row) for row in grid), scale_by_factor)
+        background = self._backgrounds.get(key)
+        if background is None:
+            background = pygame.surface.Surface(self._unscaled_grid_pixel_size(grid))
+            self._render_grid(background, grid)
+            if scale_by_factor != 1:
+                background = scale_surface_by_factor(background, scale_by_factor)
+            self._backgrounds[key] = background
+        return background
+
+    def _blit_frame(self, surface, image, position, frame_name, scale_by_factor=1):
+        """blit frame of MultiFramePygameImage on the tile at position of a surface
+        scaled by scale_by_factor"""
+        if scale_by_factor == 1:
+            image.blit_on_surface(
+                surface, self._position_in_unscaled_pixels(position), frame_name
+            )
+        else:
+            tile_size = round(self.UNSCALED_TILE_SIZE * scale_by_factor)
+            surface.blit(
+                image.scaled_frame(frame_name, scale_by_factor),
+                (tile_size * position[0], tile_size * position[1]),
+            )
+
     def _render_grid(self, surface, grid):
         for y_tile, row in enumerate(grid):
             for x_tile, tile in enumerate(row):
@@ -382,7 +668,7 @@ class StateVisualizer:
         (x, y) = position
         return (self.tile_size * x, self.tile_size * y)
 
-    def _render_players(self, surface, players):
+    def _render_players(self, surface, players, scale_by_factor=1):
         def chef_frame_name(direction_name, held_object_name):
             frame_name = direction_name
             if held_object_name:
@@ -408,15 +694,19 @@ class StateVisualizer:
                 else:
                     held_object_name = held_obj.name
 
-            self.CHEFS_IMG.blit_on_surface(
+            self._blit_frame(
                 surface,
-                self._position_in_unscaled_pixels(player.position),
+                self.CHEFS_IMG,
+                player.position,
                 chef_frame_name(direction_name, held_object_name),
+                scale_by_factor,
             )
-            self.CHEFS_IMG.blit_on_surface(
+            self._blit_frame(
                 surface,
-                self._position_in_unscaled_pixels(player.position),
+                self.CHEFS_IMG,
+                player.position,
                 hat_frame_name(direction_name, player_color_name),
+                scale_by_factor,
             )
 
     @staticmethod
@@ -429,7 +719,7 @@ class StateVisualizer:
             num_onions,
         )
 
-    def _render_objects(self, surface, objects, grid):
+    def _render_objects(self, surface, objects, grid, scale_by_factor=1):
         def render_soup(surface, obj, grid):
             (x_pos, y_pos) = obj.position
             if grid[y_pos][x_pos] == POT:
@@ -440,20 +730,16 @@ class StateVisualizer:
             else:  # grid[x][y] != POT
                 soup_status = "done"
             frame_name = StateVisualizer._soup_frame_name(obj.ingredients, soup_status)
-            self.SOUPS_IMG.blit_on_surface(
-                surface,
-                self._position_in_unscaled_pixels(obj.position),
-                frame_name,
+            self._blit_frame(
+                surface, self.SOUPS_IMG, obj.position, frame_name, scale_by_factor
             )
 
         for obj in objects.values():
             if obj.name == "soup":
                 render_soup(surface, obj, grid)
             else:
-                self.OBJECTS_IMG.blit_on_surface(
-                    surface,
-                    self._position_in_unscaled_pixels(obj.position),
-                    obj.name,
+                self._blit_frame(
+                    surface, self.OBJECTS_IMG, obj.position, obj.name, scale_by_factor
                 )
 
     def _render_cooking_timers(self, surface, objects, grid):
@@ -507,6 +793,23 @@ class StateVisualizer:
             return (text_surface_x + text_surface.get_width(), text_surface_y)
 
         def get_hud_recipes_surface(orders_dicts):
+            # orders rarely change during an episode, so their surfaces are cached
+            key = (
+                tuple(
+                    StateVisualizer._soup_frame_name(order_dict["ingredients"], "done")
+                    for order_dict in orders_dicts
+                ),
+                self.hud_order_size,
+                self.hud_distance_between_orders,
+                tuple(self.background_color),
+            )
+            recipes_surface = self._hud_recipes_surfaces.get(key)
+            if recipes_surface is None:
+                recipes_surface = render_hud_recipes_surface(orders_dicts)
+                self._hud_recipes_surfaces[key] = recipes_surface
+            return recipes_surface
+
+        def render_hud_recipes_surface(orders_dicts):
             order_width = order_height = self.hud_order_size
             scaled_order_size = (order_width, order_width)
             orders_surface_height = order_height
@@ -646,17 +949,28 @@ class StateVisualizer:
             },
         }
 
-        rescaled_arrow = pygame.transform.scale(
-            self.ARROW_IMG, (self.tile_size, self.tile_size)
-        )
-        # divide width by math.sqrt(2) to always fit both interact icon and stay icon into single tile
-        rescaled_interact = pygame.transform.scale(
-            self.INTERACT_IMG,
-            (int(self.tile_size / math.sqrt(2)), self.tile_size),
-        )
-        rescaled_stay = pygame.transform.scale(
-            self.STAY_IMG, (int(self.tile_size / math.sqrt(2)), self.tile_size)
-        )
+        if self.tile_size not in self._action_prob_images:
+            rescaled_arrow = pygame.transform.scale(
+                self.ARROW_IMG, (self.tile_size, self.tile_size)
+            )
+            # divide width by math.sqrt(2) to always fit both interact icon and stay icon into single tile
+            rescaled_interact = pygame.transform.scale(
+                self.INTERACT_IMG,
+                (int(self.tile_size / math.sqrt(2)), self.tile_size),
+            )
+            rescaled_stay = pygame.transform.scale(
+                self.STAY_IMG, (int(self.tile_size / math.sqrt(2)), self.tile_size)
+            )
+            self._action_prob_images[self.tile_size] = (
+                rescaled_arrow,
+                rescaled_interact,
+                rescaled_stay,
+            )
+        (
+            rescaled_arrow,
+            rescaled_interact,
+            rescaled_stay,
+        ) = self._action_prob_images[self.tile_size]
         for player, probs in zip(players, action_probs):
             if probs is not None:
                 for action in Action.ALL_ACTIONS:
@@ -688,3 +1002,19 @@ class StateVisualizer:
                         self._render_on_tile_position(
                             surface, img, position, **direction_to_aligns[action]
                         )
+
+
+def _save_video_of_states(job):
+    """renders states into a video, used by worker processes of save_trajectory_videos"""
+    config, mdp_params, state_dicts, hud_data, action_probs, video_path, fps = job
+    # configures the recipes of the trajectory before building its states
+    OvercookedGridworld(**mdp_params)
+    states = [OvercookedState.from_dict(state_dict) for state_dict in state_dicts]
+    visualizer = StateVisualizer(**config)
+    visualizer._save_frames_as_video(
+        visualizer._iter_rendered_states(
+            states, mdp_params["terrain"], hud_data, action_probs
+        ),
+        video_path,
+        fps,
+    )
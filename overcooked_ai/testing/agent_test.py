@@ -67,6 +67,44 @@ class TestAgentEvaluator(unittest.TestCase):
                 )
             )
 
+    def test_check_dynamics(self):
+        ap = AgentPair(RandomAgent(), RandomAgent())
+        trajs = self.agent_eval.evaluate_agent_pair(ap, num_games=2)
+        for mode in ["off", "sampled", "full", "full_parallel"]:
+            AgentEvaluator.check_trajectories(
+                trajs, verbose=False, check_dynamics=mode, num_processes=2
+            )
+
+        # the state after the 50th transition is replaced by the start state
+        trajs["ep_states"][1][50] = trajs["ep_states"][1][0]
+        AgentEvaluator.check_trajectories(trajs, verbose=False)
+        for mode in ["full", "full_parallel"]:
+            with self.assertRaises(AssertionError):
+                AgentEvaluator.check_trajectories(
+                    trajs, verbose=False, check_dynamics=mode, num_processes=2
+                )
+        # 5 of the 99 transitions of each episode are sampled, seeds 9 and 22
+        # sample transitions 50 and 49 of the second episode, seed 0 neither
+        self.assertEqual(len(trajs["ep_states"][1]), 100)
+        for seed in [9, 22]:
+            with self.assertRaises(AssertionError):
+                AgentEvaluator.check_trajectories(
+                    trajs,
+                    verbose=False,
+                    check_dynamics="sampled",
+                    num_samples=5,
+                    seed=seed,
+                )
+        AgentEvaluator.check_trajectories(
+            trajs,
+            verbose=False,
+            check_dynamics="sampled",
+            num_samples=5,
+            seed=0,
+        )
+        with self.assertRaises(ValueError):
+            AgentEvaluator.check_trajectories(trajs, check_dynamics="fast")
+
     def test_mlam_computation(self):
         try:
             self.agent_eval.env.mlam
@@ -1,8 +1,12 @@
 import glob
+import itertools
 import json
 import os
+import pickle
 import shutil
+import tempfile
 import unittest
+from collections import Counter
 from math import factorial
 
 import gymnasium
@@ -17,6 +21,7 @@ from overcooked_ai_py.agents.agent import (
 )
 from overcooked_ai_py.agents.benchmarking import AgentEvaluator
 from overcooked_ai_py.mdp.actions import Action, Direction
+from overcooked_ai_py.mdp.layout_store import LayoutStore
 from overcooked_ai_py.mdp.layout_generator import (
     DISH_DISPENSER,
     ONION_DISPENSER,
@@ -25,11 +30,13 @@ from overcooked_ai_py.mdp.layout_generator import (
     TOMATO_DISPENSER,
     LayoutGenerator,
 )
+from overcooked_ai_py.mdp.overcooked_batch import BatchOvercookedGridworld
 from overcooked_ai_py.mdp.overcooked_env import (
     DEFAULT_ENV_PARAMS,
     OvercookedEnv,
 )
 from overcooked_ai_py.mdp.overcooked_mdp import (
+    CompactOvercookedState,
     ObjectState,
     OvercookedGridworld,
     OvercookedState,
@@ -430,6 +437,63 @@ class TestGridworld(unittest.TestCase):
             "\n" + str(actual_start_state) + "\n" + str(expected_start_state),
         )
 
+    def test_layout_store(self):
+        layout_name = "layout_store_test"
+        layouts_dir = tempfile.mkdtemp()
+        layout_file = os.path.join(layouts_dir, layout_name + ".layout")
+        store_path = os.path.join(layouts_dir, "layout_store.jsonl")
+
+        def write_layout(grid, mtime_offset_ns=0):
+            with open(layout_file, "w") as f:
+                f.write(str({"grid": grid, "start_bonus_orders": []}))
+            mtime_ns = os.stat(layout_file).st_mtime_ns + mtime_offset_ns
+            os.utime(layout_file, ns=(mtime_ns, mtime_ns))
+
+        def read_gridworld(store):
+            # as in OvercookedGridworld.from_layout_name
+            layout = store.read(layout_name)
+            return OvercookedGridworld.from_grid(
+                layout["grid"], layout["params"], validate_grid=not layout["valid"]
+            )
+
+        try:
+            write_layout("XXPXX\n        O  2O\n        X1  X\n        XDXSX")
+            store = LayoutStore(
+                store_path,
+                layouts_dirs=[layouts_dir],
+                validate_grid=OvercookedGridworld._assert_valid_grid,
+            )
+            expected_layout = {
+                "grid": ["XXPXX", "O  2O", "X1  X", "XDXSX"],
+                "valid": True,
+                "params": {"start_bonus_orders": []},
+            }
+            self.assertEqual(store.read(layout_name), expected_layout)
+            self.assertEqual(read_gridworld(store).shape, (5, 4))
+            # compiled store is written and read back by new stores
+            self.assertTrue(os.path.exists(store_path))
+            self.assertEqual(
+                LayoutStore(store_path, layouts_dirs=[layouts_dir]).read(layout_name),
+                expected_layout,
+            )
+
+            # changed source files are compiled again
+            write_layout(
+                "XXPXX\n        O  2O\n        X1  X\n        XDXSX\n", 10**9
+            )
+            self.assertEqual(
+                store.read(layout_name)["grid"],
+                ["XXPXX", "O  2O", "X1  X", "XDXSX", ""],
+            )
+            self.assertFalse(store.read(layout_name)["valid"])
+            with self.assertRaises(AssertionError):
+                read_gridworld(store)
+        finally:
+            shutil.rmtree(layouts_dir)
+
+        with self.assertRaises(FileNotFoundError):
+            store.read(layout_name)
+
     def test_actions(self):
         bad_state = OvercookedState(
             [
@@ -598,6 +662,53 @@ class TestGridworld(unittest.TestCase):
                 sparse_reward += sum(infos["sparse_reward_by_agent"])
             seed += 1
 
+    def test_terrain_index(self):
+        index = self.base_mdp.terrain_index
+        valid_positions = self.base_mdp.get_valid_player_positions()
+        self.assertEqual(index.positions[" "], frozenset(valid_positions))
+        self.assertEqual(int(index.walkable.sum()), len(valid_positions))
+        self.assertFalse(index.is_walkable((-1, 0)))
+
+        for pos in valid_positions:
+            for o, a in itertools.product(
+                Direction.ALL_DIRECTIONS, Action.ALL_ACTIONS
+            ):
+                new_pos, new_o = self.base_mdp._move_if_direction(pos, o, a)
+                if a == interact:
+                    self.assertEqual((new_pos, new_o), (pos, o))
+                    continue
+                self.assertEqual(new_o, o if a == stay else a)
+                moved_pos = Action.move_in_direction(pos, a)
+                self.assertEqual(
+                    new_pos, moved_pos if moved_pos in valid_positions else pos
+                )
+
+    def test_joint_movement_table(self):
+        np.random.seed(0)
+        random_pair = AgentPair(
+            RandomAgent(all_actions=True), RandomAgent(all_actions=True)
+        )
+        tabled_mdp = OvercookedGridworld.from_layout_name("mdp_test")
+        precomputed_mdp = OvercookedGridworld.from_layout_name("mdp_test")
+        tabled_mdp.enable_joint_movement_table(max_size=50)
+        precomputed_mdp.enable_joint_movement_table(precompute=True)
+
+        state = self.base_mdp.get_standard_start_state()
+        for _ in range(500):
+            joint_action, _ = zip(*random_pair.joint_action(state))
+            expected_state, _ = self.base_mdp.get_state_transition(
+                state, joint_action
+            )
+            for mdp in [tabled_mdp, precomputed_mdp]:
+                next_state, _ = mdp.get_state_transition(state, joint_action)
+                self.assertEqual(next_state, expected_state)
+            state = expected_state
+        self.assertLessEqual(len(tabled_mdp.joint_movement_table), 50)
+
+        # The table is not pickled
+        unpickled_mdp = pickle.loads(pickle.dumps(precomputed_mdp))
+        self.assertIsNone(unpickled_mdp.joint_movement_table)
+
     def test_four_player_mdp(self):
         try:
             OvercookedGridworld.from_layout_name("multiplayer_schelling")
@@ -1004,6 +1115,276 @@ def random_joint_action():
     return (Action.INDEX_TO_ACTION[a_idx0], Action.INDEX_TO_ACTION[a_idx1])
 
 
+class TestCompactOvercookedState(unittest.TestCase):
+    def setUp(self):
+        self.base_mdp = OvercookedGridworld.from_layout_name("mdp_test")
+        self.state = OvercookedState(
+            [
+                P((2, 2), n, SoupState.get_soup((2, 2), 2, 1, 4)),
+                P((3, 1), w, Obj("dish", (3, 1))),
+            ],
+            {
+                (0, 0): Obj("onion", (0, 0)),
+                (2, 0): SoupState.get_soup((2, 0), 2, cooking_tick=-1),
+            },
+            all_orders=self.base_mdp.start_all_orders,
+            timestep=7,
+        )
+        np.random.seed(0)
+
+    def test_conversion(self):
+        compact_state = CompactOvercookedState.from_state(self.state)
+        self.assertEqual(compact_state.to_state(), self.state)
+        self.assertEqual(compact_state.to_dict(), self.state.to_dict())
+        self.assertEqual(
+            CompactOvercookedState.from_dict(self.state.to_dict()),
+            compact_state,
+        )
+        self.assertEqual(
+            compact_state.players_pos_and_or, self.state.players_pos_and_or
+        )
+
+    def test_clone(self):
+        compact_state = CompactOvercookedState.from_state(self.state)
+        clone = compact_state.clone()
+        self.assertEqual(clone, compact_state)
+        self.assertEqual(hash(clone), hash(compact_state))
+        self.assertIs(clone.objects, compact_state.objects)
+
+        # Stepping a clone must leave the original untouched
+        next_state, _ = self.base_mdp.get_state_transition(
+            clone, [interact, interact]
+        )
+        self.assertEqual(compact_state.to_state(), self.state)
+        self.assertNotEqual(next_state, compact_state)
+
+    def test_transitions_match_full_state(self):
+        state = self.base_mdp.get_standard_start_state()
+        compact_state = CompactOvercookedState.from_state(state)
+        for _ in range(500):
+            joint_action = random_joint_action()
+            state, infos = self.base_mdp.get_state_transition(
+                state, joint_action
+            )
+            compact_state, compact_infos = self.base_mdp.get_state_transition(
+                compact_state, joint_action
+            )
+            self.assertIsInstance(compact_state, CompactOvercookedState)
+            self.assertEqual(compact_state.to_state(), state)
+            self.assertEqual(compact_infos, infos)
+
+
+class TestBatchGridworld(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def _check_batch_matches_scalar(self, mdp, batch_size=16, horizon=300):
+        batch_mdp = BatchOvercookedGridworld(mdp)
+        states = [mdp.get_standard_start_state()] * batch_size
+        batch_state = batch_mdp.states_to_batch(states)
+        for _ in range(horizon):
+            joint_actions = [random_joint_action() for _ in states]
+            transitions = [
+                mdp.get_state_transition(state, joint_action)
+                for state, joint_action in zip(states, joint_actions)
+            ]
+            states = [new_state for new_state, _ in transitions]
+            batch_state, infos = batch_mdp.get_state_transition(
+                batch_state, joint_actions
+            )
+            self.assertEqual(batch_mdp.batch_to_states(batch_state), states)
+            for b, (_, scalar_infos) in enumerate(transitions):
+                for key in [
+                    "sparse_reward_by_agent",
+                    "shaped_reward_by_agent",
+                ]:
+                    self.assertEqual(
+                        list(infos[key][b]), scalar_infos[key], key
+                    )
+
+    def test_state_conversion(self):
+        mdp = OvercookedGridworld.from_layout_name("mdp_test")
+        batch_mdp = BatchOvercookedGridworld(mdp)
+        state = OvercookedState(
+            [
+                P((2, 2), n, SoupState.get_soup((2, 2), 2, 1, 4)),
+                P((3, 1), w, Obj("dish", (3, 1))),
+            ],
+            {
+                (0, 0): Obj("onion", (0, 0)),
+                (2, 0): SoupState.get_soup((2, 0), 2, cooking_tick=-1),
+            },
+            all_orders=mdp.start_all_orders,
+            timestep=7,
+        )
+        batch_state = batch_mdp.states_to_batch([state, state.deepcopy()])
+        self.assertEqual(len(batch_state), 2)
+        self.assertEqual(batch_mdp.batch_to_states(batch_state), [state] * 2)
+        self.assertEqual(
+            batch_mdp.batch_to_states(batch_state[1:]), [state]
+        )
+
+    def test_transitions_match_scalar(self):
+        mdp = OvercookedGridworld.from_layout_name("mdp_test")
+        self._check_batch_matches_scalar(mdp)
+
+    def test_old_dynamics_transitions_match_scalar(self):
+        mdp = OvercookedGridworld.from_layout_name(
+            "cramped_room", old_dynamics=True
+        )
+        self._check_batch_matches_scalar(mdp)
+
+    def test_action_indices(self):
+        mdp = OvercookedGridworld.from_layout_name("cramped_room")
+        batch_mdp = BatchOvercookedGridworld(mdp)
+        batch_state = batch_mdp.get_standard_start_state(3)
+        joint_actions = [(n, s), (interact, stay), (e, w)]
+        from_tuples, _ = batch_mdp.get_state_transition(
+            batch_state, joint_actions
+        )
+        from_indices, _ = batch_mdp.get_state_transition(
+            batch_state, batch_mdp.joint_actions_to_indices(joint_actions)
+        )
+        self.assertEqual(
+            batch_mdp.batch_to_states(from_tuples),
+            batch_mdp.batch_to_states(from_indices),
+        )
+        # The input batch must not be modified unless stepping in place
+        self.assertTrue(np.all(batch_state.timesteps == 0))
+
+
+def reference_lossless_state_encoding(mdp, overcooked_state, horizon=400):
+    """
+    Per-state, per-layer lossless encoding that OvercookedGridworld used before
+    encodings were batched, kept to check the batched encoder against it
+    """
+    base_map_features = [
+        "pot_loc",
+        "counter_loc",
+        "onion_disp_loc",
+        "tomato_disp_loc",
+        "dish_disp_loc",
+        "serve_loc",
+    ]
+    variable_map_features = [
+        "onions_in_pot",
+        "tomatoes_in_pot",
+        "onions_in_soup",
+        "tomatoes_in_soup",
+        "soup_cook_time_remaining",
+        "soup_done",
+        "dishes",
+        "onions",
+        "tomatoes",
+    ]
+    urgency_features = ["urgency"]
+    all_objects = overcooked_state.all_objects_list
+
+    def make_layer(position, value):
+        layer = np.zeros(mdp.shape)
+        layer[position] = value
+        return layer
+
+    def process_for_player(primary_agent_idx):
+        other_agent_idx = 1 - primary_agent_idx
+        ordered_player_features = [
+            "player_{}_loc".format(primary_agent_idx),
+            "player_{}_loc".format(other_agent_idx),
+        ] + [
+            "player_{}_orientation_{}".format(
+                i, Direction.DIRECTION_TO_INDEX[d]
+            )
+            for i, d in itertools.product(
+                [primary_agent_idx, other_agent_idx],
+                Direction.ALL_DIRECTIONS,
+            )
+        ]
+        LAYERS = (
+            ordered_player_features
+            + base_map_features
+            + variable_map_features
+            + urgency_features
+        )
+        state_mask_dict = {k: np.zeros(mdp.shape) for k in LAYERS}
+
+        if horizon - overcooked_state.timestep < 40:
+            state_mask_dict["urgency"] = np.ones(mdp.shape)
+
+        for feature, locations in [
+            ("counter_loc", mdp.get_counter_locations()),
+            ("pot_loc", mdp.get_pot_locations()),
+            ("onion_disp_loc", mdp.get_onion_dispenser_locations()),
+            ("tomato_disp_loc", mdp.get_tomato_dispenser_locations()),
+            ("dish_disp_loc", mdp.get_dish_dispenser_locations()),
+            ("serve_loc", mdp.get_serving_locations()),
+        ]:
+            for loc in locations:
+                state_mask_dict[feature][loc] = 1
+
+        for i, player in enumerate(overcooked_state.players):
+            player_orientation_idx = Direction.DIRECTION_TO_INDEX[
+                player.orientation
+            ]
+            state_mask_dict["player_{}_loc".format(i)] = make_layer(
+                player.position, 1
+            )
+            state_mask_dict[
+                "player_{}_orientation_{}".format(i, player_orientation_idx)
+            ] = make_layer(player.position, 1)
+
+        for obj in all_objects:
+            if obj.name == "soup":
+                ingredients_dict = Counter(obj.ingredients)
+                if obj.position in mdp.get_pot_locations():
+                    if obj.is_idle:
+                        state_mask_dict["onions_in_pot"] += make_layer(
+                            obj.position, ingredients_dict["onion"]
+                        )
+                        state_mask_dict["tomatoes_in_pot"] += make_layer(
+                            obj.position, ingredients_dict["tomato"]
+                        )
+                    else:
+                        state_mask_dict["onions_in_soup"] += make_layer(
+                            obj.position, ingredients_dict["onion"]
+                        )
+                        state_mask_dict["tomatoes_in_soup"] += make_layer(
+                            obj.position, ingredients_dict["tomato"]
+                        )
+                        state_mask_dict["soup_cook_time_remaining"] += make_layer(
+                            obj.position, obj.cook_time - obj._cooking_tick
+                        )
+                        if obj.is_ready:
+                            state_mask_dict["soup_done"] += make_layer(
+                                obj.position, 1
+                            )
+                else:
+                    state_mask_dict["onions_in_soup"] += make_layer(
+                        obj.position, ingredients_dict["onion"]
+                    )
+                    state_mask_dict["tomatoes_in_soup"] += make_layer(
+                        obj.position, ingredients_dict["tomato"]
+                    )
+                    state_mask_dict["soup_done"] += make_layer(obj.position, 1)
+            elif obj.name == "dish":
+                state_mask_dict["dishes"] += make_layer(obj.position, 1)
+            elif obj.name == "onion":
+                state_mask_dict["onions"] += make_layer(obj.position, 1)
+            elif obj.name == "tomato":
+                state_mask_dict["tomatoes"] += make_layer(obj.position, 1)
+            else:
+                raise ValueError("Unrecognized object")
+
+        state_mask_stack = np.array(
+            [state_mask_dict[layer_id] for layer_id in LAYERS]
+        )
+        state_mask_stack = np.transpose(state_mask_stack, (1, 2, 0))
+        return np.array(state_mask_stack).astype(int)
+
+    return tuple(
+        process_for_player(i) for i in range(len(overcooked_state.players))
+    )
+
+
 class TestFeaturizations(unittest.TestCase):
     def setUp(self):
         self.base_mdp = OvercookedGridworld.from_layout_name("cramped_room")
@@ -1092,6 +1473,58 @@ class TestFeaturizations(unittest.TestCase):
                 np.array_equal(expected_featurization, featurized_observations)
             )
 
+    def test_batched_lossless_state_featurization(self):
+        trajs = self.env.get_rollouts(
+            self.greedy_human_model_pair, num_games=2, info=False
+        )
+        states = [state for ep_states in trajs["ep_states"] for state in ep_states]
+        expected = np.array(
+            [
+                reference_lossless_state_encoding(self.base_mdp, state)
+                for state in states
+            ]
+        )
+        # the episodes reach the last 40 steps, where urgency is encoded
+        self.assertTrue(expected[..., -1].any())
+
+        single = np.array(
+            [self.base_mdp.lossless_state_encoding(state) for state in states]
+        )
+        self.assertEqual(single.dtype, expected.dtype)
+        self.assertTrue(np.array_equal(expected, single))
+
+        batched = self.base_mdp.lossless_state_encodings(states)
+        self.assertEqual(batched.dtype, expected.dtype)
+        self.assertTrue(np.array_equal(expected, batched))
+
+        out = np.ones(expected.shape, dtype=np.uint8)
+        batched = self.base_mdp.lossless_state_encodings(states, out=out)
+        self.assertIs(batched, out)
+        self.assertTrue(np.array_equal(expected, batched))
+
+        batched = self.base_mdp.lossless_state_encodings(states, dtype=bool)
+        self.assertTrue(np.array_equal(expected > 0, batched))
+
+    def test_batched_state_featurization(self):
+        trajs = self.env.get_rollouts(
+            self.greedy_human_model_pair, num_games=2, info=False
+        )
+        states = [state for ep_states in trajs["ep_states"] for state in ep_states]
+
+        for num_pots in range(3):
+            expected = np.array(
+                [
+                    self.base_mdp.featurize_state(state, self.mlam, num_pots=num_pots)
+                    for state in states
+                ],
+                dtype=np.float32,
+            )
+            batched = self.base_mdp.featurize_states(
+                states, self.mlam, num_pots=num_pots
+            )
+            self.assertEqual(batched.dtype, np.float32)
+            self.assertTrue(np.array_equal(expected, batched))
+
     def test_state_featurization_symmetry(self):
         trajs = self.env.get_rollouts(
             self.greedy_human_model_pair, num_games=5, info=False
@@ -1169,6 +1602,57 @@ class TestOvercookedEnvironment(unittest.TestCase):
             joint_action = random_joint_action()
             self.env.step(joint_action)
 
+    def test_step_fast(self):
+        agent_pair = AgentPair(
+            GreedyHumanModel(self.env.mlam), GreedyHumanModel(self.env.mlam)
+        )
+        agent_pair.set_mdp(self.base_mdp)
+        fast_env = OvercookedEnv.from_mdp(
+            self.base_mdp, info_level=0, **DEFAULT_ENV_PARAMS
+        )
+        lean_env = OvercookedEnv.from_mdp(
+            self.base_mdp, info_level=0, **DEFAULT_ENV_PARAMS
+        )
+
+        total_sparse = 0
+        while not self.env.is_done():
+            joint_action, _ = zip(*agent_pair.joint_action(self.env.state))
+            _, infos = self.base_mdp.get_state_transition(
+                self.env.state, joint_action
+            )
+            state, sparse, _, _ = self.env.step(joint_action)
+            total_sparse += sparse
+
+            next_state, sparse_by_agent, shaped_by_agent = fast_env.step_fast(
+                joint_action, log_events=True
+            )
+            self.assertEqual(next_state, state)
+            self.assertEqual(sparse_by_agent, infos["sparse_reward_by_agent"])
+            self.assertEqual(shaped_by_agent, infos["shaped_reward_by_agent"])
+
+            next_state, sparse_by_agent, shaped_by_agent = lean_env.step_fast(
+                joint_action, validate=False
+            )
+            self.assertEqual(next_state, state)
+            self.assertEqual(sparse_by_agent, infos["sparse_reward_by_agent"])
+            self.assertEqual(shaped_by_agent, infos["shaped_reward_by_agent"])
+
+        self.assertGreater(total_sparse, 0)
+        self.assertTrue(fast_env.is_done())
+        for key, value in self.env.game_stats.items():
+            self.assertEqual(list(fast_env.game_stats[key]), list(value))
+
+        # Game stats are not updated without log_events
+        self.assertFalse(any(lean_env.game_stats["soup_delivery"]))
+
+        # Illegal actions are still caught when validating
+        fast_env.reset()
+        illegal_state = fast_env.state.deepcopy()
+        illegal_state.players[0].position = (0, 0)
+        fast_env.state = illegal_state
+        with self.assertRaises(AssertionError):
+            fast_env.step_fast((stay, stay))
+
     def test_execute_plan(self):
         action_plan = [random_joint_action() for _ in range(10)]
         self.env.execute_plan(self.base_mdp.get_standard_start_state(), action_plan)
@@ -1,5 +1,10 @@
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+
 from overcooked_ai_py.agents.agent import AgentPair, GreedyHumanModel
 from overcooked_ai_py.agents.benchmarking import AgentEvaluator
 from overcooked_ai_py.mdp.actions import Action, Direction
@@ -11,7 +16,14 @@ from overcooked_ai_py.mdp.overcooked_mdp import (
     PlayerState,
     SoupState,
 )
-from overcooked_ai_py.planning.planners import MediumLevelActionManager
+from overcooked_ai_py.planning.planner_cache import PlannerCache, planner_key
+from overcooked_ai_py.planning.planners import (
+    NO_COUNTERS_PARAMS,
+    JointMotionPlanner,
+    MediumLevelActionManager,
+    MotionPlanner,
+)
+from overcooked_ai_py.utils import LRUCache
 
 large_mdp_tests = False
 force_compute = True
@@ -184,6 +196,48 @@ class TestMotionPlanner(unittest.TestCase):
             planner, start_status, goal_status, expected_length=3
         )
 
+    def test_min_cost_to_feature(self):
+        mdp = OvercookedGridworld.from_layout_name("counter_circuit")
+        planner = MotionPlanner(mdp)
+        counters = mdp.get_counter_locations()
+
+        def search_min_cost(start, feature_pos_list):
+            min_dist, best_feature = np.inf, None
+            for feature_pos in feature_pos_list:
+                for goal in planner.motion_goals_for_pos[feature_pos]:
+                    if not planner.is_valid_motion_start_goal_pair(
+                        start, goal
+                    ):
+                        continue
+                    dist = planner.get_gridworld_distance(start, goal)
+                    if dist < min_dist:
+                        min_dist, best_feature = dist, feature_pos
+            return min_dist + 1, best_feature
+
+        for start in mdp.get_valid_player_positions_and_orientations():
+            for feature_pos_list in [
+                mdp.get_pot_locations(),
+                mdp.get_onion_dispenser_locations() + counters[5:8],
+                counters[3:9],
+                [],
+            ]:
+                self.assertEqual(
+                    planner.min_cost_to_feature(
+                        start, feature_pos_list, with_argmin=True
+                    ),
+                    search_min_cost(start, feature_pos_list),
+                )
+
+            occupied = set(counters[::3])
+            empty_counters = [pos for pos in counters if pos not in occupied]
+            table = planner.feature_distances
+            dist, closest = table.min_distance_to_static_feature(
+                start, counters, excluded_pos=occupied
+            )
+            self.assertEqual(
+                (dist + 1, closest), search_min_cost(start, empty_counters)
+            )
+
     def test_larger_mdp(self):
         if large_mdp_tests:
             planner = (
@@ -262,6 +316,24 @@ class TestJointMotionPlanner(unittest.TestCase):
         jm_planner = ml_action_manager_simple.joint_motion_planner
         self.simple_mdp_suite(jm_planner)
 
+    def test_lazy_joint_plans_simple_mdp(self):
+        for params, am in [
+            (base_params, ml_action_manager_simple),
+            (base_params_start_or, or_ml_action_manager_simple),
+        ]:
+            eager_planner = am.joint_motion_planner
+            lazy_planner = JointMotionPlanner(
+                simple_mdp,
+                dict(params, lazy_joint_plans=True, joint_plans_cache_size=5),
+            )
+            self.simple_mdp_suite(lazy_planner)
+            for start, goal in eager_planner.all_plans.keys():
+                self.assertEqual(
+                    lazy_planner.get_low_level_action_plan(start, goal),
+                    eager_planner.get_low_level_action_plan(start, goal),
+                )
+            self.assertLessEqual(len(lazy_planner.all_plans), 5)
+
     def simple_mdp_suite(self, jm_planner):
         self.simple_mdp_already_at_goal(jm_planner)
         self.simple_mdp_only_orientations_switch(jm_planner)
@@ -432,6 +504,101 @@ class TestJointMotionPlanner(unittest.TestCase):
             self.assertEqual(plan_lengths, times)
 
 
+class TestLRUCache(unittest.TestCase):
+    def test_eviction_order(self):
+        cache = LRUCache(maxsize=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache.get("a"), 1)
+        cache["c"] = 3
+        self.assertEqual(list(cache), ["a", "c"])
+
+        self.assertEqual(cache["a"], 1)
+        cache["d"] = 4
+        self.assertEqual(list(cache), ["a", "d"])
+
+        # misses and membership tests don't change the order
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("b", 0), 0)
+        self.assertTrue("a" in cache)
+        cache["e"] = 5
+        self.assertEqual(list(cache), ["d", "e"])
+
+
+class TestPlannerCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = PlannerCache(cache_dir=self.cache_dir)
+        # Explicit orders, as the default ones depend on recipes created by
+        # other tests
+        params = {"start_all_orders": [{"ingredients": ["onion"] * 3}]}
+        self.mdp = OvercookedGridworld.from_grid(
+            ["XXPXX", "O  2O", "X1  X", "XDXSX"], params
+        )
+        # Same terrain, players moved around
+        self.mutated_mdp = OvercookedGridworld.from_grid(
+            ["XXPXX", "O1  O", "X  2X", "XDXSX"], params
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_shared_geometry(self):
+        mp = MotionPlanner.from_pickle_or_compute(
+            self.mdp, [], planner_cache=self.cache
+        )
+        self.assertEqual(
+            planner_key("mp", self.mdp, {"counter_goals": []}),
+            planner_key("mp", self.mutated_mdp, {"counter_goals": []}),
+        )
+        mutated_mp = MotionPlanner.from_pickle_or_compute(
+            self.mutated_mdp, [], planner_cache=self.cache
+        )
+        self.assertIs(mutated_mp.mdp, self.mutated_mdp)
+        self.assertEqual(mutated_mp.all_plans, mp.all_plans)
+        self.assertEqual(len(self.cache._read_index()), 1)
+
+        other_params_mp = MotionPlanner.from_pickle_or_compute(
+            self.mdp,
+            self.mdp.terrain_pos_dict["X"],
+            planner_cache=self.cache,
+        )
+        self.assertEqual(
+            other_params_mp.counter_goals, self.mdp.terrain_pos_dict["X"]
+        )
+        self.assertEqual(len(self.cache._read_index()), 2)
+
+    def test_mlam_rebinding(self):
+        MediumLevelActionManager.from_pickle_or_compute(
+            self.mdp, NO_COUNTERS_PARAMS, planner_cache=self.cache
+        )
+        mlam = MediumLevelActionManager.from_pickle_or_compute(
+            self.mutated_mdp, NO_COUNTERS_PARAMS, planner_cache=self.cache
+        )
+        self.assertIs(mlam.mdp, self.mutated_mdp)
+        self.assertIs(mlam.joint_motion_planner.mdp, self.mutated_mdp)
+        self.assertIs(mlam.motion_planner.mdp, self.mutated_mdp)
+
+    def test_eviction(self):
+        self.cache.max_size_bytes = 1
+        MotionPlanner.from_pickle_or_compute(
+            self.mdp, [], planner_cache=self.cache
+        )
+        key = planner_key("mp", self.mdp, {"counter_goals": []})
+        self.assertTrue(os.path.exists(self.cache.filepath(key)))
+
+        # The most recent entry is kept even if it exceeds the size bound,
+        # but older ones are evicted
+        MotionPlanner.from_pickle_or_compute(
+            self.mdp, self.mdp.terrain_pos_dict["X"], planner_cache=self.cache
+        )
+        self.assertFalse(os.path.exists(self.cache.filepath(key)))
+        self.assertEqual(len(self.cache._read_index()), 1)
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache._read_index()), 0)
+
+
 # Rewritten because the previous test depended on Heuristic, and Heuristic has been deprecated
 class TestMediumLevelActionManagerSimple(unittest.TestCase):
     def test_simple_mdp_without_start_orientations(self):
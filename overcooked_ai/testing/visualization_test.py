@@ -3,6 +3,7 @@ import json
 import os
 import unittest
 
+import cv2
 import numpy as np
 import pygame
 
@@ -13,8 +14,13 @@ from overcooked_ai_py.mdp.overcooked_mdp import (
     OvercookedState,
     Recipe,
 )
-from overcooked_ai_py.static import TESTING_DATA_DIR
+from overcooked_ai_py.static import LAYOUTS_DIR, TESTING_DATA_DIR
 from overcooked_ai_py.utils import generate_temporary_file_path, load_from_json
+from overcooked_ai_py.visualization.layout_thumbnails import (
+    read_layout_grid,
+    render_layout_thumbnails,
+)
+from overcooked_ai_py.visualization.pygame_utils import scale_surface_by_factor
 from overcooked_ai_py.visualization.state_visualizer import StateVisualizer
 
 
@@ -188,6 +194,107 @@ class TestStateVisualizer(unittest.TestCase):
         ):
             test_render_state_from_dict(d)
 
+    def test_static_background_cache(self):
+        test_dict = load_from_json(
+            os.path.join(
+                state_visualizer_dir, "render_state_data_test_various.json"
+            )
+        )[0]
+        state = OvercookedState.from_dict(test_dict["kwargs"]["state"])
+        grid = test_dict["kwargs"]["grid"]
+
+        for tile_size in [15, 45, 50]:
+            visualizer = StateVisualizer(
+                tile_size=tile_size,
+                is_rendering_hud=False,
+                is_rendering_cooking_timer=False,
+            )
+            # rendering everything unscaled and then scaling the whole surface
+            unscaled_surface = pygame.surface.Surface(
+                visualizer._unscaled_grid_pixel_size(grid)
+            )
+            visualizer._render_grid(unscaled_surface, grid)
+            visualizer._render_players(unscaled_surface, state.players)
+            visualizer._render_objects(unscaled_surface, state.objects, grid)
+            expected_result = pygame.surfarray.array3d(
+                scale_surface_by_factor(
+                    unscaled_surface, visualizer.scale_by_factor
+                )
+            )
+
+            for _ in range(2):
+                actual_result = pygame.surfarray.array3d(
+                    visualizer.render_state(state, grid)
+                )
+                self.assertTrue(np.array_equal(actual_result, expected_result))
+            self.assertEqual(len(visualizer._backgrounds), 1)
+
+    def test_static_background_cache_eviction(self):
+        grid = ["XXPXX", "O   O", "X   X", "XDXSX"]
+        visualizer = StateVisualizer()
+        background = visualizer._static_background(grid)
+        # more grids than fit in the cache, the first one is used in between
+        for i in range(1, StateVisualizer.BACKGROUND_CACHE_SIZE + 5):
+            visualizer._static_background([row + "X" * i for row in grid])
+            self.assertIs(visualizer._static_background(grid), background)
+        self.assertEqual(
+            len(visualizer._backgrounds), StateVisualizer.BACKGROUND_CACHE_SIZE
+        )
+
+    def test_layout_thumbnails(self):
+        layout_names = ["cramped_room", "counter_circuit_o_1order"]
+        layout_paths = [
+            os.path.join(LAYOUTS_DIR, layout_name + ".layout")
+            for layout_name in layout_names
+        ]
+        output_dir = generate_temporary_file_path(
+            prefix="overcooked_layout_thumbnails", extension=""
+        )
+
+        img_paths = render_layout_thumbnails(
+            layout_paths, output_dir, num_processes=1
+        )
+        self.assertEqual(
+            img_paths,
+            [
+                os.path.join(output_dir, layout_name + ".png")
+                for layout_name in layout_names
+            ],
+        )
+        for layout_name, img_path in zip(layout_names, img_paths):
+            mdp = OvercookedGridworld.from_layout_name(layout_name)
+            expected_result = pygame.surfarray.array3d(
+                StateVisualizer().render_env(
+                    mdp.terrain_mtx, generate_temporary_file_path()
+                )
+            )
+            actual_result = pygame.surfarray.array3d(
+                pygame.image.load(img_path)
+            )
+            self.assertTrue(np.array_equal(actual_result, expected_result))
+
+        # pngs newer than the .layout files are skipped
+        self.assertEqual(
+            render_layout_thumbnails(
+                layout_paths, output_dir, num_processes=1
+            ),
+            [],
+        )
+        os.utime(img_paths[0], (0, 0))
+        self.assertEqual(
+            render_layout_thumbnails(
+                layout_paths, output_dir, num_processes=2
+            ),
+            img_paths[:1],
+        )
+
+        # non integral scale renders every tile at exactly tile_size
+        grid = read_layout_grid(layout_paths[0])
+        surface = StateVisualizer(tile_size=40).render_layout(grid)
+        self.assertEqual(
+            surface.get_size(), (40 * len(grid[0]), 40 * len(grid))
+        )
+
     def test_default_hud_data_from_trajectories(self):
         traj_path = os.path.join(
             TESTING_DATA_DIR, "test_state_visualizer", "test_trajectory.json"
@@ -259,6 +366,71 @@ class TestStateVisualizer(unittest.TestCase):
             get_file_count(result_img_directory_path), expected_images_num
         )
 
+    def test_trajectory_video(self):
+        traj_path = os.path.join(
+            TESTING_DATA_DIR, "test_state_visualizer", "test_trajectory.json"
+        )
+        test_trajectory = AgentEvaluator.load_traj_from_json(traj_path)
+        states = test_trajectory["ep_states"][0]
+        grid = test_trajectory["mdp_params"][0]["terrain"]
+        hud_data = StateVisualizer.default_hud_data_from_trajectories(
+            test_trajectory
+        )
+        visualizer = StateVisualizer()
+
+        frames = visualizer.render_trajectory_frames(test_trajectory)
+        self.assertEqual(frames.dtype, np.uint8)
+        self.assertEqual(len(frames), len(states))
+        for frame, state, state_hud_data in zip(frames, states, hud_data):
+            expected_frame = pygame.surfarray.array3d(
+                visualizer.render_state(state, grid, state_hud_data)
+            ).swapaxes(0, 1)
+            self.assertTrue(np.array_equal(frame, expected_frame))
+
+        # frames are padded to even sizes in videos
+        video_frame_shape = (
+            frames.shape[1] + frames.shape[1] % 2,
+            frames.shape[2] + frames.shape[2] % 2,
+            3,
+        )
+
+        def video_frames_shapes(video_path):
+            capture = cv2.VideoCapture(video_path)
+            shapes = []
+            while True:
+                success, frame = capture.read()
+                if not success:
+                    break
+                shapes.append(frame.shape)
+            capture.release()
+            return shapes
+
+        video_path = visualizer.save_trajectory_video(
+            test_trajectory,
+            generate_temporary_file_path(
+                prefix="overcooked_visualized_trajectory", extension=".avi"
+            ),
+        )
+        self.assertEqual(
+            video_frames_shapes(video_path), [video_frame_shape] * len(states)
+        )
+        with self.assertRaises(ValueError):
+            visualizer.save_trajectory_video(test_trajectory, "video.png")
+
+        two_trajectories = {
+            key: value * 2 if isinstance(value, list) else value
+            for key, value in test_trajectory.items()
+        }
+        video_pathes = visualizer.save_trajectory_videos(
+            two_trajectories, video_extension=".avi", num_processes=2
+        )
+        self.assertEqual(len(video_pathes), 2)
+        for video_path in video_pathes:
+            self.assertEqual(
+                video_frames_shapes(video_path),
+                [video_frame_shape] * len(states),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,91 @@
+# student/parallel_evaluator.py
+
+from collections import defaultdict
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+from env.overcooked_wrapper import OvercookedGym
+
+
+class ParallelEvaluator:
+    """
+    Evaluate a policy on many layouts at once.
+
+    All (layout, episode) pairs are spread over n_envs long-lived env
+    workers (subprocesses when n_envs > 1). Workers step in lockstep and
+    the observations of every in-flight episode go through the policy in
+    a single batched forward pass, so evaluation cost scales with the
+    number of workers rather than with the number of layouts.
+    """
+
+    def __init__(
+        self,
+        n_envs: int = 1,
+        horizon: int = 400,
+        start_method: Optional[str] = None,
+    ):
+        self.n_envs = n_envs
+        env_fns = [partial(OvercookedGym, "cramped_room", horizon=horizon)] * n_envs
+        if n_envs > 1:
+            self.vec_env = SubprocVecEnv(env_fns, start_method=start_method)
+        else:
+            self.vec_env = DummyVecEnv(env_fns)
+
+    def evaluate(
+        self,
+        model,
+        layouts: List[str],
+        n_episodes: int = 5,
+        deterministic: bool = True,
+    ) -> Dict[str, Tuple[float, float]]:
+        """
+        Run n_episodes of `model` on each layout.
+
+        Returns
+        -------
+        dict
+            layout_name -> (mean return, std of returns)
+        """
+        jobs = [layout for layout in layouts for _ in range(n_episodes)]
+        returns = defaultdict(list)
+
+        for start in range(0, len(jobs), self.n_envs):
+            batch = jobs[start:start + self.n_envs]
+            obs = self._start_episodes(batch)
+
+            # Workers without a job this round keep stepping, but are ignored
+            active = np.arange(self.n_envs) < len(batch)
+            totals = np.zeros(self.n_envs)
+            while active.any():
+                actions, _ = model.predict(obs, deterministic=deterministic)
+                obs, rewards, dones, _ = self.vec_env.step(actions)
+                totals += np.where(active, rewards, 0.0)
+                active &= ~dones
+
+            for i, layout in enumerate(batch):
+                returns[layout].append(totals[i])
+
+        return {
+            layout: (float(np.mean(returns[layout])), float(np.std(returns[layout])))
+            for layout in layouts
+        }
+
+    def _start_episodes(self, batch: List[str]) -> np.ndarray:
+        """Point worker i to layout batch[i] and return the first obs of all workers."""
+        obs = np.zeros((self.n_envs,) + self.vec_env.observation_space.shape, dtype=np.float32)
+
+        # One message per layout, received by all of its workers in parallel
+        indices_by_layout = defaultdict(list)
+        for i, layout in enumerate(batch):
+            indices_by_layout[layout].append(i)
+        for layout, indices in indices_by_layout.items():
+            first_obs = self.vec_env.env_method("start_episode", layout, indices=indices)
+            obs[indices] = np.stack(first_obs)
+        return obs
+
+    def close(self):
+        """Shut down the env workers."""
+        self.vec_env.close()
@@ -1,10 +1,11 @@
 # student/train_ppo_student.py
 
-from typing import Tuple
+from functools import partial
+from typing import Optional, Tuple
 
 import numpy as np
 from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv, VecMonitor
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor
 
 from env.overcooked_wrapper import OvercookedGym
 
@@ -14,6 +15,12 @@ class StudentPPO:
     Wrapper around a SB3 PPO agent that can:
     - train on a given layout
     - return the average reward over several test episodes
+
+    The training envs are created once and kept for the whole run: with
+    n_envs > 1 each one lives in its own subprocess worker, and switching
+    layout is a message to the workers (`OvercookedGym.set_layout`), so
+    the MDPs and planners they already built stay warm. Each PPO rollout
+    collects n_steps transitions per env.
     """
 
     def __init__(
@@ -23,17 +30,20 @@ class StudentPPO:
         n_steps: int = 2048,
         gamma: float = 0.99,
         verbose: int = 1,
+        n_envs: int = 1,
+        start_method: Optional[str] = None,
     ):
-        # Initialize the model on a default layout ("cramped_room")
-        def make_env():
-            return OvercookedGym("cramped_room", horizon=400)
+        self.n_envs = n_envs
+        self.start_method = start_method
 
-        vec_env = DummyVecEnv([make_env])
-        vec_env = VecMonitor(vec_env)
+        # Initialize the model on a default layout ("cramped_room")
+        self.layout_name = "cramped_room"
+        self.vec_env = self._make_vec_env(self.layout_name)
+        self.eval_env = OvercookedGym(self.layout_name, horizon=400)
 
         self.model = PPO(
             "MlpPolicy",
-            vec_env,
+            self.vec_env,
             learning_rate=learning_rate,
             batch_size=batch_size,
             n_steps=n_steps,
@@ -42,14 +52,27 @@ class StudentPPO:
         )
 
     def _make_vec_env(self, layout_name: str):
-        # Create a new vectorized environment for a specific layout
-        def make_env():
-            return OvercookedGym(layout_name, horizon=400)
-
-        vec_env = DummyVecEnv([make_env])
+        # Long-lived vectorized environment, retargeted by _set_layout
+        env_fns = [partial(OvercookedGym, layout_name, horizon=400)] * self.n_envs
+        if self.n_envs > 1:
+            vec_env = SubprocVecEnv(env_fns, start_method=self.start_method)
+        else:
+            vec_env = DummyVecEnv(env_fns)
         vec_env = VecMonitor(vec_env)
         return vec_env
 
+    def _set_layout(self, layout_name: str):
+        # Switch the training envs to this layout; set_env forces a reset
+        # before the next rollout, like a freshly built env would
+        if layout_name != self.layout_name:
+            self.vec_env.env_method("set_layout", layout_name)
+            self.layout_name = layout_name
+        self.model.set_env(self.vec_env)
+
+    def close(self):
+        """Shut down the env workers."""
+        self.vec_env.close()
+
     def train_on_layout(
         self,
         layout_name: str,
@@ -60,20 +83,22 @@ class StudentPPO:
         Train the student on a specific layout, then evaluate the average reward.
         - total_timesteps: additional training steps (the global step counter is not reset).
         """
-        # New environment for this layout
-        vec_env = self._make_vec_env(layout_name)
-        self.model.set_env(vec_env)
+        if total_timesteps > 0:
+            # Retarget the training envs to this layout
+            self._set_layout(layout_name)
 
-        # Continue training (reset_num_timesteps=False to keep the internal timestep counter)
-        self.model.learn(total_timesteps=total_timesteps, reset_num_timesteps=False)
+            # Continue training (reset_num_timesteps=False to keep the internal timestep counter)
+            self.model.learn(total_timesteps=total_timesteps, reset_num_timesteps=False)
 
         # Then evaluate on several episodes
         avg_return = self._evaluate_layout(layout_name, eval_episodes)
         return avg_return
 
     def _evaluate_layout(self, layout_name: str, n_episodes: int = 5) -> float:
-        # Create a non-vectorized env for evaluation on the given layout
-        env = OvercookedGym(layout_name, horizon=400)
+        # Non-vectorized env for evaluation, retargeted to the given layout
+        env = self.eval_env
+        if env.layout_name != layout_name:
+            env.set_layout(layout_name)
         returns = []
 
         for _ in range(n_episodes):
@@ -98,3 +123,4 @@ if __name__ == "__main__":
     student = StudentPPO(verbose=1)
     avg_ret = student.train_on_layout("cramped_room", total_timesteps=50_000, eval_episodes=5)
     print("Average return on cramped_room after 50k steps:", avg_ret)
+    student.close()
@@ -0,0 +1,214 @@
+# teacher/layout_archive.py
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class LayoutArchive:
+    """
+    Embedding of every layout the teacher has seen, never evicted, with
+    k-nearest-neighbour queries for novelty.
+
+    Small archives are searched exactly by NumPy brute force. From
+    `brute_force_size` entries on, a KD-tree is built over the archive and
+    only entries added since the last build are brute forced; the tree is
+    rebuilt once those exceed `brute_force_size` or 1/8 of the tree. Layout
+    embeddings are low dimensional in practice (integer features of few
+    distinct layouts), where tree queries take tens of microseconds even
+    with 100k entries; `eps` > 0 allows (1 + eps)-approximate queries for
+    harder data.
+
+    With `archive_dir`, entries are appended to `names.txt` and
+    `embeddings.f64` (raw float64 rows) there, and reloaded on init.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        archive_dir: Optional[str] = None,
+        brute_force_size: int = 2048,
+        eps: float = 0.0,
+    ):
+        self.dim = dim
+        self.archive_dir = archive_dir
+        self.brute_force_size = brute_force_size
+        self.eps = eps
+
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.embeddings = np.zeros((1024, dim))
+        # KD-tree over the first _tree_size embeddings
+        self._tree: Optional[cKDTree] = None
+        self._tree_size = 0
+
+        if archive_dir is not None:
+            os.makedirs(archive_dir, exist_ok=True)
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, layout_name: str) -> bool:
+        return layout_name in self.index
+
+    def add(self, layout_name: str, embedding: np.ndarray):
+        """Archive the embedding of a layout, once per layout name."""
+        if layout_name in self.index:
+            return
+        self._append(layout_name, embedding)
+        if self.archive_dir is not None:
+            with open(self._names_path, "a") as f:
+                f.write(layout_name + "\n")
+            with open(self._embeddings_path, "ab") as f:
+                f.write(np.asarray(embedding, dtype=np.float64).tobytes())
+        self._maybe_rebuild_tree()
+
+    def knn_distances(
+        self,
+        embeddings: np.ndarray,
+        k: int,
+        exclude: Optional[Sequence[Optional[str]]] = None,
+    ) -> np.ndarray:
+        """
+        Distances of every row of `embeddings` to its k nearest archived
+        layouts, ignoring the layout named `exclude[row]`.
+
+        Returns
+        -------
+        distances : np.ndarray
+            (n_rows, k) array sorted along rows, inf where the archive has
+            fewer than k other layouts.
+        """
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=float))
+        n_rows, n = len(queries), len(self)
+        if exclude is None:
+            exclude = [None] * n_rows
+        skip = np.array([self.index.get(name, -1) for name in exclude])
+        # one more neighbour in case the excluded layout is among them
+        n_candidates = k + 1
+
+        indices = []
+        if self._tree is not None:
+            _, tree_indices = self._tree.query(
+                queries, k=min(n_candidates, self._tree_size), eps=self.eps
+            )
+            indices.append(tree_indices.reshape(n_rows, -1))
+        if n > self._tree_size:
+            pending = self.embeddings[self._tree_size : n]
+            # squared distances minus the squared norm of the query, by a
+            # matrix product; only used to select candidates, whose
+            # distances are computed exactly below
+            shifted_sq_dists = (pending**2).sum(axis=1)[None, :] - 2 * (
+                queries @ pending.T
+            )
+            if shifted_sq_dists.shape[1] > n_candidates:
+                pending_indices = np.argpartition(
+                    shifted_sq_dists, n_candidates - 1, axis=1
+                )[:, :n_candidates]
+            else:
+                pending_indices = np.broadcast_to(
+                    np.arange(shifted_sq_dists.shape[1]),
+                    shifted_sq_dists.shape,
+                )
+            indices.append(pending_indices + self._tree_size)
+        if not indices:
+            return np.full((n_rows, k), np.inf)
+
+        indices = np.concatenate(indices, axis=1)
+        distances = np.linalg.norm(
+            self.embeddings[indices] - queries[:, None, :], axis=2
+        )
+        distances[indices == skip[:, None]] = np.inf
+        distances = np.sort(distances, axis=1)[:, :k]
+        if distances.shape[1] < k:
+            distances = np.pad(
+                distances,
+                [(0, 0), (0, k - distances.shape[1])],
+                constant_values=np.inf,
+            )
+        return distances
+
+    def novelties(
+        self,
+        embeddings: np.ndarray,
+        k: int,
+        exclude: Optional[Sequence[Optional[str]]] = None,
+    ) -> np.ndarray:
+        """Mean distance of every row of `embeddings` to its k nearest
+        archived layouts (see `knn_distances`), 0 for an empty archive."""
+        distances = self.knn_distances(embeddings, k, exclude)
+        finite = np.isfinite(distances)
+        counts = finite.sum(axis=1)
+        sums = np.where(finite, distances, 0.0).sum(axis=1)
+        return np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+    def novelty(
+        self, embedding: np.ndarray, k: int, exclude: Optional[str] = None
+    ) -> float:
+        return float(self.novelties(embedding, k, [exclude])[0])
+
+    # ------------------------------------------------------------------ #
+
+    @property
+    def _names_path(self) -> str:
+        return os.path.join(self.archive_dir, "names.txt")
+
+    @property
+    def _embeddings_path(self) -> str:
+        return os.path.join(self.archive_dir, "embeddings.f64")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.archive_dir, "meta.json")
+
+    def _append(self, layout_name: str, embedding: np.ndarray):
+        n = len(self)
+        if n == len(self.embeddings):
+            self.embeddings = np.pad(self.embeddings, [(0, n), (0, 0)])
+        self.embeddings[n] = embedding
+        self.names.append(layout_name)
+        self.index[layout_name] = n
+
+    def _maybe_rebuild_tree(self):
+        n = len(self)
+        if n < self.brute_force_size:
+            return
+        if n - self._tree_size >= max(
+            self.brute_force_size, self._tree_size // 8
+        ):
+            self._tree = cKDTree(self.embeddings[:n])
+            self._tree_size = n
+
+    def _load(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                dim = json.load(f)["dim"]
+            if dim != self.dim:
+                raise ValueError(
+                    f"Archive in {self.archive_dir} has embeddings of size "
+                    f"{dim}, not {self.dim}"
+                )
+        else:
+            with open(self._meta_path, "w") as f:
+                json.dump({"dim": self.dim}, f)
+        if not os.path.exists(self._names_path):
+            return
+
+        with open(self._names_path, "r") as f:
+            names = f.read().splitlines()
+        embeddings = np.fromfile(self._embeddings_path, dtype=np.float64)
+        n = min(len(names), len(embeddings) // self.dim)
+        for name, embedding in zip(
+            names[:n], embeddings[: n * self.dim].reshape(n, self.dim)
+        ):
+            self._append(name, embedding)
+        if n != len(names) or n * self.dim != len(embeddings):
+            # drop a partially written last entry so appends stay aligned
+            with open(self._names_path, "w") as f:
+                f.writelines(name + "\n" for name in self.names)
+            self.embeddings[:n].tofile(self._embeddings_path)
+        self._maybe_rebuild_tree()
@@ -14,6 +14,8 @@ from utils.layout_utils import (
     featurize_layout,
     mutate_layout,
 )
+from utils.layout_embedding import EMBEDDING_SIZE
+from teacher.layout_archive import LayoutArchive
 
 
 def softmax(x: np.ndarray, temperature: float = 1.0) -> np.ndarray:
@@ -33,36 +35,159 @@ class LevelRecord:
     novelty: float = 0.0
     progress: float = 0.0
     score: float = 0.0   # Final composite score
-    embedding: np.ndarray = field(default_factory=lambda: np.zeros(len(AVAILABLE_LAYOUTS)))
+    embedding: np.ndarray = field(default_factory=lambda: np.zeros(EMBEDDING_SIZE))
 
 
 class LevelBuffer:
-    """Buffer of layouts + associated statistics."""
+    """
+    Buffer of layouts + associated statistics.
+
+    Every level owns a row ("slot") of contiguous arrays: its embedding, the
+    sum / count / last two of its returns and its approximate optimal
+    return. Pairwise embedding distances are kept in a matrix updated on
+    insert and evict, together with the row sums of that matrix, so the
+    statistics of all levels are a few vectorized ops (see `level_stats`).
+    Returns must therefore be added with `update_return`.
+
+    With an `archive`, the embedding of every inserted level is also added to
+    it, and stays there after the level is evicted.
+    """
 
-    def __init__(self, max_size: int = 50):
+    # Arrays with one row per slot, besides the (slot, slot) distance matrix
+    _SLOT_ARRAYS = [
+        "embeddings",
+        "distance_sums",
+        "return_sums",
+        "return_counts",
+        "last_returns",
+        "prev_returns",
+        "optimal_returns",
+        "active",
+    ]
+
+    def __init__(self, max_size: int = 50, archive: Optional[LayoutArchive] = None):
         self.max_size = max_size
+        self.archive = archive
         self.levels: Dict[str, LevelRecord] = {}
+        # layout name -> slot, in the insertion order of self.levels
+        self.slots: Dict[str, int] = {}
+
+        # grown up to max_size when full
+        capacity = min(max_size, 64)
+        self.embeddings = np.zeros((capacity, EMBEDDING_SIZE))
+        self.distances = np.zeros((capacity, capacity))
+        self.distance_sums = np.zeros(capacity)
+        self.return_sums = np.zeros(capacity)
+        self.return_counts = np.zeros(capacity)
+        self.last_returns = np.zeros(capacity)
+        self.prev_returns = np.zeros(capacity)
+        self.optimal_returns = np.zeros(capacity)
+        self.active = np.zeros(capacity, dtype=bool)
+        self._free_slots = list(range(capacity - 1, -1, -1))
+
+    def _grow(self, capacity: int):
+        old_capacity = len(self.active)
+        for name in self._SLOT_ARRAYS:
+            array = getattr(self, name)
+            pad_width = [(0, capacity - old_capacity)] + [(0, 0)] * (array.ndim - 1)
+            setattr(self, name, np.pad(array, pad_width))
+        self.distances = np.pad(self.distances, [(0, capacity - old_capacity)] * 2)
+        self._free_slots.extend(range(capacity - 1, old_capacity - 1, -1))
 
     def ensure_level(self, layout_name: str) -> LevelRecord:
         if layout_name not in self.levels:
             if len(self.levels) >= self.max_size:
                 # Remove the oldest layout (simplified: first key)
                 drop_key = next(iter(self.levels.keys()))
-                del self.levels[drop_key]
+                self._evict(drop_key)
             rec = LevelRecord(
                 layout_name=layout_name,
                 embedding=featurize_layout(layout_name),
             )
-            self.levels[layout_name] = rec
+            self._insert(rec)
         return self.levels[layout_name]
 
+    def _insert(self, rec: LevelRecord):
+        if not self._free_slots:
+            self._grow(min(2 * len(self.active), self.max_size))
+        slot = self._free_slots.pop()
+        self.embeddings[slot] = rec.embedding
+        dists = np.linalg.norm(self.embeddings - rec.embedding, axis=1)
+        dists *= self.active
+        self.distances[slot, :] = dists
+        self.distances[:, slot] = dists
+        self.distance_sums += dists
+        self.distance_sums[slot] = dists.sum()
+        self.return_sums[slot] = sum(rec.returns)
+        self.return_counts[slot] = len(rec.returns)
+        self.last_returns[slot] = rec.returns[-1] if rec.returns else 0.0
+        self.prev_returns[slot] = rec.returns[-2] if len(rec.returns) > 1 else 0.0
+        self.optimal_returns[slot] = APPROX_OPTIMAL_RETURN.get(rec.layout_name, 200)
+        self.active[slot] = True
+        self.levels[rec.layout_name] = rec
+        self.slots[rec.layout_name] = slot
+        if self.archive is not None:
+            self.archive.add(rec.layout_name, rec.embedding)
+
+    def _evict(self, layout_name: str):
+        del self.levels[layout_name]
+        slot = self.slots.pop(layout_name)
+        self.distance_sums -= self.distances[slot]
+        self.distance_sums[slot] = 0.0
+        self.distances[slot, :] = 0.0
+        self.distances[:, slot] = 0.0
+        self.active[slot] = False
+        self._free_slots.append(slot)
+
     def update_return(self, layout_name: str, episode_return: float):
         rec = self.ensure_level(layout_name)
         rec.returns.append(float(episode_return))
+        slot = self.slots[layout_name]
+        self.return_sums[slot] += rec.returns[-1]
+        self.return_counts[slot] += 1
+        self.prev_returns[slot] = self.last_returns[slot]
+        self.last_returns[slot] = rec.returns[-1]
 
     def all_records(self) -> List[LevelRecord]:
         return list(self.levels.values())
 
+    def level_stats(self):
+        """
+        Regret, novelty and progress of all levels, in the order of
+        `all_records`.
+
+        - regret: approximate optimal return minus the mean return, at least 0
+        - novelty: mean embedding distance to the other levels
+        - progress: absolute difference of the last two returns
+
+        Returns
+        -------
+        regrets, novelties, progresses : np.ndarray
+        """
+        slots = np.fromiter(self.slots.values(), dtype=int, count=len(self.slots))
+        counts = self.return_counts[slots]
+        means = self.return_sums[slots] / np.maximum(counts, 1)
+        regrets = np.where(
+            counts > 0, np.maximum(self.optimal_returns[slots] - means, 0.0), 0.0
+        )
+        novelties = self.distance_sums[slots] / max(len(slots) - 1, 1)
+        progresses = np.where(
+            counts > 1,
+            np.abs(self.last_returns[slots] - self.prev_returns[slots]),
+            0.0,
+        )
+        return regrets, novelties, progresses
+
+    def novelty(self, embedding: np.ndarray, exclude: Optional[str] = None) -> float:
+        """Mean distance of `embedding` to the levels, except `exclude`."""
+        active = self.active.copy()
+        if exclude in self.slots:
+            active[self.slots[exclude]] = False
+        if not active.any():
+            return 0.0
+        dists = np.linalg.norm(self.embeddings[active] - embedding, axis=1)
+        return float(dists.mean())
+
 
 class TeacherAgent:
     """
@@ -75,6 +200,11 @@ class TeacherAgent:
     - a buffer of layouts
     - a composite score
     - a sample_layout() function to choose the next level
+
+    With `novelty_k`, novelty is the mean distance to the `novelty_k` nearest
+    layouts of an archive of every layout seen so far (see LayoutArchive),
+    persisted in `archive_dir` if given. With `novelty_k=None`, it is the mean
+    distance to the other layouts of the buffer.
     """
 
     def __init__(
@@ -85,8 +215,14 @@ class TeacherAgent:
         w_novelty: float = 0.5,
         w_progress: float = -0.1,
         temperature: float = 1.0,
+        novelty_k: Optional[int] = 5,
+        archive_dir: Optional[str] = None,
     ):
-        self.buffer = LevelBuffer(max_size=buffer_size)
+        self.novelty_k = novelty_k
+        self.archive = None
+        if novelty_k is not None:
+            self.archive = LayoutArchive(EMBEDDING_SIZE, archive_dir=archive_dir)
+        self.buffer = LevelBuffer(max_size=buffer_size, archive=self.archive)
         self.staleness_coeff = staleness_coeff
         self.w_regret = w_regret
         self.w_novelty = w_novelty
@@ -103,9 +239,8 @@ class TeacherAgent:
     def _init_buffer(self):
         initial_layouts = AVAILABLE_LAYOUTS[:int(len(AVAILABLE_LAYOUTS) * self.staleness_coeff)]  # can be extended later
         for name in initial_layouts:
-            rec = self.buffer.ensure_level(name)
             # Initialize with a small fake return (0) to start
-            rec.returns.append(0.0)
+            self.buffer.update_return(name, 0.0)
             self.last_return[name] = 0.0
 
     # --------------------- metrics --------------------- #
@@ -117,18 +252,14 @@ class TeacherAgent:
         optimal = APPROX_OPTIMAL_RETURN.get(rec.layout_name, 200)
         return max(optimal - avg_ret, 0.0)
 
-    def _compute_novelty(self, rec: LevelRecord, others: List[LevelRecord]) -> float:
-        if not others:
-            return 0.0
-        dists = []
-        for o in others:
-            if o.layout_name == rec.layout_name:
-                continue
-            d = np.linalg.norm(rec.embedding - o.embedding)
-            dists.append(d)
-        if not dists:
-            return 0.0
-        return float(np.mean(dists))
+    def _compute_novelty(self, rec: LevelRecord) -> float:
+        """Mean embedding distance to the nearest archived layouts, or to the
+        other layouts of the buffer without archive."""
+        if self.archive is not None:
+            return self.archive.novelty(
+                rec.embedding, self.novelty_k, exclude=rec.layout_name
+            )
+        return self.buffer.novelty(rec.embedding, exclude=rec.layout_name)
 
     def _compute_progress(self, rec: LevelRecord) -> float:
         if len(rec.returns) < 2:
@@ -141,18 +272,15 @@ class TeacherAgent:
         if not recs:
             return
 
-        # Compute regret/novelty/progress for each layout
-        regrets = []
-        novelties = []
-        progresses = []
-        for rec in recs:
-            rec.regret = self._compute_regret(rec)
-            rec.novelty = self._compute_novelty(rec, recs)
-            rec.progress = self._compute_progress(rec)
-
-            regrets.append(rec.regret)
-            novelties.append(rec.novelty)
-            progresses.append(rec.progress)
+        # Compute regret/novelty/progress for all layouts at once
+        regrets, novelties, progresses = self.buffer.level_stats()
+        if self.archive is not None:
+            slots = list(self.buffer.slots.values())
+            novelties = self.archive.novelties(
+                self.buffer.embeddings[slots],
+                self.novelty_k,
+                exclude=list(self.buffer.slots.keys()),
+            )
 
         # Normalization (simple z-score to avoid very different scales)
         # def normalize(xs):
@@ -167,17 +295,27 @@ class TeacherAgent:
         # n_novelty = normalize(novelties)
         # n_progress = normalize(progresses)
 
-        for i, rec in enumerate(recs):
-            rec.score = (
-                self.w_regret * regrets[i]
-                + self.w_novelty * novelties[i]
-                + self.w_progress * progresses[i]
-            )
-            # rec.score = (
-            #     self.w_regret * n_regret[i]
-            #     + self.w_novelty * n_novelty[i]
-            #     + self.w_progress * n_progress[i]
-            # )
+        scores = (
+            self.w_regret * regrets
+            + self.w_novelty * novelties
+            + self.w_progress * progresses
+        )
+        # scores = (
+        #     self.w_regret * n_regret
+        #     + self.w_novelty * n_novelty
+        #     + self.w_progress * n_progress
+        # )
+        for rec, regret, novelty, progress, score in zip(
+            recs,
+            regrets.tolist(),
+            novelties.tolist(),
+            progresses.tolist(),
+            scores.tolist(),
+        ):
+            rec.regret = regret
+            rec.novelty = novelty
+            rec.progress = progress
+            rec.score = score
     
     # --------------------- public API --------------------- #
 
@@ -235,8 +373,11 @@ class TeacherAgent:
             embedding=featurize_layout(layout_name),
             returns=returns,
         )
+        if self.archive is not None:
+            # seen layouts are archived even if they never enter the buffer
+            self.archive.add(layout_name, rec.embedding)
         rec.regret = self._compute_regret(rec)
-        rec.novelty = self._compute_novelty(rec, self.buffer.all_records())
+        rec.novelty = self._compute_novelty(rec)
         rec.progress = self._compute_progress(rec)
         score = (
             self.w_regret * rec.regret
@@ -1,7 +1,8 @@
 from overcooked_ai_py.agents.agent import GreedyHumanModel, AgentPair
-from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
 from overcooked_ai_py.mdp.overcooked_env import OvercookedEnv
 
+from env.layout_registry import get_layout_artifacts
+
 
 def make_teacher_env_and_pair(layout_name: str = "cramped_room", horizon: int = 400):
     """
@@ -15,12 +16,12 @@ def make_teacher_env_and_pair(layout_name: str = "cramped_room", horizon: int =
         (Teacher0, Teacher1), both GreedyHumanModel agents.
     """
 
-    # 1) Create MDP + base env for this layout
-    mdp = OvercookedGridworld.from_layout_name(layout_name)
-    base_env = OvercookedEnv.from_mdp(mdp, horizon=horizon)
+    # 1) MDP + medium-level action manager (path-planning & high-level goals),
+    #    shared with every other env of this layout in the process
+    mdp, mlam = get_layout_artifacts(layout_name)
 
-    # 2) Medium-level action manager (path-planning & high-level goals)
-    mlam = base_env.mlam  # computed lazily inside the env
+    # 2) Base env for this layout
+    base_env = OvercookedEnv.from_mdp(mdp, horizon=horizon, mlam=mlam)
 
     # 3) Two “teacher” agents using the same mlam
     teacher0 = GreedyHumanModel(mlam)
@@ -5,8 +5,9 @@ import json
 import random
 import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+from student.parallel_evaluator import ParallelEvaluator
 from student.train_ppo_student import StudentPPO
 from teacher.teacher_agent import TeacherAgent
 from utils.layout_utils import EVAL_LAYOUTS
@@ -29,28 +30,37 @@ class Trainer:
         temperature: float = 1.0,
         s_threshold: float = 2.0,
         student_verbose: int = 1,
+        n_envs: int = 1,
+        n_eval_envs: int = 1,
         log_dir: str = "./logs",
+        novelty_k: Optional[int] = 5,
     ):
         self.n_iterations = n_iterations
         self.train_steps_per_iter = train_steps_per_iter
         self.s_threshold = s_threshold
 
-        # Teacher
+        self.log_dir = Path(log_dir) / f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}_tspi{train_steps_per_iter}_bs{buffer_size}_wr{w_regret}_wn{w_novelty}_wp{w_progress}_temp{temperature}_sth{s_threshold}"
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+
+        # Teacher, archiving the layouts it sees in the log dir
         self.teacher = TeacherAgent(
             buffer_size=buffer_size,
             w_regret=w_regret,
             w_novelty=w_novelty,
             w_progress=w_progress,
             temperature=temperature,
+            novelty_k=novelty_k,
+            archive_dir=str(self.log_dir / "layout_archive"),
         )
 
-        # Student (new version)
-        self.student = StudentPPO(verbose=student_verbose)
+        # Student (new version), with n_envs parallel env workers
+        self.student = StudentPPO(verbose=student_verbose, n_envs=n_envs)
+
+        # Validation on EVAL_LAYOUTS, spread over n_eval_envs env workers
+        self.evaluator = ParallelEvaluator(n_envs=n_eval_envs)
 
         # Log history
         self.history: List[Dict] = []
-        self.log_dir = Path(log_dir) / f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}_tspi{train_steps_per_iter}_bs{buffer_size}_wr{w_regret}_wn{w_novelty}_wp{w_progress}_temp{temperature}_sth{s_threshold}"
-        self.log_dir.mkdir(parents=True, exist_ok=True)
 
     # ---------------------------------------------------------------------- #
     def run(self):
@@ -145,14 +155,12 @@ class Trainer:
 
 
     def eval(self):
-        avg_return_dict = {}
-        for layout in EVAL_LAYOUTS:
-            avg_return = self.student.train_on_layout(
-                layout_name=layout,
-                total_timesteps=0,
-                eval_episodes=5,
-            )
-            avg_return_dict[layout] = avg_return
+        results = self.evaluator.evaluate(
+            self.student.model,
+            EVAL_LAYOUTS,
+            n_episodes=5,
+        )
+        avg_return_dict = {layout: mean for layout, (mean, _std) in results.items()}
         avg_return_dict["overall_avg"] = sum(avg_return_dict.values()) / len(avg_return_dict)
         
         # Save as json
@@ -160,4 +168,8 @@ class Trainer:
             json.dump(avg_return_dict, f, indent=4)
         
         return avg_return_dict
-        
\ No newline at end of file
+
+    def close(self):
+        """Shut down the student and evaluation env workers."""
+        self.student.close()
+        self.evaluator.close()
@@ -0,0 +1,298 @@
+# utils/layout_embedding.py
+
+import hashlib
+import os
+from collections import deque
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
+
+# Bump when the features change, cached embeddings of older versions are
+# then ignored
+EMBEDDING_VERSION = 1
+EMBEDDING_CACHE_DIR = "utils/layout_embeddings"
+
+STATION_TYPES = ["O", "T", "P", "D", "S"]
+STATION_PAIRS = list(combinations(STATION_TYPES, 2))
+
+FEATURE_NAMES = (
+    ["height", "width", "num_floor", "floor_fraction", "num_players"]
+    + [f"num_{t}" for t in ["X"] + STATION_TYPES]
+    + [f"num_reachable_{t}" for t in ["X"] + STATION_TYPES]
+    + [f"dist_{a}_{b}" for a, b in STATION_PAIRS]
+    + [
+        "num_components",
+        "num_articulation_points",
+        "articulation_fraction",
+        "num_dead_ends",
+        "num_corridor_cells",
+        "mean_floor_degree",
+        "mean_floor_distance",
+        "floor_diameter",
+        "players_connected",
+        "players_distance",
+        "min_player_station_types",
+        "max_player_station_types",
+    ]
+    + [f"dist_player{i}_{t}" for i in (1, 2) for t in STATION_TYPES]
+)
+EMBEDDING_SIZE = len(FEATURE_NAMES)
+
+# Value of distances between unreachable or missing cells
+UNREACHABLE = -1.0
+
+# layout hash -> embedding, one per process
+_EMBEDDINGS: Dict[str, np.ndarray] = {}
+
+
+def layout_grid(layout_name: str) -> List[str]:
+    """Grid of the layout, rows of terrain and player digits."""
+    return OvercookedGridworld.layout_store().read(layout_name)["grid"]
+
+
+def layout_hash(grid: List[str]) -> str:
+    """Hash of the grid and of the embedding version."""
+    content = f"{EMBEDDING_VERSION}\n" + "\n".join(grid)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def layout_embedding(
+    layout_name: str, cache_dir: Optional[str] = EMBEDDING_CACHE_DIR
+) -> np.ndarray:
+    """
+    Fixed-size structural embedding of a layout, see `structural_features`.
+
+    Embeddings are cached in memory and as `<cache_dir>/<layout hash>.npy`,
+    so layouts with the same grid share an entry and an edited layout gets a
+    new one. Pass `cache_dir=None` to skip the disk cache.
+
+    Returns
+    -------
+    embedding : np.ndarray
+        float64 vector of EMBEDDING_SIZE features named by FEATURE_NAMES.
+    """
+    grid = layout_grid(layout_name)
+    key = layout_hash(grid)
+    if key not in _EMBEDDINGS:
+        embedding = None
+        path = os.path.join(cache_dir, key + ".npy") if cache_dir else None
+        if path is not None and os.path.exists(path):
+            try:
+                embedding = np.load(path)
+            except (OSError, ValueError):
+                embedding = None
+        if embedding is None or embedding.shape != (EMBEDDING_SIZE,):
+            embedding = structural_features(grid)
+            if path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                # written to a temp file first so concurrent workers never
+                # load a partial file
+                tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, embedding)
+                os.replace(tmp_path, path)
+        _EMBEDDINGS[key] = embedding
+    return _EMBEDDINGS[key].copy()
+
+
+def structural_features(grid: List[str]) -> np.ndarray:
+    """
+    Features computed straight from the grid, without building an MDP.
+
+    Players start positions are floor. Cells are connected by moves between
+    neighbouring floor cells; a station is reachable from the floor cells
+    next to it. Features are:
+    - size of the grid, amount of floor and number of players
+    - counts of every terrain type, in total and reachable from the floor
+    - shortest walking distance between every pair of station types, from a
+      floor cell next to one to a floor cell next to the other
+    - connectivity of the floor: components, articulation points (cells that
+      split the floor when blocked), dead ends, corridor cells, mean degree,
+      mean and max distance between floor cells
+    - whether the players can meet, their distance, how many station types
+      the least and most equipped player can reach, and the distance of the
+      first two players to the closest cell next to every station type
+    """
+    height, width = len(grid), len(grid[0])
+    floor = [
+        (x, y)
+        for y, row in enumerate(grid)
+        for x, c in enumerate(row)
+        if c == " " or c.isdigit()
+    ]
+    floor_index = {pos: i for i, pos in enumerate(floor)}
+    neighbours = [
+        [floor_index[n] for n in _adjacent(pos) if n in floor_index]
+        for pos in floor
+    ]
+    distances = np.array(
+        [_bfs(neighbours, i) for i in range(len(floor))], dtype=float
+    ).reshape(len(floor), len(floor))
+    components = _components(neighbours)
+
+    # floor cells next to every terrain type
+    access: Dict[str, List[int]] = {t: [] for t in ["X"] + STATION_TYPES}
+    counts = {t: 0 for t in access}
+    reachable = {t: 0 for t in access}
+    for y, row in enumerate(grid):
+        for x, c in enumerate(row):
+            if c not in access:
+                continue
+            counts[c] += 1
+            adjacent_floor = [
+                floor_index[n] for n in _adjacent((x, y)) if n in floor_index
+            ]
+            access[c].extend(adjacent_floor)
+            reachable[c] += bool(adjacent_floor)
+
+    station_distances = []
+    for a, b in STATION_PAIRS:
+        if not access[a] or not access[b]:
+            station_distances.append(UNREACHABLE)
+            continue
+        pair_distances = distances[np.ix_(access[a], access[b])]
+        pair_distances = pair_distances[pair_distances >= 0]
+        station_distances.append(
+            pair_distances.min() if pair_distances.size else UNREACHABLE
+        )
+
+    players = sorted(
+        (c, floor_index[(x, y)])
+        for y, row in enumerate(grid)
+        for x, c in enumerate(row)
+        if c.isdigit()
+    )
+    player_cells = [i for _, i in players]
+    station_types_by_player = [
+        sum(
+            any(components[j] == components[i] for j in access[t])
+            for t in STATION_TYPES
+        )
+        for i in player_cells
+    ]
+    if len(player_cells) >= 2:
+        players_distance = distances[player_cells[0], player_cells[1]]
+    else:
+        players_distance = UNREACHABLE
+    # distances of the first two players to every station type, telling
+    # apart layouts where the players swapped start positions
+    player_station_distances = []
+    for player in range(2):
+        for t in STATION_TYPES:
+            if player >= len(player_cells) or not access[t]:
+                player_station_distances.append(UNREACHABLE)
+                continue
+            player_distances = distances[player_cells[player], access[t]]
+            player_distances = player_distances[player_distances >= 0]
+            player_station_distances.append(
+                player_distances.min()
+                if player_distances.size
+                else UNREACHABLE
+            )
+
+    degrees = np.array([len(n) for n in neighbours])
+    reachable_distances = distances[distances > 0]
+    articulation_points = _articulation_points(neighbours)
+    features = (
+        [
+            height,
+            width,
+            len(floor),
+            len(floor) / (height * width),
+            len(players),
+        ]
+        + [counts[t] for t in access]
+        + [reachable[t] for t in access]
+        + station_distances
+        + [
+            len(set(components)),
+            len(articulation_points),
+            len(articulation_points) / max(len(floor), 1),
+            int(np.sum(degrees == 1)),
+            int(np.sum(degrees == 2)),
+            float(degrees.mean()) if len(floor) else 0.0,
+            reachable_distances.mean() if reachable_distances.size else 0.0,
+            reachable_distances.max() if reachable_distances.size else 0.0,
+            float(len(set(components[i] for i in player_cells)) == 1),
+            players_distance,
+            min(station_types_by_player, default=0),
+            max(station_types_by_player, default=0),
+        ]
+        + player_station_distances
+    )
+    return np.array(features, dtype=float)
+
+
+def _adjacent(pos: Tuple[int, int]) -> List[Tuple[int, int]]:
+    x, y = pos
+    return [(x, y - 1), (x, y + 1), (x + 1, y), (x - 1, y)]
+
+
+def _bfs(neighbours: List[List[int]], source: int) -> List[float]:
+    """Distances from source to every cell, UNREACHABLE if not connected."""
+    distances = [UNREACHABLE] * len(neighbours)
+    distances[source] = 0
+    queue = deque([source])
+    while queue:
+        i = queue.popleft()
+        for j in neighbours[i]:
+            if distances[j] == UNREACHABLE:
+                distances[j] = distances[i] + 1
+                queue.append(j)
+    return distances
+
+
+def _components(neighbours: List[List[int]]) -> List[int]:
+    """Connected component id of every cell."""
+    components = [-1] * len(neighbours)
+    for source in range(len(neighbours)):
+        if components[source] != -1:
+            continue
+        components[source] = source
+        stack = [source]
+        while stack:
+            i = stack.pop()
+            for j in neighbours[i]:
+                if components[j] == -1:
+                    components[j] = source
+                    stack.append(j)
+    return components
+
+
+def _articulation_points(neighbours: List[List[int]]) -> List[int]:
+    """Cells whose removal disconnects their component (iterative Tarjan)."""
+    n = len(neighbours)
+    discovery, low, parent = [-1] * n, [0] * n, [-1] * n
+    points = set()
+    time = 0
+    for root in range(n):
+        if discovery[root] != -1:
+            continue
+        discovery[root] = low[root] = time
+        time += 1
+        root_children = 0
+        stack = [(root, iter(neighbours[root]))]
+        while stack:
+            i, children = stack[-1]
+            j = next(children, None)
+            if j is None:
+                stack.pop()
+                if parent[i] != -1:
+                    p = parent[i]
+                    low[p] = min(low[p], low[i])
+                    if parent[p] != -1 and low[i] >= discovery[p]:
+                        points.add(p)
+            elif discovery[j] == -1:
+                parent[j] = i
+                discovery[j] = low[j] = time
+                time += 1
+                if i == root:
+                    root_children += 1
+                stack.append((j, iter(neighbours[j])))
+            elif j != parent[i]:
+                low[i] = min(low[i], discovery[j])
+        if root_children > 1:
+            points.add(root)
+    return sorted(points)
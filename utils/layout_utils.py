@@ -2,10 +2,10 @@
 
 import random
 import numpy as np
-from env.overcooked_wrapper import OvercookedGym
 import json
 
 from overcooked_ai_py.utils import read_layout_dict, write_layout_dict
+from utils.layout_embedding import layout_embedding
 
 
 train_layout_path = "utils/TRAIN_LAYOUTS.txt"
@@ -35,11 +35,12 @@ def swap_1_and_2(grid_str: str) -> str:
     rows = [list(r) for r in rows]  
 
 def featurize_layout(layout_name: str) -> np.ndarray:
-    """Encode a layout into a handcrafted feature vector for 'novelty'."""
-    vec_env = OvercookedGym(layout_name, horizon=400)
-    obs_p0, obs_p1 = vec_env.env.featurize_state_mdp(vec_env.env.state)
-    vec = np.concatenate([obs_p0.flatten(), obs_p1.flatten()])
-    return vec
+    """Encode a layout into a handcrafted feature vector for 'novelty'.
+
+    Structural features of the grid (see utils.layout_embedding), cached on
+    disk per layout hash, so no env or planners are built.
+    """
+    return layout_embedding(layout_name)
 
 def swap_1_and_2(grid_str: str) -> str:
     rows = grid_str.split("\n")
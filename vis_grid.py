@@ -1,15 +1,26 @@
-
 import os
-from overcooked_ai_py.mdp.overcooked_mdp import OvercookedGridworld
-from overcooked_ai_py.mdp.overcooked_env import OvercookedEnv
-
-from overcooked_ai_py.visualization.state_visualizer import StateVisualizer
-layouts_list = sorted(os.listdir("/media/yujin/AI611/overcooked_ai/src/overcooked_ai_py/data/layouts"))
-for layout in layouts_list:
-    layout_name = layout.split(".")[0]
-    mdp = OvercookedGridworld.from_layout_name(
-        layout_name,
-        # old_dynamics=True,
+
+from overcooked_ai_py.static import LAYOUTS_DIR, LAYOUTS_M_DIR
+from overcooked_ai_py.visualization.layout_thumbnails import (
+    layout_paths_in_dirs,
+    render_layout_thumbnails,
+)
+
+
+def main():
+    # Renders a png of every base and mutated layout to layout_vis/, layouts
+    # whose png is newer than the .layout file are skipped
+    save_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "layout_vis"
     )
-    save_path = "/media/yujin/AI611/overcooked_zsc_project/layout_vis/" + layout_name + ".png"
-    StateVisualizer().render_env(mdp.terrain_mtx, save_path)
+    layout_paths = layout_paths_in_dirs([LAYOUTS_DIR, LAYOUTS_M_DIR])
+    rendered = render_layout_thumbnails(layout_paths, save_dir)
+    print(
+        f"rendered {len(rendered)} of {len(layout_paths)} layouts to {save_dir}"
+    )
+
+
+# Spawned rendering processes re-import this script, which must then not
+# render again
+if __name__ == "__main__":
+    main()